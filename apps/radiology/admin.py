@@ -1,10 +1,34 @@
 from django.contrib import admin
-from .models import Scan
+from .models import Scan, InferenceJob, AIBackfill, ScanPrediction
 
 @admin.register(Scan)
 class ScanAdmin(admin.ModelAdmin):
-    list_display = ('id', 'patient', 'scan_type', 'created_at')
+    list_display = ('id', 'patient', 'scan_type', 'ai_status', 'created_at')
     list_filter = ('scan_type', 'created_at')
     search_fields = ('patient__email', 'scan_type')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+
+
+@admin.register(InferenceJob)
+class InferenceJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'scan', 'model_name', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'model_name')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+
+@admin.register(AIBackfill)
+class AIBackfillAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model_name', 'status', 'processed', 'total', 'failed', 'created_at', 'finished_at')
+    list_filter = ('status', 'model_name')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'started_at', 'updated_at', 'finished_at', 'last_scan_id')
+
+
+@admin.register(ScanPrediction)
+class ScanPredictionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'scan', 'model_name', 'model_version', 'predicted_class', 'confidence', 'scored_at')
+    list_filter = ('model_name', 'predicted_class')
+    ordering = ('-scored_at',)
+    raw_id_fields = ('scan',)
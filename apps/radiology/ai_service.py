@@ -1,12 +1,212 @@
+import asyncio
+import logging
 import os
+import queue
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from contextlib import ExitStack
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from backend import metrics
+from . import prediction_cache, preprocessing
+
+logger = logging.getLogger(__name__)
 
 # Configuration matches the training script
 CONFIG = {
-    'default_model': 'resnet50' 
+    'default_model': 'resnet50',
+    # Input resolution and color mode per model, used by preprocessing.py
+    'model_inputs': {
+        'resnet50': {'size': 224, 'mode': 'RGB'},
+    },
 }
 
+# Responses from a proxy or an overloaded service that never ran the model; a 500 or
+# a read timeout may have, and predictions aren't idempotent, so those aren't resent
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+class CallTimer:
+    """
+    Seconds one AI service call spent connecting, uploading the images and
+    waiting for the response headers. requests calls are timed by the connection
+    classes below (through the thread's current timer), httpx calls by its trace hook.
+    """
+    # httpcore trace steps -> phase
+    HTTPX_PHASES = {
+        'connect_tcp': 'connect', 'start_tls': 'connect',
+        'send_request_headers': 'upload', 'send_request_body': 'upload',
+        'receive_response_headers': 'response',
+    }
+
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'upload': 0.0, 'response': 0.0}
+        self._started = {}
+
+    async def trace(self, event_name, info):
+        step, _, event = event_name.rpartition('.')
+        phase = self.HTTPX_PHASES.get(step.rpartition('.')[2])
+        if phase is None:
+            return
+        if event == 'started':
+            self._started[step] = time.perf_counter()
+        elif step in self._started:
+            self.phases[phase] += time.perf_counter() - self._started.pop(step)
+
+
+_current = threading.local()
+
+
+def _timed(connection_cls):
+    """urllib3 connection class reporting to the thread's CallTimer"""
+
+    class TimedConnection(connection_cls):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                timer = getattr(_current, 'timer', None)
+                if timer is not None:
+                    timer.phases['connect'] += time.perf_counter() - started
+
+        def request(self, *args, **kwargs):
+            # Plain HTTP connects lazily in here; that part is already counted as connect
+            timer = getattr(_current, 'timer', None)
+            connecting = timer.phases['connect'] if timer is not None else 0.0
+            started = time.perf_counter()
+            try:
+                return super().request(*args, **kwargs)
+            finally:
+                if timer is not None:
+                    connected = timer.phases['connect'] - connecting
+                    timer.phases['upload'] += time.perf_counter() - started - connected
+
+        def getresponse(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return super().getresponse(*args, **kwargs)
+            finally:
+                timer = getattr(_current, 'timer', None)
+                if timer is not None:
+                    timer.phases['response'] += time.perf_counter() - started
+
+    return TimedConnection
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _timed(HTTPConnection)
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _timed(HTTPSConnection)
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+def error_kind(error):
+    """('timeout', stage) or ('connection', None) for a requests/httpx transport error"""
+    if isinstance(error, (requests.exceptions.ConnectTimeout, httpx.ConnectTimeout)):
+        return 'timeout', 'connect'
+    if isinstance(error, httpx.WriteTimeout):
+        return 'timeout', 'upload'
+    if isinstance(error, httpx.PoolTimeout):
+        return 'timeout', 'pool'
+    if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return 'timeout', 'response'
+    return 'connection', None
+
+
+def never_sent(error):
+    """
+    True if a requests ConnectionError happened before the connection was made
+    (refused, DNS, connect timeout). A reset after that may come after the
+    service got the images.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Stops calling the AI service after repeated failures.
+
+    closed    -> requests flow, consecutive failures are counted
+    open      -> requests fail fast until `reset_timeout` has passed
+    half-open -> a single probe request is let through to test recovery
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _probe_due(self):
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def is_open(self):
+        """True while calls are being rejected without trying the service"""
+        with self._lock:
+            return self._state != self.CLOSED and not self._probe_due()
+
+    def retry_after(self):
+        """Seconds until the breaker lets a probe through"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._probe_due():
+                # Let exactly one probe through; if it never reports back,
+                # another one is allowed after `reset_timeout`
+                self._state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
 class AIService:
     _instance = None
     
@@ -16,45 +216,472 @@ class AIService:
             cls._instance = AIService()
         return cls._instance
 
-    def predict(self, image_path, model_name=None):
+    def __init__(self):
+        self.connect_timeout = getattr(settings, 'AI_SERVICE_CONNECT_TIMEOUT', 3.05)
+        self.read_timeout = getattr(settings, 'AI_SERVICE_READ_TIMEOUT', 30)
+        self.max_retries = getattr(settings, 'AI_SERVICE_MAX_RETRIES', 2)
+        self.backoff = getattr(settings, 'AI_SERVICE_RETRY_BACKOFF', 0.5)
+        self.circuit = CircuitBreaker(
+            failure_threshold=getattr(settings, 'AI_CIRCUIT_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'AI_CIRCUIT_RESET_TIMEOUT', 30),
+        )
+        self.batch_max_size = getattr(settings, 'AI_BATCH_MAX_SIZE', 16)
+        self.batch_max_bytes = getattr(settings, 'AI_BATCH_MAX_BYTES', 32 * 1024 * 1024)
+        self._batch_supported = True
+        self._batcher = None
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self):
+        """Keep-alive session shared by all threads, so TCP/TLS handshakes are reused"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    pool_size = getattr(settings, 'AI_SERVICE_POOL_SIZE', 10)
+                    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def async_client(self):
         """
-        Runs prediction on the given image path by calling the external AI Service.
-        Returns a dictionary with results.
+        httpx.AsyncClient shared by everything running on the current event loop.
+        A client is bound to the loop that created it, so each loop gets its own.
         """
-        if model_name is None:
-            model_name = CONFIG['default_model']
-            
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            limit = getattr(settings, 'AI_ASYNC_MAX_CONNECTIONS', 200)
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def is_available(self):
+        """False while the circuit breaker is rejecting calls"""
+        return not self.circuit.is_open()
+
+    def retry_after(self):
+        return self.circuit.retry_after()
+
+    def get_url(self, endpoint='predict'):
         service_url = getattr(settings, 'AI_SERVICE_URL', None)
         if not service_url:
-            print("AI_SERVICE_URL is not configured.")
             return None
 
         # Ensure the URL ends with /predict
-        if not service_url.endswith('/predict'):
-             # Handle cases where user provides base URL without trailing slash
-             if not service_url.endswith('/'):
-                 service_url += '/'
-             service_url += 'predict'
+        if service_url.endswith('/predict'):
+            service_url = service_url[:-len('predict')]
+        # Handle cases where user provides base URL without trailing slash
+        if not service_url.endswith('/'):
+            service_url += '/'
+        return service_url + endpoint
 
-        try:
-            with open(image_path, 'rb') as f:
-                files = {'file': f}
-                params = {'model_name': model_name}
-                
-                response = requests.post(service_url, files=files, params=params, timeout=30)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"AI Service Error: {response.status_code} - {response.text}")
-                    return None
-                    
-        except requests.exceptions.RequestException as e:
-            print(f"Connection error to AI Service: {e}")
+    @property
+    def batcher(self):
+        """MicroBatcher shared by all threads, or None when AI_MICROBATCH_WINDOW_MS is 0"""
+        window_ms = getattr(settings, 'AI_MICROBATCH_WINDOW_MS', 0)
+        if not window_ms:
+            return None
+        if self._batcher is None:
+            with self._session_lock:
+                if self._batcher is None:
+                    self._batcher = MicroBatcher(self, window=window_ms / 1000.0, max_size=self.batch_max_size)
+        return self._batcher
+
+    def predict(self, image_path, model_name=None, image_hash=None, use_cache=True):
+        """
+        Runs prediction on the given image path by calling the external AI Service.
+        Returns a dictionary with results, or None if the service failed or is unavailable.
+
+        Results are cached by image content and model_name. Pass `image_hash` (the
+        Scan's stored SHA-256) so a cache lookup does not need to read the file.
+        """
+        if model_name is None:
+            model_name = CONFIG['default_model']
+
+        if image_hash is None:
+            try:
+                image_hash = prediction_cache.hash_image(image_path)
+            except OSError as e:
+                logger.warning("Could not read image for AI Service: %s", e)
+                return None
+        if use_cache:
+            cached = prediction_cache.lookup(image_hash, model_name)
+            if cached is not None:
+                return cached
+
+        batcher = self.batcher
+        if batcher is not None:
+            # Concurrent callers are coalesced into one batch request
+            result = batcher.submit(image_path, model_name).result()
+        else:
+            result = self._call_service(image_path, model_name)
+        if result is not None:
+            prediction_cache.store(image_hash, model_name, result)
+        return result
+
+    async def apredict(self, image_path, model_name=None, image_hash=None, use_cache=True):
+        """
+        predict() for async views. The upload goes through the shared AsyncClient,
+        so a call waiting on the service doesn't hold a thread; cache lookups,
+        hashing and preprocessing run in worker threads.
+        """
+        if model_name is None:
+            model_name = CONFIG['default_model']
+
+        if image_hash is None:
+            try:
+                image_hash = await sync_to_async(prediction_cache.hash_image, thread_sensitive=False)(image_path)
+            except OSError as e:
+                logger.warning("Could not read image for AI Service: %s", e)
+                return None
+        if use_cache:
+            cached = await sync_to_async(prediction_cache.lookup)(image_hash, model_name)
+            if cached is not None:
+                return cached
+
+        payload = await sync_to_async(self._read_payload, thread_sensitive=False)(image_path, model_name)
+        if payload is None:
             return None
+        status_code, result = await self._apost('predict', [payload], 'file', model_name)
+        if result is not None:
+            await sync_to_async(prediction_cache.store)(image_hash, model_name, result)
+        return result
+
+    def predict_batch(self, items, model_name=None, use_cache=True):
+        """
+        Runs prediction for many images at once.
+
+        `items` is an iterable of (key, image_path, image_hash) tuples; image_hash may be None.
+        Returns {key: result dict or None}. Cache misses are sent to the service's
+        /predict_batch endpoint in chunks bounded by AI_BATCH_MAX_SIZE files and
+        AI_BATCH_MAX_BYTES bytes; identical images are only sent once.
+        """
+        if model_name is None:
+            model_name = CONFIG['default_model']
+
+        results = {}
+        entries = []
+        for key, image_path, image_hash in items:
+            if image_hash is None:
+                try:
+                    image_hash = prediction_cache.hash_image(image_path)
+                except OSError as e:
+                    logger.warning("Could not read image for AI Service: %s", e)
+                    results[key] = None
+                    continue
+            entries.append((key, image_path, image_hash))
+
+        cached = prediction_cache.lookup_many([h for _, _, h in entries], model_name) if use_cache else {}
+
+        # One upload per distinct image content
+        to_send = {}
+        for key, image_path, image_hash in entries:
+            if image_hash in cached:
+                results[key] = cached[image_hash]
+            else:
+                to_send.setdefault(image_hash, image_path)
+
+        hashes = list(to_send)
+        fresh = dict(zip(hashes, self.send_batches([to_send[h] for h in hashes], model_name)))
+        for image_hash, result in fresh.items():
+            if result is not None:
+                prediction_cache.store(image_hash, model_name, result)
+
+        for key, image_path, image_hash in entries:
+            if key not in results:
+                results[key] = fresh.get(image_hash)
+        return results
+
+    def prepare_image(self, image_path, model_name):
+        """Path of the payload to upload: the preprocessed image when AI_PREPROCESS_ENABLED, else the original"""
+        if not getattr(settings, 'AI_PREPROCESS_ENABLED', False) or preprocessing.is_preprocessed(image_path):
+            return image_path
+        try:
+            return preprocessing.prepare(image_path, model_name)
         except Exception as e:
-            print(f"Unexpected error in AI Service: {e}")
+            # Formats Pillow can't decode (e.g. DICOM) go out unchanged
+            logger.warning("Preprocessing failed for %s, sending original: %s", image_path, e)
+            return image_path
+
+    def send_batches(self, image_paths, model_name):
+        """Uncached batch call; returns results aligned with `image_paths` (None for failures)"""
+        image_paths = [self.prepare_image(path, model_name) for path in image_paths]
+        results = []
+        for chunk in self._chunk(image_paths):
+            if len(chunk) == 1 or not self._batch_supported:
+                results.extend(self._call_service(path, model_name) for path in chunk)
+                continue
+
+            status_code, data = self._post('predict_batch', chunk, 'files', model_name)
+            if status_code in (404, 405):
+                # Older AI service without a batch endpoint
+                logger.warning("AI Service has no /predict_batch endpoint, falling back to single predictions")
+                self._batch_supported = False
+                results.extend(self._call_service(path, model_name) for path in chunk)
+            elif data is None:
+                results.extend([None] * len(chunk))
+            else:
+                batch = data.get('results', []) if isinstance(data, dict) else data
+                batch = list(batch)[:len(chunk)] + [None] * max(0, len(chunk) - len(batch))
+                results.extend(r if isinstance(r, dict) and 'predicted_class' in r else None for r in batch)
+        return results
+
+    def _chunk(self, image_paths):
+        """Split into chunks bounded by file count and total bytes"""
+        chunk, chunk_bytes = [], 0
+        for path in image_paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if chunk and (len(chunk) >= self.batch_max_size or chunk_bytes + size > self.batch_max_bytes):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(path)
+            chunk_bytes += size
+        if chunk:
+            yield chunk
+
+    def cache_stats(self):
+        return prediction_cache.stats()
+
+    def _call_service(self, image_path, model_name):
+        image_path = self.prepare_image(image_path, model_name)
+        status_code, data = self._post('predict', [image_path], 'file', model_name)
+        return data
+
+    def _post(self, endpoint, image_paths, field, model_name):
+        """
+        POSTs the images as multipart `field` parts, with retries and the circuit breaker.
+        Returns (status_code, json). status_code is None when no response was received
+        and json is None for anything but a 200.
+        """
+        service_url = self.get_url(endpoint)
+        if not service_url:
+            logger.error("AI_SERVICE_URL is not configured.")
+            return None, None
+
+        if not self.circuit.allow_request():
+            logger.warning("AI Service circuit is open, skipping call (retry in %.0fs)", self.retry_after())
+            metrics.count_ai_error(model_name, endpoint, 'circuit_open')
+            return None, None
+
+        status_code = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                retryable = False
+                try:
+                    with ExitStack() as stack:
+                        files = [(field, stack.enter_context(open(path, 'rb'))) for path in image_paths]
+                        params = {'model_name': model_name}
+
+                        timer = _current.timer = CallTimer()
+                        started = time.perf_counter()
+                        try:
+                            response = self.session.post(
+                                service_url, files=files, params=params,
+                                timeout=(self.connect_timeout, self.read_timeout),
+                            )
+                        finally:
+                            _current.timer = None
+                    elapsed = time.perf_counter() - started
+                    status_code = response.status_code
+                    metrics.observe_ai_call(model_name, endpoint, status_code, timer.phases, elapsed)
+                    preprocessing.record_call(
+                        any(preprocessing.is_preprocessed(path) for path in image_paths), elapsed,
+                    )
+
+                    if response.status_code == 200:
+                        self.circuit.record_success()
+                        return status_code, response.json()
+
+                    logger.warning("AI Service Error: %s - %s", response.status_code, response.text)
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        if response.status_code == 429 or response.status_code >= 500:
+                            # Overloaded or broken, and not worth resending
+                            self.circuit.record_failure()
+                        else:
+                            # The service is up, the request itself was rejected
+                            self.circuit.record_success()
+                        return status_code, None
+                    retryable = True
+
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    metrics.count_ai_error(model_name, endpoint, *error_kind(e))
+                    if isinstance(e, requests.exceptions.ConnectionError) and never_sent(e):
+                        logger.warning("Connection error to AI Service: %s", e)
+                        retryable = True
+                    else:
+                        # A read timeout or a dropped connection: the service may have the
+                        # images and still be scoring them
+                        logger.warning("AI Service call failed: %s", e)
+                        self.circuit.record_failure()
+                        return status_code, None
+
+                if retryable and attempt < self.max_retries:
+                    # Exponential backoff with full jitter
+                    time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+            self.circuit.record_failure()
+            return status_code, None
+
+        except requests.exceptions.RequestException as e:
+            logger.error("Request error to AI Service: %s", e)
+            metrics.count_ai_error(model_name, endpoint, 'connection')
+            self.circuit.record_failure()
+            return status_code, None
+        except Exception:
+            logger.exception("Unexpected error in AI Service")
+            metrics.count_ai_error(model_name, endpoint, 'unexpected')
+            return status_code, None
+
+
+    def _read_payload(self, image_path, model_name):
+        """(path, bytes) of what prepare_image() picks for upload, or None if it can't be read"""
+        path = self.prepare_image(image_path, model_name)
+        try:
+            with open(path, 'rb') as f:
+                return path, f.read()
+        except OSError as e:
+            logger.warning("Could not read image for AI Service: %s", e)
             return None
 
+    async def _apost(self, endpoint, payloads, field, model_name):
+        """_post() over the async client; `payloads` are (path, bytes) pairs"""
+        service_url = self.get_url(endpoint)
+        if not service_url:
+            logger.error("AI_SERVICE_URL is not configured.")
+            return None, None
+
+        if not self.circuit.allow_request():
+            logger.warning("AI Service circuit is open, skipping call (retry in %.0fs)", self.retry_after())
+            metrics.count_ai_error(model_name, endpoint, 'circuit_open')
+            return None, None
+
+        files = [(field, (os.path.basename(path), data)) for path, data in payloads]
+        preprocessed = any(preprocessing.is_preprocessed(path) for path, _ in payloads)
+        status_code = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    timer = CallTimer()
+                    started = time.perf_counter()
+                    response = await self.async_client().post(
+                        service_url, files=files, params={'model_name': model_name},
+                        extensions={'trace': timer.trace},
+                    )
+                    elapsed = time.perf_counter() - started
+                    status_code = response.status_code
+                    metrics.observe_ai_call(model_name, endpoint, status_code, timer.phases, elapsed)
+                    preprocessing.record_call(preprocessed, elapsed)
+
+                    if response.status_code == 200:
+                        self.circuit.record_success()
+                        return status_code, response.json()
+
+                    logger.warning("AI Service Error: %s - %s", response.status_code, response.text)
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        if response.status_code == 429 or response.status_code >= 500:
+                            self.circuit.record_failure()
+                        else:
+                            self.circuit.record_success()
+                        return status_code, None
+
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    logger.warning("Connection error to AI Service: %s", e)
+                    metrics.count_ai_error(model_name, endpoint, *error_kind(e))
+                except httpx.TransportError as e:
+                    # Sent (or partly sent) already: not retried, as in _post()
+                    logger.warning("AI Service call failed: %s", e)
+                    metrics.count_ai_error(model_name, endpoint, *error_kind(e))
+                    self.circuit.record_failure()
+                    return status_code, None
+
+                if attempt < self.max_retries:
+                    await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+            self.circuit.record_failure()
+            return status_code, None
+
+        except httpx.HTTPError as e:
+            logger.error("Request error to AI Service: %s", e)
+            metrics.count_ai_error(model_name, endpoint, 'connection')
+            self.circuit.record_failure()
+            return status_code, None
+        except Exception:
+            logger.exception("Unexpected error in AI Service")
+            metrics.count_ai_error(model_name, endpoint, 'unexpected')
+            return status_code, None
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single predictions into /predict_batch calls.
+
+    The first queued request opens a window of `window` seconds; everything that
+    arrives before it closes (up to `max_size` items) is sent in one request.
+    """
+
+    def __init__(self, service, window=0.02, max_size=16):
+        self.service = service
+        self.window = window
+        self.max_size = max_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, image_path, model_name):
+        """Queue an uncached prediction and return a Future for its result"""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((image_path, model_name, future))
+        return future
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='ai-microbatcher', daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            by_model = {}
+            for image_path, model_name, future in batch:
+                by_model.setdefault(model_name, []).append((image_path, future))
+
+            for model_name, entries in by_model.items():
+                try:
+                    results = self.service.send_batches([path for path, _ in entries], model_name)
+                except Exception as e:
+                    for _, future in entries:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(entries, results):
+                    future.set_result(result)
+
+
 # Global instance for easy access
 ai_service = AIService.get_instance()
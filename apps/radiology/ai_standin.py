@@ -0,0 +1,127 @@
+"""
+Local stand-in for the external AI service, for tests and benchmarks.
+
+It implements the same contract as the real service (POST /predict with a `file`
+part, POST /predict_batch with `files` parts, `model_name` query param) and
+returns a deterministic prediction derived from the image bytes.
+
+    python -m apps.radiology.ai_standin --port 8001 --latency-ms 150 --per-item-ms 10 --workers 1
+
+then point AI_SERVICE_URL at http://127.0.0.1:8001. `--error-rate` makes that
+share of requests fail with a 503 and `--payload-kb` pads every response, to
+load-test the retry path and large responses (see `manage.py bench_load`).
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+def fake_prediction(data, model_name):
+    """Deterministic result for the given image bytes"""
+    digest = hashlib.sha256(data + model_name.encode()).digest()
+    malignant = round(int.from_bytes(digest[:2], 'big') / 65535 * 100, 2)
+    benign = round(100 - malignant, 2)
+    predicted_class = 'Malignant' if malignant >= 50 else 'Benign'
+    return {
+        'predicted_class': predicted_class,
+        'confidence': max(malignant, benign),
+        'benign_probability': benign,
+        'malignant_probability': malignant,
+        'model_name': model_name,
+    }
+
+
+def create_app(latency_ms=0, per_item_ms=0, workers=1, error_rate=0.0, payload_kb=0, seed=None):
+    """
+    `latency_ms` is paid once per request (model invocation overhead), `per_item_ms`
+    once per image, and at most `workers` requests are processed at a time, which
+    is roughly how a GPU-backed service behaves. A random `error_rate` share of the
+    requests then fails with a 503 (reproducible with `seed`), and `payload_kb` KB
+    of padding is added to every successful response.
+    """
+    app = Flask(__name__)
+    app.config['stats'] = {'requests': 0, 'images': 0, 'errors': 0}
+    stats_lock = threading.Lock()
+    capacity = threading.BoundedSemaphore(max(1, workers))
+    rng = random.Random(seed)
+    padding = 'x' * int(payload_kb * 1024)
+
+    def simulate(count):
+        """Pay the latency; returns an error response for the requests picked to fail"""
+        with stats_lock:
+            app.config['stats']['requests'] += 1
+            app.config['stats']['images'] += count
+            failed = rng.random() < error_rate
+            app.config['stats']['errors'] += failed
+        delay = latency_ms + per_item_ms * count
+        if delay:
+            with capacity:
+                time.sleep(delay / 1000.0)
+        if failed:
+            return jsonify({'error': 'simulated failure'}), 503
+        return None
+
+    def respond(data):
+        if padding:
+            data['padding'] = padding
+        return jsonify(data)
+
+    @app.post('/predict')
+    def predict():
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'file is required'}), 400
+        model_name = request.args.get('model_name', 'resnet50')
+        data = upload.read()
+        return simulate(1) or respond(fake_prediction(data, model_name))
+
+    @app.post('/predict_batch')
+    def predict_batch():
+        uploads = request.files.getlist('files')
+        if not uploads:
+            return jsonify({'error': 'files are required'}), 400
+        model_name = request.args.get('model_name', 'resnet50')
+        results = [fake_prediction(upload.read(), model_name) for upload in uploads]
+        return simulate(len(results)) or respond({'results': results})
+
+    @app.get('/health')
+    def health():
+        return jsonify({'status': 'ok', **app.config['stats']})
+
+    return app
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve_in_thread(host='127.0.0.1', port=0, **app_kwargs):
+    """Start the stand-in on a background thread; returns the server (call .shutdown() when done)"""
+    app = create_app(**app_kwargs)
+    server = make_server(host, port, app, threaded=True, request_handler=QuietRequestHandler)
+    server.app = app
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://{host}:{server.server_port}"
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--per-item-ms', type=float, default=0)
+    parser.add_argument('--workers', type=int, default=1, help="Requests processed concurrently")
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of requests answered with a 503 (0-1)")
+    parser.add_argument('--payload-kb', type=float, default=0, help="Padding added to every response")
+    parser.add_argument('--seed', type=int, help="Seed for the failing requests")
+    args = parser.parse_args()
+    create_app(
+        latency_ms=args.latency_ms, per_item_ms=args.per_item_ms, workers=args.workers,
+        error_rate=args.error_rate, payload_kb=args.payload_kb, seed=args.seed,
+    ).run(host=args.host, port=args.port, threaded=True)
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class RadiologyConfig(AppConfig):
-    name = "apps.radiology"
\ No newline at end of file
+    name = "apps.radiology"
+
+    def ready(self):
+        import apps.radiology.signals
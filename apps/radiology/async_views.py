@@ -0,0 +1,117 @@
+"""
+ASGI variants of scan upload and rerun_ai that wait for the AI prediction inside
+the request instead of leaving it to the inference worker.
+
+The service call is AIService.apredict over one shared httpx.AsyncClient, so a
+single ASGI process can keep hundreds of predictions in flight without a thread
+each. Authentication, role permissions, validation and serialization are
+ScanViewSet's own and run in short sync_to_async blocks around the awaited call.
+
+The request still creates the InferenceJob and claims it, so if the service is
+down or gives no result the job goes back on the queue and the answer is a 202,
+just like the synchronous endpoints; a worker finishes it later.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.response import Response
+from .ai_service import ai_service
+from .models import InferenceJob
+from .views import ScanViewSet
+
+
+class AsyncScanView(View):
+    """POST only; `action` is 'create' (scans/async/) or 'rerun_ai' (scans/<pk>/rerun_ai/async/)"""
+    action = None
+    http_method_names = ['post', 'options']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # ATOMIC_REQUESTS can't wrap a coroutine; the DB work below is in short transactions.
+        # CSRF is checked by DRF's SessionAuthentication, as for any APIView.
+        return csrf_exempt(transaction.non_atomic_requests(view))
+
+    async def post(self, request, *args, **kwargs):
+        viewset, scan, job, response = await sync_to_async(self.start)(request, *args, **kwargs)
+        if response is not None:
+            return response
+
+        result = None
+        if job.status == InferenceJob.RUNNING:
+            result = await ai_service.apredict(
+                scan.image.path, model_name=job.model_name, image_hash=scan.image_sha256, use_cache=job.use_cache
+            )
+        return await sync_to_async(self.complete)(viewset, scan, job, result)
+
+    def start(self, request, *args, **kwargs):
+        """
+        Same entry as APIView.dispatch: authenticate, check permissions, then save
+        the scan or queue the rerun and claim its job. Returns
+        (viewset, scan, job, response), with a response when there is nothing to await.
+        """
+        viewset = ScanViewSet(action_map={'post': self.action}, format_kwarg=None)
+        viewset.args, viewset.kwargs = args, kwargs
+        viewset.request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = viewset.default_response_headers
+        try:
+            viewset.initial(viewset.request)
+            if self.action == 'create':
+                scan, job, response = self.start_create(viewset)
+            else:
+                scan, job, response = self.start_rerun(viewset)
+        except Exception as exc:
+            return viewset, None, None, self.finalize(viewset, viewset.handle_exception(exc))
+        if response is not None:
+            return viewset, scan, job, self.finalize(viewset, response)
+        return viewset, scan, job, None
+
+    def start_create(self, viewset):
+        with transaction.atomic():
+            serializer = viewset.get_serializer(data=viewset.request.data)
+            serializer.is_valid(raise_exception=True)
+            viewset.perform_create(serializer)
+            scan = serializer.instance
+            job = scan.inference_jobs.order_by('-id').first()
+            if job is None:
+                # Answered from the prediction cache
+                return scan, None, Response(viewset._with_job(serializer.data, None), status=status.HTTP_201_CREATED)
+            # Claimed before commit, so no worker can see the job unclaimed
+            job.start()
+        return scan, job, None
+
+    def start_rerun(self, viewset):
+        scan = viewset.get_object()
+        if not scan.image:
+            return scan, None, Response({'error': 'No image associated with this scan'}, status=status.HTTP_400_BAD_REQUEST)
+
+        force = str(viewset.request.data.get('force', '')).lower() in ('1', 'true', 'yes')
+        if not force and scan.apply_cached_ai_result():
+            return scan, None, Response(viewset._with_job(viewset.get_serializer(scan).data, None))
+
+        with transaction.atomic():
+            job = scan.queue_ai_prediction(use_cache=not force)
+            job.start()
+        return scan, job, None
+
+    def complete(self, viewset, scan, job, result):
+        if job.status == InferenceJob.RUNNING:
+            job.scan = scan
+            job.finish(result)
+
+        # Re-read with the viewset's queryset so the payload has the new report and status
+        scan = viewset.get_queryset().get(pk=scan.pk)
+        data = viewset._with_job(viewset.get_serializer(scan).data, job)
+        if job.status != InferenceJob.DONE:
+            response_status = status.HTTP_202_ACCEPTED
+        elif self.action == 'create':
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_200_OK
+        return self.finalize(viewset, Response(data, status=response_status))
+
+    def finalize(self, viewset, response):
+        response = viewset.finalize_response(viewset.request, response)
+        return response.render()
@@ -0,0 +1,137 @@
+"""
+Fleet-wide re-inference of existing scans against a target model (AIBackfill rows).
+
+Matching scans are taken in id order, `batch_size` at a time. A batch is split
+over `concurrency` threads calling AIService.predict_batch, paced to `max_rate`
+scans per second, and written back with Scan.bulk_apply_ai_results: recorded as
+ScanPredictions and, unless `activate` is off, made the scans' active prediction
+(one bulk_update; final reports are never touched). The write-back, the counters and
+`last_scan_id` commit together after every batch: that row is both the progress
+the API shows and the checkpoint an interrupted run continues from.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .ai_service import ai_service
+from .models import AIBackfill, Scan
+
+# A RUNNING backfill without a heartbeat for this long was interrupted and may be resumed
+STALE_AFTER = timedelta(minutes=5)
+
+
+def resumable():
+    """Backfills waiting to run: pending ones and running ones whose process died"""
+    stale = timezone.now() - STALE_AFTER
+    return AIBackfill.objects.filter(
+        Q(status=AIBackfill.PENDING) | Q(status=AIBackfill.RUNNING, updated_at__lt=stale)
+    ).order_by('id')
+
+
+def claim(backfill):
+    """Mark the backfill RUNNING for this process; False if another process holds it"""
+    now = timezone.now()
+    claimed = resumable().filter(pk=backfill.pk).update(status=AIBackfill.RUNNING, updated_at=now)
+    if not claimed:
+        return False
+    AIBackfill.objects.filter(pk=backfill.pk, started_at__isnull=True).update(started_at=now)
+    backfill.refresh_from_db()
+    if not backfill.total:
+        backfill.total = backfill.scans().count()
+        AIBackfill.objects.filter(pk=backfill.pk).update(total=backfill.total)
+    return True
+
+
+def run(backfill, log=print):
+    """Process the backfill to the end (or until it is cancelled); False if it couldn't be claimed"""
+    if not claim(backfill):
+        return False
+
+    started, sent = time.monotonic(), 0
+    while True:
+        backfill.refresh_from_db(fields=['status'])
+        if backfill.status != AIBackfill.RUNNING:
+            log(f"Backfill {backfill.pk} {backfill.status.lower()}, stopping")
+            return True
+
+        batch = list(
+            backfill.scans().filter(pk__gt=backfill.last_scan_id).order_by('pk')
+            .only('id', 'image', 'image_sha256', 'created_at', 'scan_type', 'ai_predicted_class')[:backfill.batch_size]
+        )
+        if not batch:
+            now = timezone.now()
+            AIBackfill.objects.filter(pk=backfill.pk).update(status=AIBackfill.DONE, finished_at=now, updated_at=now)
+            backfill.refresh_from_db()
+            log(f"Backfill {backfill.pk} done: {backfill.succeeded} re-scored, {backfill.failed} failed")
+            return True
+
+        if not ai_service.is_available():
+            # Wait for the circuit breaker instead of failing every scan
+            _heartbeat(backfill)
+            time.sleep(max(1.0, ai_service.retry_after()))
+            continue
+
+        if backfill.max_rate:
+            delay = started + sent / backfill.max_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        sent += len(batch)
+
+        results = _score(backfill, batch)
+        if not any(results.values()) and not ai_service.is_available():
+            # The service went down mid-batch: retry it rather than count the scans as failed
+            continue
+
+        pairs = [(scan, results[scan.pk]) for scan in batch if results.get(scan.pk)]
+        with transaction.atomic():
+            Scan.bulk_apply_ai_results(pairs, backfill.model_name, activate=backfill.activate)
+            AIBackfill.objects.filter(pk=backfill.pk).update(
+                processed=F('processed') + len(batch),
+                succeeded=F('succeeded') + len(pairs),
+                failed=F('failed') + len(batch) - len(pairs),
+                last_scan_id=batch[-1].pk,
+                updated_at=timezone.now(),
+            )
+        backfill.refresh_from_db()
+        log(progress_line(backfill))
+
+
+def progress_line(backfill):
+    line = f"Backfill {backfill.pk}: {backfill.processed}/{backfill.total} ({backfill.succeeded} ok, {backfill.failed} failed)"
+    rate, eta = backfill.rate, backfill.eta_seconds
+    if rate:
+        line += f", {rate:.1f} scans/s"
+    if eta is not None:
+        line += f", ETA {timedelta(seconds=round(eta))}"
+    return line
+
+
+def _score(backfill, batch):
+    """{scan id: result or None}, with the batch split over `concurrency` threads"""
+    items = []
+    for scan in batch:
+        try:
+            items.append((scan.pk, scan.image.path, scan.image_sha256 or None))
+        except (ValueError, NotImplementedError):
+            # No file or storage without local paths
+            continue
+
+    def predict(part):
+        try:
+            return ai_service.predict_batch(part, model_name=backfill.model_name, use_cache=not backfill.force)
+        finally:
+            connections.close_all()
+
+    workers = max(1, min(backfill.concurrency, len(items)))
+    parts = [items[i::workers] for i in range(workers)]
+    results = {}
+    with ThreadPoolExecutor(workers) as pool:
+        for part_results in pool.map(predict, parts):
+            results.update(part_results)
+    return results
+
+
+def _heartbeat(backfill):
+    AIBackfill.objects.filter(pk=backfill.pk).update(updated_at=timezone.now())
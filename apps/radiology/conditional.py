@@ -0,0 +1,94 @@
+"""
+ETag / Last-Modified validators for scan and report reads.
+
+Validators come from the row `version` (a nanosecond timestamp that changes with
+every write affecting the payload, see models.new_version) plus the requester's
+role and origin, i.e. the same inputs as the payload cache key. A conditional
+detail request is answered from a single-column query; lists hash the versions of
+the rows on the page, so a 304 skips serialization.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+from . import payload_cache
+
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+
+def last_modified(version):
+    return datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc)
+
+
+def object_etag(kind, pk, version, request):
+    digest = hashlib.sha1(f'{kind}:{pk}:{version}:{payload_cache.variant(request)}'.encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def collection_etag(kind, rows, request, extra=''):
+    digest = hashlib.sha1(f'{kind}:{request.get_full_path()}:{payload_cache.variant(request)}:{extra}'.encode())
+    for row in rows:
+        digest.update(f'|{row.pk}:{row.version}'.encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def not_modified(request, etag, modified=None):
+    """A 304 response if the request's validators match, else None"""
+    response = get_conditional_response(request, etag=etag, last_modified=modified and int(modified.timestamp()))
+    if response is not None:
+        set_validators(response, etag, modified)
+    return response
+
+
+def set_validators(response, etag, modified=None):
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified.timestamp())
+    # Payloads depend on who is asking, and clients must revalidate before reuse
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified on retrieve and a collection ETag on list, for viewsets
+    whose model has a `version` column. Set `validator_kind`.
+    """
+    validator_kind = None
+
+    def retrieve(self, request, *args, **kwargs):
+        if any(header in request.headers for header in CONDITIONAL_HEADERS):
+            # Answer from the version column alone; the full row is only loaded on a miss
+            pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+            rows = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: pk})
+            version = rows.values_list('version', flat=True).first()
+            if version is not None:
+                etag = object_etag(self.validator_kind, pk, version, request)
+                response = not_modified(request, etag, last_modified(version))
+                if response is not None:
+                    return response
+
+        instance = self.get_object()
+        response = Response(self.get_serializer(instance).data)
+        return set_validators(
+            response, object_etag(self.validator_kind, instance.pk, instance.version, request),
+            last_modified(instance.version),
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return super().list(request, *args, **kwargs)
+
+        # next/previous links change when rows appear past either end of the page
+        paginator = self.paginator
+        extra = f"{getattr(paginator, 'has_next', '')}:{getattr(paginator, 'has_previous', '')}"
+        etag = collection_etag(self.validator_kind, page, request, extra)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return set_validators(response, etag)
@@ -0,0 +1,166 @@
+"""
+Downsized variants of scan images for the list view and the viewer.
+
+- thumbnail: longest side DERIVATIVE_SIZES['thumbnail'], for list rows
+- preview:   longest side DERIVATIVE_SIZES['preview'], for the detail page
+- tiles:     Deep Zoom style pyramid of TILE_SIZE JPEG tiles for progressive zoom
+
+Files live under MEDIA_ROOT/derivatives/<scan id>/<image hash>/. Keying on the image
+hash means a replaced image never serves stale variants. They are built at ingest
+(SCAN_DERIVATIVES_AT_INGEST) or lazily on first request, and removed with the scan.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+from PIL import Image
+from django.conf import settings
+from .preprocessing import to_uint8
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_SIZES = {
+    'thumbnail': 256,
+    'preview': 1024,
+}
+TILE_SIZE = 256
+JPEG_QUALITY = 85
+
+VARIANTS = tuple(DERIVATIVE_SIZES)
+
+
+def scan_root(scan_id):
+    return os.path.join(settings.MEDIA_ROOT, 'derivatives', str(scan_id))
+
+
+def derivative_dir(scan):
+    return os.path.join(scan_root(scan.pk), (scan.image_sha256 or 'original')[:16])
+
+
+def variant_path(scan, variant):
+    return os.path.join(derivative_dir(scan), f"{variant}.jpg")
+
+
+def tiles_dir(scan):
+    return os.path.join(derivative_dir(scan), 'tiles')
+
+
+def _open_rgb(scan):
+    with Image.open(scan.image.path) as img:
+        img.draft('RGB', (DERIVATIVE_SIZES['preview'], DERIVATIVE_SIZES['preview']))
+        return Image.fromarray(to_uint8(img)).convert('RGB')
+
+
+def _save_atomic(img, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        img.save(f, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def generate(scan, variants=VARIANTS, image=None):
+    """Build the missing thumbnail/preview variants; decodes the original at most once"""
+    missing = [variant for variant in variants if not os.path.exists(variant_path(scan, variant))]
+    if not missing:
+        return
+    image = image or _open_rgb(scan)
+    # Largest first so each variant is resized from the previous one
+    for variant in sorted(missing, key=lambda v: -DERIVATIVE_SIZES[v]):
+        size = DERIVATIVE_SIZES[variant]
+        image = image.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        _save_atomic(image, variant_path(scan, variant))
+
+
+def generate_at_ingest(scan):
+    """on_commit hook for new uploads; failures only mean the variants get built lazily"""
+    try:
+        generate(scan)
+    except Exception as e:
+        logger.warning("Could not generate derivatives for scan %s: %s", scan.pk, e)
+
+
+def get_variant(scan, variant):
+    """Path of a thumbnail/preview, generating it on first request"""
+    path = variant_path(scan, variant)
+    if not os.path.exists(path):
+        generate(scan, variants=(variant,))
+    return path
+
+
+def tile_manifest(scan):
+    """Pyramid description for the viewer; builds the pyramid on first request"""
+    manifest_path = os.path.join(tiles_dir(scan), 'manifest.json')
+    if not os.path.exists(manifest_path):
+        generate_tiles(scan)
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def tile_path(scan, level, col, row):
+    path = os.path.join(tiles_dir(scan), str(level), f"{col}_{row}.jpg")
+    if not os.path.exists(path) and not os.path.exists(os.path.join(tiles_dir(scan), 'manifest.json')):
+        generate_tiles(scan)
+    return path
+
+
+def generate_tiles(scan):
+    """
+    Write every pyramid level into a temporary directory and move it into place,
+    so concurrent requests never see a half-built pyramid.
+    """
+    with Image.open(scan.image.path) as img:
+        image = Image.fromarray(to_uint8(img)).convert('RGB')
+
+    width, height = image.size
+    max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+
+    target = tiles_dir(scan)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(target), prefix='.tiles-')
+    try:
+        level_image = image
+        for level in range(max_level, -1, -1):
+            if level != max_level:
+                level_image = level_image.resize(
+                    (max(1, math.ceil(level_image.width / 2)), max(1, math.ceil(level_image.height / 2))),
+                    Image.Resampling.LANCZOS,
+                )
+            level_dir = os.path.join(work_dir, str(level))
+            os.makedirs(level_dir)
+            for col in range(math.ceil(level_image.width / TILE_SIZE)):
+                for row in range(math.ceil(level_image.height / TILE_SIZE)):
+                    box = (
+                        col * TILE_SIZE, row * TILE_SIZE,
+                        min((col + 1) * TILE_SIZE, level_image.width),
+                        min((row + 1) * TILE_SIZE, level_image.height),
+                    )
+                    level_image.crop(box).save(
+                        os.path.join(level_dir, f"{col}_{row}.jpg"), 'JPEG', quality=JPEG_QUALITY
+                    )
+
+        with open(os.path.join(work_dir, 'manifest.json'), 'w') as f:
+            json.dump({
+                'width': width,
+                'height': height,
+                'tile_size': TILE_SIZE,
+                'overlap': 0,
+                'format': 'jpeg',
+                'max_level': max_level,
+            }, f)
+
+        try:
+            os.rename(work_dir, target)
+        except OSError:
+            # Another process finished first; keep theirs
+            shutil.rmtree(work_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+def delete_for_scan(scan_id):
+    shutil.rmtree(scan_root(scan_id), ignore_errors=True)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.radiology.models import ScanPrediction
+
+
+class Command(BaseCommand):
+    help = (
+        "Make a model's stored predictions the active ones for every scan it scored, without "
+        "calling the AI service. Score the scans first with `backfill_ai --model NAME --no-activate`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model_name')
+        parser.add_argument('--model-version', help="A specific version (default: each scan's newest prediction)")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Scans per bulk update")
+
+    def handle(self, *args, **options):
+        model_name = options['model_name']
+        if not ScanPrediction.objects.filter(model_name=model_name).exists():
+            raise CommandError(f"No predictions from {model_name}")
+        switched = ScanPrediction.activate_model(
+            model_name, options['model_version'], chunk_size=max(1, options['chunk_size'])
+        )
+        self.stdout.write(self.style.SUCCESS(f"Switched {switched} scan(s) to {model_name}"))
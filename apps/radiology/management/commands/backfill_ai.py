@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from apps.radiology import backfill as backfills
+from apps.radiology.ai_service import CONFIG
+from apps.radiology.models import AIBackfill, Scan
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-score existing scans against a model (e.g. after changing CONFIG['default_model']). "
+        "Starts a new backfill from the filters given, or with --resume/--pending continues "
+        "backfills created through the API or interrupted by a crash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=CONFIG['default_model'], help="Target model_name")
+        parser.add_argument('--since', help="Only scans created on or after YYYY-MM-DD")
+        parser.add_argument('--until', help="Only scans created on or before YYYY-MM-DD")
+        parser.add_argument('--scan-type', choices=[code for code, _ in Scan.SCAN_TYPES])
+        parser.add_argument('--from-model', help="Only scans currently scored by this model")
+        parser.add_argument('--force', action='store_true', help="Also re-score scans --model already scored, bypassing the prediction cache")
+        parser.add_argument('--no-activate', action='store_true', help="Only record the predictions; switch later with activate_ai_model")
+        parser.add_argument('--concurrency', type=int, default=4, help="Parallel requests to the AI service")
+        parser.add_argument('--max-rate', type=float, default=0, help="Scans per second (0: no limit)")
+        parser.add_argument('--batch-size', type=int, default=64, help="Scans per checkpoint")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the matching scans")
+        parser.add_argument('--resume', type=int, metavar='ID', help="Continue an interrupted backfill")
+        parser.add_argument('--pending', action='store_true', help="Run every pending or interrupted backfill, then exit")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write
+        if options['pending']:
+            for backfill in backfills.resumable():
+                backfills.run(backfill, log=log)
+            return
+
+        if options['resume']:
+            backfill = AIBackfill.objects.filter(pk=options['resume']).first()
+            if backfill is None:
+                raise CommandError(f"No backfill {options['resume']}")
+            if backfill.status == AIBackfill.RUNNING and backfill not in backfills.resumable():
+                raise CommandError(f"Backfill {backfill.pk} is running in another process")
+            if backfill.status in (AIBackfill.DONE, AIBackfill.CANCELLED):
+                # Picks up after the checkpoint, e.g. to finish a cancelled run
+                AIBackfill.objects.filter(pk=backfill.pk).update(status=AIBackfill.PENDING, finished_at=None)
+            backfills.run(backfill, log=log)
+            return
+
+        backfill = AIBackfill(
+            model_name=options['model'],
+            created_from=self._date(options['since'], '--since'),
+            created_to=self._date(options['until'], '--until'),
+            scan_type=options['scan_type'] or '',
+            from_model=options['from_model'] or '',
+            force=options['force'],
+            activate=not options['no_activate'],
+            concurrency=max(1, options['concurrency']),
+            max_rate=max(0.0, options['max_rate']),
+            batch_size=max(1, options['batch_size']),
+        )
+        count = backfill.scans().count()
+        log(f"{count} scan(s) to re-score with {backfill.model_name}")
+        if options['dry_run'] or not count:
+            return
+        backfill.total = count
+        backfill.save()
+        log(f"Created backfill {backfill.pk}; resume with --resume {backfill.pk} if interrupted")
+        backfills.run(backfill, log=log)
+
+    def _date(self, value, flag):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{flag} expects YYYY-MM-DD")
+        return day
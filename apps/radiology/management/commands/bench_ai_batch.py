@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from backend.benchmarking import summarize, format_summary
+from apps.radiology.ai_service import AIService, MicroBatcher
+from apps.radiology.ai_standin import serve_in_thread
+
+
+class Command(BaseCommand):
+    help = "Compare AI throughput of per-scan calls, predict_batch and the micro-batcher (prediction cache bypassed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=64, help="Number of images to score")
+        parser.add_argument('--image-kb', type=int, default=256, help="Size of each synthetic image")
+        parser.add_argument('--concurrency', type=int, default=8, help="Threads for the per-scan and micro-batched runs")
+        parser.add_argument('--batch-size', type=int, default=16)
+        parser.add_argument('--url', help="AI service to benchmark; defaults to a local stand-in")
+        parser.add_argument('--latency-ms', type=float, default=50, help="Stand-in latency per request")
+        parser.add_argument('--per-item-ms', type=float, default=5, help="Stand-in latency per image")
+        parser.add_argument('--workers', type=int, default=1, help="Stand-in requests processed concurrently")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            server = serve_in_thread(
+                latency_ms=options['latency_ms'], per_item_ms=options['per_item_ms'], workers=options['workers']
+            )
+            url = server.url
+            self.stdout.write(f"Started AI stand-in at {url}")
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            AI_SERVICE_URL=url, AI_BATCH_MAX_SIZE=options['batch_size'], AI_MICROBATCH_WINDOW_MS=0
+        ):
+            paths = []
+            for i in range(options['count']):
+                path = os.path.join(tmp, f"scan_{i}.bin")
+                with open(path, 'wb') as f:
+                    f.write(os.urandom(options['image_kb'] * 1024))
+                paths.append(path)
+
+            service = AIService()
+            model_name = 'resnet50'
+
+            # Warm up the connection pool so handshakes don't skew the first run
+            service._call_service(paths[0], model_name)
+
+            def single(path):
+                start = time.perf_counter()
+                service._call_service(path, model_name)
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                latencies = list(pool.map(single, paths))
+            self.stdout.write(format_summary('per-scan /predict', summarize(latencies, time.perf_counter() - start)))
+
+            latencies = []
+            start = time.perf_counter()
+            for chunk in service._chunk(paths):
+                chunk_start = time.perf_counter()
+                service.send_batches(chunk, model_name)
+                latencies.extend([time.perf_counter() - chunk_start] * len(chunk))
+            self.stdout.write(format_summary('predict_batch', summarize(latencies, time.perf_counter() - start)))
+
+            batcher = MicroBatcher(service, window=0.02, max_size=options['batch_size'])
+
+            def micro(path):
+                start = time.perf_counter()
+                batcher.submit(path, model_name).result()
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                latencies = list(pool.map(micro, paths))
+            self.stdout.write(format_summary('micro-batched /predict', summarize(latencies, time.perf_counter() - start)))
+
+        if server:
+            server.shutdown()
@@ -0,0 +1,114 @@
+import asyncio
+import io
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from backend.benchmarking import summarize, format_summary
+from apps.radiology.ai_standin import serve_in_thread
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload scans and wait for their predictions: WSGI model (a thread blocked per request on "
+        "the AI call) vs the async ASGI view (one event loop, shared httpx.AsyncClient). "
+        "Runs in-process against a slow AI stand-in; seeded users and scans are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Uploads per run")
+        parser.add_argument('--threads', type=int, default=16, help="WSGI request threads (e.g. gunicorn --threads)")
+        parser.add_argument('--concurrency', type=int, default=200, help="Uploads in flight in the ASGI run")
+        parser.add_argument('--latency-ms', type=float, default=300, help="Stand-in latency per prediction")
+        parser.add_argument('--url', help="AI service to benchmark; defaults to a local stand-in")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            # Enough stand-in capacity that the web tier is the bottleneck
+            server = serve_in_thread(latency_ms=options['latency_ms'], workers=options['concurrency'])
+            url = server.url
+            self.stdout.write(f"Started AI stand-in at {url}")
+
+        media_root = tempfile.mkdtemp()
+        user = User.objects.create_user(
+            'bench-async@example.com', 'pw', full_name='Bench Async', role=User.PATIENT, is_active=True
+        )
+        token = str(AccessToken.for_user(user))
+        try:
+            with override_settings(
+                AI_SERVICE_URL=url, MEDIA_ROOT=media_root, AI_PREDICTION_CACHE_ENABLED=False,
+                AI_INFERENCE_INLINE=True, AI_MICROBATCH_WINDOW_MS=0,
+            ):
+                for name, run in (('WSGI threads', self._run_wsgi), ('ASGI async view', self._run_asgi)):
+                    peak = {'threads': self._web_threads()}
+                    latencies, elapsed = run(token, options, peak)
+                    self.stdout.write(format_summary(name, summarize(latencies, elapsed)))
+                    self.stdout.write(f"  peak threads: {peak['threads']}")
+        finally:
+            # Deleting the user cascades to scans, jobs and reports
+            user.delete()
+            shutil.rmtree(media_root, ignore_errors=True)
+            if server:
+                server.shutdown()
+
+    def _run_wsgi(self, token, options, peak):
+        """Sync create with AI_INFERENCE_INLINE: the request thread waits for the AI call"""
+
+        def upload(i):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            start = time.perf_counter()
+            response = client.post('/api/radiology/scans/', {'image': self._image(i)})
+            latency = time.perf_counter() - start
+            peak['threads'] = max(peak['threads'], self._web_threads())
+            assert response.status_code in (201, 202), response.status_code
+            connection.close()
+            return latency
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            latencies = list(pool.map(upload, range(options['requests'])))
+        return latencies, time.perf_counter() - start
+
+    def _run_asgi(self, token, options, peak):
+        async def run():
+            client = AsyncClient()
+            headers = {'Authorization': f'Bearer {token}'}
+            gate = asyncio.Semaphore(options['concurrency'])
+
+            async def upload(i):
+                async with gate:
+                    start = time.perf_counter()
+                    response = await client.post('/api/radiology/scans/async/', {'image': self._image(i)}, headers=headers)
+                    latency = time.perf_counter() - start
+                    peak['threads'] = max(peak['threads'], self._web_threads())
+                    assert response.status_code == 201, response.status_code
+                    return latency
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(upload(i) for i in range(options['requests'])))
+            return latencies, time.perf_counter() - start
+
+        return asyncio.run(run())
+
+    def _web_threads(self):
+        # Leave out the in-process stand-in's request threads
+        return sum(1 for thread in threading.enumerate() if 'process_request_thread' not in thread.name)
+
+    def _image(self, i):
+        # Distinct pixels per upload so nothing is answered from the prediction cache
+        buf = io.BytesIO()
+        Image.new('RGB', (64, 64), (i % 256, (i // 256) % 256, 77)).save(buf, 'PNG')
+        buf.name = f'bench_{i}.png'
+        buf.seek(0)
+        return buf
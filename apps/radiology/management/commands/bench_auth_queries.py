@@ -0,0 +1,85 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from backend.benchmarking import summarize, format_summary
+from apps.radiology.models import Scan, Report
+from apps.users.authentication import ClaimsRefreshToken
+from apps.users.models import User, Patient, Radiologist
+
+
+class Command(BaseCommand):
+    help = (
+        "Queries and latency per request with the user loaded from the database vs built from "
+        "token claims (JWT_TRUST_CLAIMS). Requests carry real access tokens; seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scans', type=int, default=200, help="Scans (each with a report) to seed")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and run")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users, scan = self._seed(options['scans'])
+            endpoints = {
+                'scan list': '/api/radiology/scans/',
+                'scan detail': f'/api/radiology/scans/{scan.pk}/',
+                'report list': '/api/radiology/reports/',
+                'report detail': f'/api/radiology/reports/{scan.report.pk}/',
+                'worklist': '/api/radiology/worklist/',
+            }
+            for role, user in users.items():
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+                for name, url in endpoints.items():
+                    if name == 'worklist' and role != 'radiologist':
+                        continue
+                    for label, trust in (('db user', False), ('token claims', True)):
+                        with override_settings(JWT_TRUST_CLAIMS=trust):
+                            queries, summary = self._run(client, url, options['requests'])
+                        self.stdout.write(format_summary(f"{role} {name} ({label})", summary) + f"  queries/request={queries}")
+
+            transaction.set_rollback(True)
+
+    def _run(self, client, url, count):
+        # The first request fills the claims state and payload caches
+        assert client.get(url).status_code == 200
+        latencies = []
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(count):
+                request_start = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - request_start)
+                assert response.status_code == 200, response.status_code
+        return round(len(queries) / count, 2), summarize(latencies, time.perf_counter() - start)
+
+    def _seed(self, count):
+        patient_user = User.objects.create_user(
+            'bench-auth-patient@example.com', 'pw', full_name='Bench Patient', role=User.PATIENT, is_active=True
+        )
+        patient = Patient.objects.get(user=patient_user)
+        radiologist_user = User.objects.create_user(
+            'bench-auth-radiologist@example.com', 'pw', full_name='Bench Radiologist', role=User.RADIOLOGIST,
+            is_active=True,
+        )
+        radiologist = Radiologist.objects.create(user=radiologist_user, license_id='BENCH-AUTH')
+        admin_user = User.objects.create_user(
+            'bench-auth-admin@example.com', 'pw', full_name='Bench Admin', role=User.ADMIN, is_staff=True,
+            is_active=True,
+        )
+        scans = Scan.objects.bulk_create([
+            Scan(
+                patient=patient, image=f'scans/bench/{i}.png', title=f'Bench scan {i}',
+                ai_status=Scan.AI_COMPLETED, ai_generated=True, ai_predicted_class='Benign',
+                ai_confidence=90.0, ai_benign_prob=90.0, ai_malignant_prob=10.0,
+            )
+            for i in range(count)
+        ])
+        Report.objects.bulk_create([
+            Report(scan=scan, radiologist=radiologist, content='Findings', impression='Summary') for scan in scans
+        ])
+        users = {'patient': patient_user, 'radiologist': radiologist_user, 'admin': admin_user}
+        return users, Scan.objects.select_related('report').get(pk=scans[0].pk)
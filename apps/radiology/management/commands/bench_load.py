@@ -0,0 +1,363 @@
+import hashlib
+import io
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+import requests
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from backend.benchmarking import summarize, format_summary
+from apps.radiology import rollups
+from apps.radiology.ai_standin import serve_in_thread
+from apps.radiology.models import Scan, Report
+from apps.users.authentication import add_claims
+from apps.users.models import User, Patient, Radiologist
+
+WORKLOADS = ('upload', 'list', 'detail', 'rerun_ai', 'report_edit')
+# Statuses that count as success; anything else (or an exception) is an error
+EXPECTED = {
+    'upload': (201, 202),
+    'list': (200,),
+    'detail': (200,),
+    'rerun_ai': (200, 202),
+    'report_edit': (200,),
+}
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test: seed patients, radiologists, scans and reports, then drive concurrent upload, list, "
+        "detail, rerun_ai and report edit requests and report p50/p95/p99 latency and throughput per workload. "
+        "Runs in-process against a local AI stand-in by default, or against a running server with --target. "
+        "The same --seed gives the same data and request mix; --output and --compare diff runs between commits. "
+        "Seeded users, scans and files are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=20)
+        parser.add_argument('--radiologists', type=int, default=5)
+        parser.add_argument('--scans-per-patient', type=int, default=10)
+        parser.add_argument('--report-share', type=float, default=0.5, help="Share of the seeded scans with a draft report")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per workload")
+        parser.add_argument('--concurrency', type=int, default=8, help="Clients sending requests back to back")
+        parser.add_argument('--workloads', default=','.join(WORKLOADS), help="Comma-separated, run in this order")
+        parser.add_argument('--image-kb', type=float, default=64, help="Size of the seeded and uploaded images")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--target', help="Base URL of a running server sharing this database; default in-process")
+        parser.add_argument('--url', help="AI service for in-process runs; defaults to a local stand-in")
+        parser.add_argument('--latency-ms', type=float, default=100, help="Stand-in latency per request")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of stand-in requests failing with 503")
+        parser.add_argument('--payload-kb', type=float, default=0, help="Padding in every stand-in response")
+        parser.add_argument('--ai-workers', type=int, default=8, help="Stand-in requests processed at a time")
+        parser.add_argument(
+            '--queue-ai', action='store_true', help="Leave inference jobs to the worker instead of running them inline"
+        )
+        parser.add_argument('--output', help="Write the results as JSON")
+        parser.add_argument('--compare', help="Results JSON of an earlier run to diff against")
+
+    def handle(self, *args, **options):
+        workloads = [name.strip() for name in options['workloads'].split(',') if name.strip()]
+        unknown = set(workloads) - set(WORKLOADS)
+        if unknown:
+            raise CommandError(f"Unknown workload(s): {', '.join(sorted(unknown))}")
+        if options['patients'] < 1 or options['radiologists'] < 1 or options['scans_per_patient'] < 1:
+            raise CommandError("Need at least one patient, radiologist and scan per patient")
+        baseline = self._load(options['compare']) if options['compare'] else None
+
+        server = None
+        url = options['url']
+        if not url and not options['target']:
+            server = serve_in_thread(
+                latency_ms=options['latency_ms'], workers=options['ai_workers'], error_rate=options['error_rate'],
+                payload_kb=options['payload_kb'], seed=options['seed'],
+            )
+            url = server.url
+            self.stdout.write(f"Started AI stand-in at {url}")
+
+        media_root = None
+        if options['target']:
+            # The server does its own AI calls and storage
+            context = nullcontext()
+        else:
+            media_root = tempfile.mkdtemp()
+            context = override_settings(
+                AI_SERVICE_URL=url, MEDIA_ROOT=media_root,
+                AI_INFERENCE_INLINE=not options['queue_ai'], AI_MICROBATCH_WINDOW_MS=0,
+            )
+
+        rng = random.Random(options['seed'])
+        run = uuid.uuid4().hex[:8]
+        results = {}
+        try:
+            with context:
+                seeded = self._seed(run, rng, options)
+                try:
+                    for name in workloads:
+                        plan = getattr(self, f'_plan_{name}')(seeded, rng, options)
+                        results[name] = self._run(name, plan, options)
+                        line = format_summary(name, results[name])
+                        self.stdout.write(f"{line}  errors={results[name]['errors']}")
+                        for status, count in sorted(results[name]['unexpected'].items()):
+                            self.stdout.write(f"  {count} x {status}")
+                finally:
+                    self._teardown(seeded)
+        finally:
+            if media_root:
+                shutil.rmtree(media_root, ignore_errors=True)
+            if server:
+                self.stdout.write(f"AI stand-in: {server.app.config['stats']}")
+                server.shutdown()
+
+        report = {
+            'commit': self._commit(),
+            'created_at': timezone.now().isoformat(),
+            'options': {
+                key: options[key] for key in (
+                    'patients', 'radiologists', 'scans_per_patient', 'report_share', 'requests', 'concurrency',
+                    'image_kb', 'seed', 'target', 'latency_ms', 'error_rate', 'payload_kb', 'ai_workers', 'queue_ai',
+                )
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if baseline:
+            self._compare(baseline, report)
+
+    def _seed(self, run, rng, options):
+        """Users with tokens, scans with noise images (under scans/loadtest/<run>/) and draft reports"""
+        started = time.perf_counter()
+        unusable = make_password(None)
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                [
+                    User(email=f'load-{run}-patient-{i}@example.com', full_name=f'Load Patient {i}',
+                         role=User.PATIENT, password=unusable, is_active=True)
+                    for i in range(options['patients'])
+                ] + [
+                    User(email=f'load-{run}-radiologist-{i}@example.com', full_name=f'Load Radiologist {i}',
+                         role=User.RADIOLOGIST, password=unusable, is_active=True)
+                    for i in range(options['radiologists'])
+                ]
+            )
+            patients = Patient.objects.bulk_create([Patient(user=user) for user in users if user.role == User.PATIENT])
+            radiologists = Radiologist.objects.bulk_create([
+                Radiologist(user=user, license_id=f'LOAD-{run}-{i}')
+                for i, user in enumerate(user for user in users if user.role == User.RADIOLOGIST)
+            ])
+
+        scans = []
+        for patient in patients:
+            for i in range(options['scans_per_patient']):
+                data = self._image(rng, options['image_kb'])
+                name = default_storage.save(f'scans/loadtest/{run}/{patient.pk}-{i}.png', ContentFile(data))
+                scans.append(Scan(
+                    patient=patient, image=name, image_sha256=hashlib.sha256(data).hexdigest(),
+                    title=f'Load scan {i}', scan_type='MAMMOGRAM',
+                ))
+        scans = Scan.bulk_ingest(scans, queue_ai=False)
+
+        reported = rng.sample(scans, round(len(scans) * options['report_share']))
+        with transaction.atomic():
+            reports = Report.objects.bulk_create([
+                Report(scan=scan, radiologist=rng.choice(radiologists), content=f'Load report for scan {scan.pk}')
+                for scan in reported
+            ])
+            # bulk_create skips the signals that move these scans to the draft bucket
+            deltas = Counter()
+            for scan in reported:
+                rollups.move(
+                    deltas, rollups.bucket(scan._rollup_fields, rollups.NO_REPORT),
+                    rollups.bucket(scan._rollup_fields, rollups.DRAFT),
+                )
+            rollups.apply(deltas)
+
+        tokens = {user.pk: str(add_claims(AccessToken.for_user(user), user.pk)) for user in users}
+        self.stdout.write(
+            f"Seeded {len(patients)} patients, {len(radiologists)} radiologists, {len(scans)} scans and "
+            f"{len(reports)} reports in {time.perf_counter() - started:.1f}s"
+        )
+        return {
+            'users': users,
+            'patient_tokens': [tokens[patient.user_id] for patient in patients],
+            'radiologist_tokens': [tokens[radiologist.user_id] for radiologist in radiologists],
+            # (scan id, owner's token)
+            'scans': [(scan.pk, tokens[scan.patient.user_id]) for scan in scans],
+            'reports': [report.pk for report in reports],
+        }
+
+    def _teardown(self, seeded):
+        images = list(
+            Scan.objects.filter(patient__user__in=seeded['users']).exclude(image='').values_list('image', flat=True)
+        )
+        # Cascades to profiles, scans (seeded and uploaded), jobs and reports
+        User.objects.filter(pk__in=[user.pk for user in seeded['users']]).delete()
+        for name in images:
+            default_storage.delete(name)
+
+    # Each plan is a list of (token, method, path, body) built before the clock starts
+
+    def _plan_upload(self, seeded, rng, options):
+        # Fresh pixels per upload, so none is answered from the prediction cache
+        return [
+            (rng.choice(seeded['patient_tokens']), 'post', '/api/radiology/scans/',
+             {'files': {'image': (f'load-{i}.png', self._image(rng, options['image_kb']))}})
+            for i in range(options['requests'])
+        ]
+
+    def _plan_list(self, seeded, rng, options):
+        return [
+            (rng.choice(seeded['patient_tokens'] if i % 2 else seeded['radiologist_tokens']),
+             'get', '/api/radiology/scans/', {})
+            for i in range(options['requests'])
+        ]
+
+    def _plan_detail(self, seeded, rng, options):
+        plan = []
+        for i in range(options['requests']):
+            scan_id, owner = rng.choice(seeded['scans'])
+            token = owner if i % 2 else rng.choice(seeded['radiologist_tokens'])
+            plan.append((token, 'get', f'/api/radiology/scans/{scan_id}/', {}))
+        return plan
+
+    def _plan_rerun_ai(self, seeded, rng, options):
+        plan = []
+        for _ in range(options['requests']):
+            scan_id, owner = rng.choice(seeded['scans'])
+            plan.append((owner, 'post', f'/api/radiology/scans/{scan_id}/rerun_ai/', {'json': {'force': 'true'}}))
+        return plan
+
+    def _plan_report_edit(self, seeded, rng, options):
+        if not seeded['reports']:
+            raise CommandError("report_edit needs seeded reports (--report-share above 0)")
+        plan = []
+        for i in range(options['requests']):
+            body = {'json': {'content': f'Edited under load ({i})', 'impression': 'No change'}}
+            path = f"/api/radiology/reports/{rng.choice(seeded['reports'])}/"
+            plan.append((rng.choice(seeded['radiologist_tokens']), 'patch', path, body))
+        return plan
+
+    def _run(self, name, plan, options):
+        """Closed loop: `concurrency` clients each send their next request as soon as one returns"""
+        pending = iter(plan)
+        lock = threading.Lock()
+        latencies, statuses = [], Counter()
+
+        def client_loop():
+            clients = {}
+            try:
+                while True:
+                    with lock:
+                        item = next(pending, None)
+                    if item is None:
+                        return
+                    token, method, path, body = item
+                    if token not in clients:
+                        clients[token] = self._client(token, options['target'])
+                    start = time.perf_counter()
+                    try:
+                        status = clients[token](method, path, **body)
+                    except Exception as e:
+                        status = e.__class__.__name__
+                    latency = time.perf_counter() - start
+                    with lock:
+                        latencies.append(latency)
+                        statuses[status] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client_loop) for _ in range(max(1, options['concurrency']))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = summarize(latencies, time.perf_counter() - start)
+        unexpected = {status: count for status, count in statuses.items() if status not in EXPECTED[name]}
+        summary['errors'] = sum(unexpected.values())
+        summary['unexpected'] = {str(status): count for status, count in unexpected.items()}
+        return summary
+
+    def _client(self, token, target):
+        """send(method, path, files=None, json=None) -> status code, in-process or over HTTP"""
+        if target:
+            session = requests.Session()
+            session.headers['Authorization'] = f'Bearer {token}'
+
+            base = target.rstrip('/')
+
+            def send(method, path, files=None, json=None):
+                return session.request(method, base + path, files=files, json=json, timeout=120).status_code
+        else:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+            def send(method, path, files=None, json=None):
+                if files:
+                    data = {}
+                    for field, (filename, content) in files.items():
+                        data[field] = io.BytesIO(content)
+                        data[field].name = filename
+                    return getattr(client, method)(path, data).status_code
+                if json is not None:
+                    return getattr(client, method)(path, json, format='json').status_code
+                return getattr(client, method)(path).status_code
+        return send
+
+    def _image(self, rng, kb):
+        # Noise doesn't compress, so the PNG is about `kb` KB
+        side = max(8, int((kb * 1024 / 3) ** 0.5))
+        buf = io.BytesIO()
+        Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3)).save(buf, 'PNG')
+        return buf.getvalue()
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read {path}: {e}")
+
+    def _compare(self, baseline, report):
+        self.stdout.write(f"\nvs {baseline.get('commit') or 'baseline'} ({baseline.get('created_at', '?')}):")
+        if baseline.get('options') != report['options']:
+            self.stdout.write("  note: options differ from the baseline run")
+        for name, summary in report['results'].items():
+            before = baseline.get('results', {}).get(name)
+            if not before:
+                self.stdout.write(f"  {name:<14} not in baseline")
+                continue
+            changes = []
+            for key in COMPARED:
+                old, new = before.get(key), summary.get(key)
+                if old and new is not None:
+                    changes.append(f"{key.removesuffix('_ms').removesuffix('_per_s')} {(new - old) / old * 100:+.1f}%")
+            self.stdout.write(f"  {name:<14} {'  '.join(changes)}")
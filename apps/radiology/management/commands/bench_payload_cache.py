@@ -0,0 +1,79 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+from backend.benchmarking import summarize, format_summary
+from apps.radiology import payload_cache
+from apps.radiology.models import Scan, Report
+from apps.users.models import User, Patient, Radiologist
+
+
+class Command(BaseCommand):
+    help = "Compare scan/report list and detail latency with and without the payload cache (seeded rows are rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scans', type=int, default=500, help="Scans (each with a report) to seed")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and run")
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users, scans = self._seed(options['scans'])
+            endpoints = [
+                ('scan list', '/api/radiology/scans/?page_size={}'.format(options['page_size'])),
+                ('scan detail', '/api/radiology/scans/{pk}/'),
+                ('report list', '/api/radiology/reports/?page_size={}'.format(options['page_size'])),
+                ('report detail', '/api/radiology/reports/{report}/'),
+            ]
+            runs = [('no cache', False), ('cache cold', True), ('cache warm', True)]
+
+            payload_cache.get_cache().clear()
+            for role, user in users.items():
+                client = APIClient()
+                client.force_authenticate(user)
+                for label, enabled in runs:
+                    payload_cache.reset_stats()
+                    with override_settings(RADIOLOGY_PAYLOAD_CACHE_ENABLED=enabled):
+                        for name, url in endpoints:
+                            summary = self._run(client, url, scans, options['requests'])
+                            self.stdout.write(format_summary(f"{role} {name} ({label})", summary))
+                    if enabled:
+                        self.stdout.write(f"  hit rate: {payload_cache.stats()['hit_rate']}")
+
+            transaction.set_rollback(True)
+
+    def _run(self, client, url, scans, count):
+        latencies = []
+        start = time.perf_counter()
+        for i in range(count):
+            scan = scans[i % len(scans)]
+            request_start = time.perf_counter()
+            response = client.get(url.format(pk=scan.pk, report=scan.report.pk))
+            latencies.append(time.perf_counter() - request_start)
+            assert response.status_code == 200, response.status_code
+        return summarize(latencies, time.perf_counter() - start)
+
+    def _seed(self, count):
+        patient_user = User.objects.create_user(
+            'bench-patient@example.com', 'pw', full_name='Bench Patient', role=User.PATIENT
+        )
+        patient = Patient.objects.get(user=patient_user)
+        radiologist_user = User.objects.create_user(
+            'bench-radiologist@example.com', 'pw', full_name='Bench Radiologist', role=User.RADIOLOGIST
+        )
+        radiologist = Radiologist.objects.create(user=radiologist_user, license_id='BENCH-CACHE')
+        scans = Scan.objects.bulk_create([
+            Scan(
+                patient=patient, image=f'scans/bench/{i}.png', title=f'Bench scan {i}',
+                ai_status=Scan.AI_COMPLETED, ai_generated=True, ai_predicted_class='Benign',
+                ai_confidence=90.0, ai_benign_prob=90.0, ai_malignant_prob=10.0,
+            )
+            for i in range(count)
+        ])
+        Report.objects.bulk_create([
+            Report(scan=scan, radiologist=radiologist, content='Findings ' * 50, impression='Summary')
+            for scan in scans
+        ])
+        scans = list(Scan.objects.filter(patient=patient).select_related('report'))
+        return {'patient': patient_user, 'radiologist': radiologist_user}, scans
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from backend.benchmarking import summarize, format_summary
+from apps.radiology import preprocessing
+from apps.radiology.ai_service import AIService
+from apps.radiology.ai_standin import serve_in_thread
+
+
+class Command(BaseCommand):
+    help = "Measure payload size and end-to-end AI latency with and without preprocessing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=8, help="Number of synthetic scans")
+        parser.add_argument('--width', type=int, default=3328)
+        parser.add_argument('--height', type=int, default=4096)
+        parser.add_argument('--url', help="AI service to benchmark; defaults to a local stand-in")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            server = serve_in_thread()
+            url = server.url
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(AI_SERVICE_URL=url):
+            paths = [self._make_scan(tmp, i, options['width'], options['height']) for i in range(options['count'])]
+            original_bytes = sum(os.path.getsize(path) for path in paths)
+            service = AIService()
+            service._call_service(paths[0], 'resnet50')  # warm up the connection
+
+            runs = [
+                ('original', False),
+                ('preprocessed (cold)', True),
+                ('preprocessed (cached)', True),
+            ]
+            for name, enabled in runs:
+                latencies = []
+                start = time.perf_counter()
+                with override_settings(AI_PREPROCESS_ENABLED=enabled):
+                    for path in paths:
+                        call_start = time.perf_counter()
+                        service._call_service(path, 'resnet50')
+                        latencies.append(time.perf_counter() - call_start)
+                self.stdout.write(format_summary(name, summarize(latencies, time.perf_counter() - start)))
+
+            sent = sum(os.path.getsize(preprocessing.prepare(path)) for path in paths)
+            self.stdout.write(
+                f"payload: {original_bytes / 1e6:.1f} MB original -> {sent / 1e6:.2f} MB preprocessed "
+                f"({sent / original_bytes:.2%})"
+            )
+
+        if server:
+            server.shutdown()
+
+    def _make_scan(self, directory, index, width, height):
+        """16-bit grayscale gradient with noise, roughly like a digital mammogram"""
+        rng = np.random.default_rng(index)
+        gradient = np.linspace(0, 40000, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+        pixels = (gradient + rng.normal(0, 2000, (height, width))).clip(0, 65535).astype(np.uint16)
+        path = os.path.join(directory, f"scan_{index}.png")
+        Image.fromarray(pixels).save(path)
+        return path
@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import get_valid_filename
+from PIL import Image
+from apps.radiology import prediction_cache
+from apps.radiology.models import Scan
+from apps.users.models import Patient
+
+
+def inspect_image(path):
+    """(sha256, size, error) for one file; runs in the process pool"""
+    try:
+        with Image.open(path) as img:
+            img.verify()
+        return prediction_cache.hash_image(path), os.path.getsize(path), None
+    except Exception as e:
+        return None, 0, str(e) or e.__class__.__name__
+
+
+def copy_image(task):
+    """Copy into MEDIA_ROOT; a file already there (from an interrupted run) is kept"""
+    source, destination = task
+    if os.path.exists(destination):
+        return
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = destination + '.part'
+    shutil.copyfile(source, partial)
+    os.replace(partial, destination)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load scans from a directory (one sub-directory per patient email or id, or --patient) "
+        "or a CSV/JSON manifest with path, patient, scan_type, title, description. "
+        "Re-running skips files already imported, so an interrupted import can simply be restarted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Directory of images, or a .csv/.json manifest")
+        parser.add_argument('--patient', help="Patient (email or id) for files directly in the source directory")
+        parser.add_argument('--scan-type', default='MAMMOGRAM', choices=[code for code, _ in Scan.SCAN_TYPES])
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes validating, hashing and copying")
+        parser.add_argument('--batch-size', type=int, default=500, help="Scans inserted per transaction")
+        parser.add_argument('--skip-ai', action='store_true', help="Don't queue inference jobs for the imported scans")
+        parser.add_argument('--checkpoint', help="Log of finished source files (default: <source>.import-checkpoint)")
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['source'])
+        if os.path.isdir(source):
+            entries = self._walk(source, options)
+        elif os.path.isfile(source):
+            entries = self._manifest(source, options)
+        else:
+            raise CommandError(f"{source} does not exist")
+
+        checkpoint = options['checkpoint'] or source.rstrip(os.sep) + '.import-checkpoint'
+        done = set()
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = {line.rstrip('\n') for line in f if line.strip()}
+        entries = [entry for entry in entries if entry['path'] not in done]
+        self.stdout.write(f"{len(entries)} file(s) to import, {len(done)} already done per {checkpoint}")
+
+        patients = self._resolve_patients({entry['patient'] for entry in entries})
+        totals = {'imported': 0, 'duplicates': 0, 'failed': 0, 'bytes': 0}
+        started = time.monotonic()
+        with ProcessPoolExecutor(max(1, options['workers'])) as pool, open(checkpoint, 'a') as log:
+            for i in range(0, len(entries), options['batch_size']):
+                batch = entries[i:i + options['batch_size']]
+                counts, finished = self._import_batch(pool, batch, patients, options)
+                # Only after the rows committed; the image hash check covers a crash in between.
+                # Failed files aren't logged, so they are retried once fixed.
+                log.write(''.join(path + '\n' for path in finished))
+                log.flush()
+                os.fsync(log.fileno())
+
+                for key, value in counts.items():
+                    totals[key] += value
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{i + len(batch)}/{len(entries)}: {totals['imported']} imported, "
+                    f"{totals['duplicates']} duplicate(s), {totals['failed']} failed, "
+                    f"{totals['imported'] / elapsed:.1f} scans/s, {totals['bytes'] / elapsed / 2 ** 20:.1f} MB/s"
+                )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['imported']} scan(s) ({totals['bytes'] / 2 ** 20:.1f} MB) in {elapsed:.1f}s"
+            + ("" if options['skip_ai'] else "; inference jobs queued for run_ai_worker")
+        ))
+        if totals['failed']:
+            raise CommandError(f"{totals['failed']} file(s) could not be imported, see above")
+
+    def _import_batch(self, pool, batch, patients, options):
+        counts = {'imported': 0, 'duplicates': 0, 'failed': 0, 'bytes': 0}
+        inspected = pool.map(inspect_image, [entry['path'] for entry in batch], chunksize=8)
+
+        valid = []
+        for entry, (image_hash, size, error) in zip(batch, inspected):
+            if error is None and entry['patient'] not in patients:
+                error = f"unknown patient {entry['patient']!r}"
+            if error is None and entry['scan_type'] not in dict(Scan.SCAN_TYPES):
+                error = f"unknown scan type {entry['scan_type']!r}"
+            if error:
+                self.stderr.write(f"{entry['path']}: {error}")
+                counts['failed'] += 1
+                continue
+            valid.append((entry, patients[entry['patient']], image_hash, size))
+
+        # Already imported (earlier run, or the same file twice) for the same patient
+        seen = set(
+            Scan.objects.filter(image_sha256__in=[image_hash for _, _, image_hash, _ in valid])
+            .values_list('patient_id', 'image_sha256')
+        )
+        directory = datetime.now().strftime('scans/%Y/%m/%d')
+        scans, copies = [], []
+        for entry, patient_id, image_hash, size in valid:
+            if (patient_id, image_hash) in seen:
+                counts['duplicates'] += 1
+                continue
+            seen.add((patient_id, image_hash))
+            name = f"{directory}/{image_hash[:12]}_{get_valid_filename(os.path.basename(entry['path']))}"
+            copies.append((entry['path'], os.path.join(settings.MEDIA_ROOT, name)))
+            scans.append(Scan(
+                patient_id=patient_id, image=name, image_sha256=image_hash, scan_type=entry['scan_type'],
+                title=entry['title'], description=entry['description'],
+            ))
+            counts['bytes'] += size
+
+        list(pool.map(copy_image, copies, chunksize=8))
+        Scan.bulk_ingest(scans, queue_ai=not options['skip_ai'])
+        counts['imported'] = len(scans)
+        return counts, [entry['path'] for entry, _, _, _ in valid]
+
+    def _walk(self, root, options):
+        entries = []
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            relative = os.path.relpath(directory, root)
+            patient = options['patient'] if relative == '.' else relative.split(os.sep)[0]
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                entries.append(self._entry(os.path.join(directory, filename), patient, options))
+        return entries
+
+    def _manifest(self, path, options):
+        base = os.path.dirname(path)
+        with open(path, newline='') as f:
+            if path.endswith('.json'):
+                rows = json.load(f)
+                rows = rows.get('scans', []) if isinstance(rows, dict) else rows
+            elif path.endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                raise CommandError("Manifests must be .csv or .json")
+        entries = []
+        for row in rows:
+            if not row.get('path'):
+                raise CommandError(f"Manifest row without a path: {row}")
+            entries.append(self._entry(
+                os.path.join(base, row['path']), row.get('patient') or options['patient'], options, row
+            ))
+        return entries
+
+    def _entry(self, path, patient, options, row=None):
+        row = row or {}
+        return {
+            'path': os.path.abspath(path),
+            'patient': str(patient or ''),
+            'scan_type': row.get('scan_type') or options['scan_type'],
+            'title': row.get('title') or '',
+            'description': row.get('description') or '',
+        }
+
+    def _resolve_patients(self, refs):
+        """{ref: patient id} for refs that are a patient id or a patient's email"""
+        ids = [int(ref) for ref in refs if ref.isdigit()]
+        emails = [ref for ref in refs if ref and not ref.isdigit()]
+        patients = {str(pk): pk for pk in Patient.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+        patients.update(Patient.objects.filter(user__email__in=emails).values_list('user__email', 'pk'))
+        return patients
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.radiology import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the scan analytics rollups from the scan table, or check them against it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Scan ids aggregated per query")
+        parser.add_argument('--check', action='store_true', help="Compare the rollups with live aggregates instead of rebuilding")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['check']:
+            mismatches = rollups.diff(options['chunk_size'])
+            for (day, scan_type, predicted_class, state), (stored, live) in sorted(mismatches.items()):
+                self.stdout.write(f"{day} {scan_type}/{predicted_class or '-'}/{state}: rollup {stored}, live {live}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} rollup bucket(s) out of date; run without --check to rebuild")
+            self.stdout.write(self.style.SUCCESS(f"Rollups match live aggregates ({time.monotonic() - started:.1f}s)"))
+            return
+
+        buckets = rollups.rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} rollup bucket(s) in {time.monotonic() - started:.1f}s"))
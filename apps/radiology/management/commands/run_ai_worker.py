@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.radiology import prediction_cache
+from apps.radiology.ai_service import ai_service
+from apps.radiology.models import InferenceJob
+
+
+class Command(BaseCommand):
+    help = "Process queued AI inference jobs (run one or more of these next to the web workers)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=16, help="Jobs claimed per poll and sent as one batch")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--stale-after', type=int, default=300, help="Requeue RUNNING jobs older than this many seconds")
+        parser.add_argument('--prune-interval', type=int, default=3600, help="Seconds between prediction cache evictions")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        self.stdout.write("AI inference worker started")
+        last_prune = 0.0
+
+        while True:
+            close_old_connections()
+
+            if time.monotonic() - last_prune >= options['prune_interval']:
+                evicted = prediction_cache.prune()
+                if evicted:
+                    self.stdout.write(f"Evicted {evicted} cached prediction(s)")
+                last_prune = time.monotonic()
+
+            requeued = InferenceJob.requeue_stale(stale_after)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+            if not ai_service.is_available():
+                # Circuit breaker is open: leave jobs queued (scans stay AI pending)
+                wait = max(ai_service.retry_after(), options['poll_interval'])
+                self.stdout.write(f"AI service unavailable, pausing for {wait:.0f}s")
+                if options['once']:
+                    break
+                time.sleep(wait)
+                continue
+
+            # Claimed jobs are scored together through AIService.predict_batch
+            jobs = InferenceJob.claim(limit=options['batch_size'])
+            InferenceJob.run_batch(jobs)
+            for job in jobs:
+                self.stdout.write(f"Job {job.pk} (scan {job.scan_id}): {job.status}")
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
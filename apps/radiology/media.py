@@ -0,0 +1,149 @@
+"""
+File delivery for MEDIA_ROOT (scan images, derivatives) once access has been checked.
+
+MEDIA_DELIVERY picks who moves the bytes:
+- 'nginx':    X-Accel-Redirect to MEDIA_ACCEL_PREFIX (an `internal` location aliased to MEDIA_ROOT)
+- 'sendfile': X-Sendfile with the absolute path (Apache mod_xsendfile, lighttpd)
+- 'python':   served by Django with Range, If-Range and conditional GET support. The
+              response wraps the open file, so gunicorn's wsgi.file_wrapper sends it
+              (or the requested range) with os.sendfile instead of reading it in Python.
+"""
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def resolve(relative_path):
+    """Absolute path of a file under MEDIA_ROOT; 404 for traversal attempts or missing files"""
+    try:
+        path = safe_join(settings.MEDIA_ROOT, relative_path)
+    except SuspiciousFileOperation:
+        raise Http404('No such file')
+    if not os.path.isfile(path):
+        raise Http404('No such file')
+    return path
+
+
+def serve(request, path, content_type=None, cache_control='private, max-age=86400'):
+    """Response for the file at absolute `path` (which must live under MEDIA_ROOT)"""
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_DELIVERY', 'python')
+    if mode in ('nginx', 'sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'nginx':
+            relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + relative
+        else:
+            response['X-Sendfile'] = path
+        response['Cache-Control'] = cache_control
+        return response
+    return _serve_python(request, path, content_type, cache_control)
+
+
+def _serve_python(request, path, content_type, cache_control):
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    mtime = int(stat.st_mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, mtime, cache_control)
+
+    byte_range = _requested_range(request, size, etag, mtime)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(FileRange(f, start, length), content_type=content_type, status=206)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return _with_validators(response, etag, mtime, cache_control)
+
+
+def _with_validators(response, etag, mtime, cache_control):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _requested_range(request, size, etag, mtime):
+    """
+    (start, end) inclusive for a single satisfiable byte range, 'unsatisfiable', or None
+    to send the whole file (no, invalid or multiple ranges, or an If-Range that no longer matches).
+    """
+    header = request.headers.get('Range', '').replace(' ', '')
+    match = RANGE_RE.match(header)
+    if not match or not any(match.groups()):
+        return None
+
+    if_range = request.headers.get('If-Range')
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != mtime:
+            return None
+
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # Invalid, not unsatisfiable: ignored (RFC 7233 3.1)
+        return None
+    if size == 0:
+        return 'unsatisfiable'
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            return 'unsatisfiable'
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return 'unsatisfiable'
+    return start, end
+
+
+class FileRange:
+    """
+    Read-only view of `length` bytes of an open file from `start`. It keeps
+    fileno(), so a sendfile-capable wsgi.file_wrapper (gunicorn) still sends it
+    zero-copy: it starts at the file's current offset and stops at Content-Length.
+    """
+
+    def __init__(self, f, start, length):
+        self.f = f
+        self.remaining = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
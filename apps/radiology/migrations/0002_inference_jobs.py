@@ -0,0 +1,87 @@
+# Generated by Django 6.0 on 2026-10-18 12:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_existing_predictions(apps, schema_editor):
+    Scan = apps.get_model("radiology", "Scan")
+    Scan.objects.filter(ai_generated=True).update(ai_status="COMPLETED")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scan",
+            name="ai_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("COMPLETED", "Completed"),
+                    ("FAILED", "Failed"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="InferenceJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model_name", models.CharField(max_length=100)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("RUNNING", "Running"),
+                            ("DONE", "Done"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="PENDING",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("max_attempts", models.PositiveSmallIntegerField(default=3)),
+                ("last_error", models.TextField(blank=True)),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "scan",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="inference_jobs",
+                        to="radiology.scan",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "PENDING")),
+                        fields=["run_after", "id"],
+                        name="radiology_job_pending_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(mark_existing_predictions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 13:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0002_inference_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="inferencejob",
+            name="use_cache",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="image_sha256",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name="CachedPrediction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("image_sha256", models.CharField(max_length=64)),
+                ("model_name", models.CharField(max_length=100)),
+                ("result", models.JSONField()),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("image_sha256", "model_name"),
+                        name="radiology_cached_prediction_key",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0003_prediction_cache"),
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                fields=["created_at", "id"], name="radiology_report_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scan",
+            index=models.Index(
+                fields=["created_at", "id"], name="radiology_scan_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scan",
+            index=models.Index(
+                fields=["patient", "created_at", "id"],
+                name="radiology_scan_patient_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=["search_vector"], name="radiology_scan_search_idx"
+)
+
+
+def add_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("radiology", "Scan"), SEARCH_INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("radiology", "Scan"), SEARCH_INDEX)
+
+
+def populate_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    from apps.radiology.search import scan_vector
+
+    Scan = apps.get_model("radiology", "Scan")
+    Patient = apps.get_model("users", "Patient")
+    Scan.objects.update(search_vector=scan_vector(Patient))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0004_keyset_pagination_indexes"),
+        ("users", "0002_full_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scan",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name="scan", index=SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_search_index, remove_search_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+WORKLIST_INDEX = models.Index(
+    models.OrderBy(models.F("ai_malignant_prob"), descending=True, nulls_last=True),
+    models.F("created_at"),
+    models.F("id"),
+    condition=models.Q(("is_reported", False)),
+    name="radiology_scan_worklist_idx",
+)
+
+
+def mark_reported_scans(apps, schema_editor):
+    Scan = apps.get_model("radiology", "Scan")
+    Scan.objects.filter(report__is_final=True).update(is_reported=True)
+
+
+def add_worklist_index(apps, schema_editor):
+    # SQLite rejects NULLS LAST in index definitions; the index only matters on PostgreSQL
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("radiology", "Scan"), WORKLIST_INDEX)
+
+
+def remove_worklist_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("radiology", "Scan"), WORKLIST_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0005_scan_search_vector"),
+        ("users", "0002_full_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scan",
+            name="claimed_by",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="claimed_scans",
+                to="users.radiologist",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="claimed_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="is_reported",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_reported_scans, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name="scan", index=WORKLIST_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_worklist_index, remove_worklist_index),
+            ],
+        ),
+    ]
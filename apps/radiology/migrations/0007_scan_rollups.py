@@ -0,0 +1,109 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    # Same buckets as rollups.live_counts(); `rebuild_scan_rollups` redoes this in chunks
+    Scan = apps.get_model("radiology", "Scan")
+    ScanRollup = apps.get_model("radiology", "ScanRollup")
+    state = Case(
+        When(report__isnull=True, then=Value("NONE")),
+        When(report__is_final=True, then=Value("FINAL")),
+        default=Value("DRAFT"),
+        output_field=CharField(),
+    )
+    rows = (
+        Scan.objects.values(
+            day=TruncDate("created_at"),
+            type=F("scan_type"),
+            predicted=F("ai_predicted_class"),
+            state=state,
+        )
+        .annotate(scans=Count("id"))
+        .order_by()
+    )
+    buckets = {}
+    for row in rows:
+        key = (row["day"], row["type"], row["predicted"] or "", row["state"])
+        buckets[key] = buckets.get(key, 0) + row["scans"]
+    ScanRollup.objects.bulk_create(
+        [
+            ScanRollup(
+                day=day,
+                scan_type=scan_type,
+                ai_predicted_class=predicted,
+                report_state=state,
+                scans=n,
+            )
+            for (day, scan_type, predicted, state), n in buckets.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0006_worklist"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScanRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "scan_type",
+                    models.CharField(
+                        choices=[
+                            ("MRI", "MRI"),
+                            ("CT", "CT Scan"),
+                            ("XRAY", "X-Ray"),
+                            ("MAMMOGRAM", "Mammogram"),
+                            ("OTHER", "Other"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("ai_predicted_class", models.CharField(blank=True, max_length=50)),
+                (
+                    "report_state",
+                    models.CharField(
+                        choices=[
+                            ("NONE", "No report"),
+                            ("DRAFT", "Draft"),
+                            ("FINAL", "Final"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("scans", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "day",
+                            "scan_type",
+                            "ai_predicted_class",
+                            "report_state",
+                        ),
+                        name="radiology_scan_rollup_key",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
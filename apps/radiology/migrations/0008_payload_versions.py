@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 16:50
+
+import apps.radiology.models
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def drop_nulls_last_index(apps, schema_editor):
+    # 0006 only created it on PostgreSQL
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS radiology_scan_worklist_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0007_scan_rollups"),
+        ("users", "0002_full_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name="scan",
+                    name="radiology_scan_worklist_idx",
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_nulls_last_index, migrations.RunPython.noop),
+            ],
+        ),
+        migrations.AddField(
+            model_name="report",
+            name="version",
+            field=models.BigIntegerField(
+                default=apps.radiology.models.new_version, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="version",
+            field=models.BigIntegerField(
+                default=apps.radiology.models.new_version, editable=False
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scan",
+            index=models.Index(
+                models.OrderBy(
+                    django.db.models.functions.comparison.Coalesce(
+                        models.F("ai_malignant_prob"), models.Value(-1.0)
+                    ),
+                    descending=True,
+                ),
+                models.F("created_at"),
+                models.F("id"),
+                condition=models.Q(("is_reported", False)),
+                name="radiology_scan_triage_idx",
+            ),
+        ),
+    ]
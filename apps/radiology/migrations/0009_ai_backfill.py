@@ -0,0 +1,124 @@
+# Generated by Django 6.0 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_model_names(apps, schema_editor):
+    # Model of the last finished job; older scans predate jobs and resnet50 was the only model then
+    Scan = apps.get_model("radiology", "Scan")
+    InferenceJob = apps.get_model("radiology", "InferenceJob")
+    latest = InferenceJob.objects.filter(scan=OuterRef("pk"), status="DONE").order_by(
+        "-finished_at", "-id"
+    )
+    Scan.objects.filter(ai_generated=True).update(
+        ai_model_name=Coalesce(
+            Subquery(latest.values("model_name")[:1]), Value("resnet50")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0008_payload_versions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scan",
+            name="ai_model_name",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(populate_model_names, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="AIBackfill",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model_name", models.CharField(max_length=100)),
+                ("created_from", models.DateField(blank=True, null=True)),
+                ("created_to", models.DateField(blank=True, null=True)),
+                (
+                    "scan_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("MRI", "MRI"),
+                            ("CT", "CT Scan"),
+                            ("XRAY", "X-Ray"),
+                            ("MAMMOGRAM", "Mammogram"),
+                            ("OTHER", "Other"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "from_model",
+                    models.CharField(
+                        blank=True,
+                        help_text="Only scans last scored by this model",
+                        max_length=100,
+                    ),
+                ),
+                (
+                    "force",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Also re-score scans already on model_name, bypassing the prediction cache",
+                    ),
+                ),
+                ("concurrency", models.PositiveSmallIntegerField(default=4)),
+                (
+                    "max_rate",
+                    models.FloatField(
+                        default=0, help_text="Scans per second, 0 for no limit"
+                    ),
+                ),
+                ("batch_size", models.PositiveIntegerField(default=64)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("RUNNING", "Running"),
+                            ("DONE", "Done"),
+                            ("CANCELLED", "Cancelled"),
+                        ],
+                        default="PENDING",
+                        max_length=20,
+                    ),
+                ),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("processed", models.PositiveIntegerField(default=0)),
+                ("succeeded", models.PositiveIntegerField(default=0)),
+                ("failed", models.PositiveIntegerField(default=0)),
+                ("last_scan_id", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_predictions(apps, schema_editor):
+    # Each scored scan's current result becomes its first (and active) prediction
+    Scan = apps.get_model("radiology", "Scan")
+    ScanPrediction = apps.get_model("radiology", "ScanPrediction")
+    scans = (
+        Scan.objects.filter(ai_generated=True, ai_predicted_class__isnull=False)
+        .exclude(ai_predicted_class="")
+        .order_by("pk")
+    )
+    last_id = 0
+    while True:
+        batch = list(
+            scans.filter(pk__gt=last_id).only(
+                "id",
+                "created_at",
+                "ai_model_name",
+                "ai_predicted_class",
+                "ai_confidence",
+                "ai_benign_prob",
+                "ai_malignant_prob",
+            )[:2000]
+        )
+        if not batch:
+            return
+        ScanPrediction.objects.bulk_create(
+            [
+                ScanPrediction(
+                    scan_id=scan.pk,
+                    model_name=scan.ai_model_name or "resnet50",
+                    predicted_class=scan.ai_predicted_class,
+                    confidence=scan.ai_confidence or 0,
+                    benign_prob=scan.ai_benign_prob or 0,
+                    malignant_prob=scan.ai_malignant_prob or 0,
+                    scored_at=scan.created_at,
+                )
+                for scan in batch
+            ]
+        )
+        ids = dict(
+            ScanPrediction.objects.filter(scan__in=batch).values_list("scan_id", "pk")
+        )
+        for scan in batch:
+            scan.ai_prediction_id = ids[scan.pk]
+        Scan.objects.bulk_update(batch, ["ai_prediction"])
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("radiology", "0009_ai_backfill"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aibackfill",
+            name="activate",
+            field=models.BooleanField(
+                default=True,
+                help_text="Make the new predictions active; otherwise only record them (see ScanPrediction.activate_model)",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="aibackfill",
+            name="force",
+            field=models.BooleanField(
+                default=False,
+                help_text="Also re-score scans model_name already scored, bypassing the prediction cache",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ScanPrediction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model_name", models.CharField(max_length=100)),
+                ("model_version", models.CharField(blank=True, max_length=50)),
+                ("predicted_class", models.CharField(max_length=50)),
+                ("confidence", models.FloatField()),
+                ("benign_prob", models.FloatField()),
+                ("malignant_prob", models.FloatField()),
+                ("scored_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "scan",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="predictions",
+                        to="radiology.scan",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="ai_prediction",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="radiology.scanprediction",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scanprediction",
+            index=models.Index(
+                fields=["model_name", "scan"], name="radiology_prediction_model_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="scanprediction",
+            constraint=models.UniqueConstraint(
+                fields=("scan", "model_name", "model_version"),
+                name="radiology_prediction_key",
+            ),
+        ),
+        migrations.RunPython(copy_predictions, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,34 @@
-from django.db import models
+from collections import Counter
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from apps.users.models import Patient, Radiologist
-from .ai_service import ai_service
+from .ai_service import ai_service, CONFIG
+from . import derivatives, prediction_cache, rollups, search
+import logging
 import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def new_version():
+    """
+    Stored on Scan/Report whenever their serialized payload changes; the payload
+    cache and the ETags key on it, so old entries are never served again. Being a
+    nanosecond timestamp, it also gives the Last-Modified header.
+    """
+    return time.time_ns()
+
+
+# Worklist sort key: malignancy probability, scans still waiting for AI last
+WORKLIST_PRIORITY = Coalesce(F('ai_malignant_prob'), Value(-1.0))
+
 
 class Scan(models.Model):
     SCAN_TYPES = [
@@ -12,87 +39,788 @@ class Scan(models.Model):
         ('OTHER', 'Other'),
     ]
 
+    # AI status choices
+    AI_PENDING = 'PENDING'
+    AI_PROCESSING = 'PROCESSING'
+    AI_COMPLETED = 'COMPLETED'
+    AI_FAILED = 'FAILED'
+
+    AI_STATUS_CHOICES = [
+        (AI_PENDING, 'Pending'),
+        (AI_PROCESSING, 'Processing'),
+        (AI_COMPLETED, 'Completed'),
+        (AI_FAILED, 'Failed'),
+    ]
+
+    AI_RESULT_FIELDS = [
+        'ai_status', 'ai_generated', 'ai_predicted_class',
+        'ai_confidence', 'ai_benign_prob', 'ai_malignant_prob', 'ai_model_name', 'ai_prediction',
+    ]
+
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='scans')
     image = models.ImageField(upload_to='scans/%Y/%m/%d/')
+    image_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     scan_type = models.CharField(max_length=20, choices=SCAN_TYPES, default='MAMMOGRAM')
     title = models.CharField(max_length=200, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     # AI Fields
+    ai_status = models.CharField(max_length=20, choices=AI_STATUS_CHOICES, blank=True)
     ai_generated = models.BooleanField(default=False)
     ai_predicted_class = models.CharField(max_length=50, blank=True, null=True)
     ai_confidence = models.FloatField(null=True, blank=True)
     ai_benign_prob = models.FloatField(null=True, blank=True)
     ai_malignant_prob = models.FloatField(null=True, blank=True)
+    # Model that produced the AI fields, for re-scoring after model upgrades (see backfill.py)
+    ai_model_name = models.CharField(max_length=100, blank=True)
+    # The ai_* fields above are a copy of this prediction (see ScanPrediction)
+    ai_prediction = models.ForeignKey(
+        'ScanPrediction', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+
+    # Weighted title/patient name/description, maintained by signals (see search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Worklist: set once the report is final (kept in sync by signals), plus a
+    # time-limited claim so two radiologists don't read the same study
+    is_reported = models.BooleanField(default=False)
+    claimed_by = models.ForeignKey(
+        Radiologist, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_scans'
+    )
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    # Changes with every write to the scan or its report (see new_version)
+    version = models.BigIntegerField(default=new_version, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: (created_at, id) for everyone, prefixed by patient for patients
+            models.Index(fields=['created_at', 'id'], name='radiology_scan_created_idx'),
+            models.Index(fields=['patient', 'created_at', 'id'], name='radiology_scan_patient_idx'),
+            GinIndex(fields=['search_vector'], name='radiology_scan_search_idx'),
+            # Worklist order over unreported scans only, so it stays small as reports are finalised.
+            # Pending scans sort last via COALESCE, which (unlike NULLS LAST) every backend can index.
+            models.Index(
+                WORKLIST_PRIORITY.desc(), F('created_at'), F('id'),
+                name='radiology_scan_triage_idx', condition=Q(is_reported=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.scan_type} for {self.patient} - {self.created_at.strftime('%Y-%m-%d')}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the rollup dimensions as loaded, so a save can move the scan between buckets
+        if not {'created_at', 'scan_type', 'ai_predicted_class'} & instance.get_deferred_fields():
+            instance._rollup_fields = instance.rollup_fields()
+        return instance
+
+    def rollup_fields(self):
+        return (self.created_at, self.scan_type, self.ai_predicted_class)
+
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        if self.image and not self.image._committed:
+            # New or replaced upload: hash while it is still in memory, so the
+            # prediction cache and derivative paths never have to re-read it
+            self.image_sha256 = prediction_cache.hash_image(self.image)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'image' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'image_sha256'}
+        self.version = new_version()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
         super().save(*args, **kwargs)
+
+        if is_new and self.image and getattr(settings, 'SCAN_DERIVATIVES_AT_INGEST', False):
+            transaction.on_commit(lambda: derivatives.generate_at_ingest(self))
         
-        # Trigger AI prediction if it's a new scan and has an image
+        # Queue AI prediction if it's a new scan and has an image.
+        # The actual call to the AI service happens in the inference worker,
+        # unless the same image was already scored by the default model.
         if is_new and self.image:
-            self.run_ai_prediction()
+            if not self.apply_cached_ai_result():
+                self.queue_ai_prediction()
+
+    def queue_ai_prediction(self, model_name=None, use_cache=True):
+        """Enqueue an inference job for this scan and return it"""
+        return InferenceJob.enqueue(self, model_name=model_name, use_cache=use_cache)
+
+    def apply_cached_ai_result(self, model_name=None):
+        """Fill the AI fields from the prediction cache; returns True on a hit"""
+        model_name = model_name or CONFIG['default_model']
+        result = prediction_cache.lookup(self.image_sha256, model_name)
+        if result is None:
+            return False
+        self.apply_ai_result(result, model_name)
+        return True
 
-    def run_ai_prediction(self):
+    def run_ai_prediction(self, model_name=None, use_cache=True):
+        """
+        Calls the AI service synchronously and stores the result.
+        Returns True when a prediction was saved.
+
+        The HTTP call must not run inside a transaction: it would pin a pooled
+        connection for the whole round trip. Only the write-back is atomic.
+        """
         if not self.image:
-            return
+            return False
+
+        if transaction.get_connection().in_atomic_block:
+            logger.warning("AI prediction for scan %s is running inside a transaction", self.pk)
 
         try:
             # Get absolute path for the image
             image_path = self.image.path
             if os.path.exists(image_path):
-                print(f"Running AI prediction for scan {self.pk}...")
-                result = ai_service.predict(image_path)
+                if not self.image_sha256:
+                    # Scans uploaded before hashing was introduced
+                    self.image_sha256 = prediction_cache.hash_image(image_path)
+                    self.save(update_fields=['image_sha256'])
+
+                logger.debug("Running AI prediction for scan %s", self.pk)
+                result = ai_service.predict(
+                    image_path, model_name=model_name,
+                    image_hash=self.image_sha256, use_cache=use_cache,
+                )
                 
                 if result:
-                    self.ai_generated = True
-                    self.ai_predicted_class = result['predicted_class']
-                    self.ai_confidence = result['confidence']
-                    self.ai_benign_prob = result['benign_probability']
-                    self.ai_malignant_prob = result['malignant_probability']
-                    self.save(update_fields=[
-                        'ai_generated', 'ai_predicted_class', 
-                        'ai_confidence', 'ai_benign_prob', 'ai_malignant_prob'
-                    ])
-                    print(f"AI Prediction saved: {result}")
-                    
-                    # Create or Update Linked Report
-                    # We use 'defaults' to set fields only on creation, but maybe we want to overwrite if AI re-runs?
-                    # Let's assume re-running AI should update the draft report if it's not final.
-                    
-                    report_content = (
-                        f"Automated AI Analysis:\n"
-                        f"- Predicted Diagnosis: {result['predicted_class']}\n"
-                        f"- Confidence Level: {result['confidence']}%\n"
-                        f"- Malignancy Probability: {result['malignant_probability']}%\n"
-                        f"- Benign Probability: {result['benign_probability']}%\n\n"
-                        f"This is a preliminary automated finding. Please review."
-                    )
-                    
-                    impression_summary = f"AI Prediction: {result['predicted_class']} ({result['confidence']}%)"
-
-                    report, created = Report.objects.get_or_create(
-                        scan=self,
-                        defaults={
-                            'content': report_content,
-                            'impression': impression_summary,
-                            'is_final': False
-                        }
-                    )
-                    
-                    if not created and not report.is_final:
-                        # If report exists and is NOT final, update it with new AI result
-                        report.content = report_content
-                        report.impression = impression_summary
-                        report.save()
+                    self.apply_ai_result(result, model_name)
+                    logger.info("AI prediction saved for scan %s: %s", self.pk, result)
+                    return True
             else:
-                print(f"Image not found at {image_path}")
+                logger.warning("Image not found at %s", image_path)
+        except Exception:
+            logger.exception("Failed to run AI prediction for scan %s", self.pk)
+        return False
+
+    @classmethod
+    def bulk_ingest(cls, scans, queue_ai=True, model_name=None):
+        """
+        bulk_create unsaved scans whose image is already in storage and whose
+        image_sha256 is set (see import_scans). No save() or signals run, so this
+        does their work: version, search vector, rollups and, with `queue_ai`, one
+        inference job per scan for the worker. Returns the created scans.
+        """
+        version = new_version()
+        for scan in scans:
+            scan.version = version
+            scan.ai_status = cls.AI_PENDING if queue_ai else ''
+
+        with transaction.atomic():
+            scans = cls.objects.bulk_create(scans)
+            search.refresh(cls.objects.filter(pk__in=[scan.pk for scan in scans]))
+            deltas = Counter()
+            for scan in scans:
+                scan._rollup_fields = scan.rollup_fields()
+                rollups.move(deltas, None, rollups.bucket(scan._rollup_fields, rollups.NO_REPORT))
+            rollups.apply(deltas)
+            if queue_ai:
+                model_name = model_name or CONFIG['default_model']
+                InferenceJob.objects.bulk_create([InferenceJob(scan=scan, model_name=model_name) for scan in scans])
+        return scans
+
+    @classmethod
+    def worklist(cls, radiologist=None):
+        """
+        Scans without a final report, most likely malignant first, then oldest first.
+        With a radiologist, scans claimed by someone else are left out.
+        """
+        scans = cls.objects.filter(is_reported=False)
+        if radiologist is not None:
+            scans = scans.filter(cls._claimable(radiologist))
+        return scans.order_by(WORKLIST_PRIORITY.desc(), 'created_at', 'id')
+
+    @staticmethod
+    def _claimable(radiologist):
+        return Q(claimed_by__isnull=True) | Q(claimed_until__lt=timezone.now()) | Q(claimed_by=radiologist)
+
+    @classmethod
+    def claim_next(cls, radiologist, count=1):
+        """
+        Claim the next `count` worklist scans for `radiologist`. Rows another
+        radiologist is claiming concurrently are skipped rather than waited on.
+        """
+        with transaction.atomic():
+            ids = list(
+                cls.worklist(radiologist).exclude(claimed_by=radiologist, claimed_until__gte=timezone.now())
+                .select_for_update(skip_locked=True, of=('self',))
+                .values_list('pk', flat=True)[:count]
+            )
+            cls._set_claim(cls.objects.filter(pk__in=ids), radiologist)
+        return ids
+
+    def claim(self, radiologist):
+        """Claim (or extend the claim on) this scan; False if it's reported or held by someone else"""
+        scans = Scan.objects.filter(pk=self.pk, is_reported=False).filter(self._claimable(radiologist))
+        return self._set_claim(scans, radiologist) == 1
+
+    def release(self, radiologist):
+        return Scan.objects.filter(pk=self.pk, claimed_by=radiologist).update(claimed_by=None, claimed_until=None) == 1
+
+    @staticmethod
+    def _set_claim(scans, radiologist):
+        until = timezone.now() + timedelta(seconds=settings.WORKLIST_CLAIM_TTL)
+        return scans.update(claimed_by=radiologist, claimed_until=until)
+
+    def apply_ai_result(self, result, model_name=None):
+        """Write an AI result and the linked draft report in one short transaction"""
+        Scan.bulk_apply_ai_results([(self, result)], model_name)
+
+    @classmethod
+    def bulk_apply_ai_results(cls, pairs, model_name=None, activate=True):
+        """
+        Record AI results in the scans' prediction history (ScanPrediction) and,
+        with `activate`, make them the active predictions (see activate_predictions).
+        `pairs` is an iterable of (scan, result dict); empty results are skipped.
+        `model_name` (default: the default model) produced the results.
+        """
+        # One result per scan, the last one wins
+        pairs = list({scan.pk: (scan, result) for scan, result in pairs if result}.values())
+        if not pairs:
+            return
+        with transaction.atomic():
+            predictions = ScanPrediction.record(pairs, model_name or CONFIG['default_model'])
+            if activate:
+                cls.activate_predictions(zip([scan for scan, _ in pairs], predictions))
+
+    @classmethod
+    def activate_predictions(cls, pairs):
+        """
+        Copy predictions into the scans' ai_* columns with a single bulk_update, and
+        create or refresh their draft reports. Final reports are never touched.
+        `pairs` is an iterable of (scan, ScanPrediction).
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return
+
+        # Rollup buckets the scans are leaving; scans that weren't loaded from the db are looked up
+        previous = {scan.pk: getattr(scan, '_rollup_fields', None) for scan, _ in pairs}
+        missing = [pk for pk, fields in previous.items() if fields is None]
+        for pk, *fields in cls.objects.filter(pk__in=missing).values_list(
+            'pk', 'created_at', 'scan_type', 'ai_predicted_class'
+        ):
+            previous[pk] = tuple(fields)
+
+        version = new_version()
+        for scan, prediction in pairs:
+            scan.version = version
+            scan.ai_prediction = prediction
+            scan.ai_model_name = prediction.model_name
+            scan.ai_status = Scan.AI_COMPLETED
+            scan.ai_generated = True
+            scan.ai_predicted_class = prediction.predicted_class
+            scan.ai_confidence = prediction.confidence
+            scan.ai_benign_prob = prediction.benign_prob
+            scan.ai_malignant_prob = prediction.malignant_prob
+
+        with transaction.atomic():
+            cls.objects.bulk_update([scan for scan, _ in pairs], cls.AI_RESULT_FIELDS + ['version'])
+
+            # Create or Update Linked Reports
+            # Re-running AI updates the draft report, but never a final one.
+            reports = {report.scan_id: report for report in Report.objects.filter(scan__in=[scan.pk for scan, _ in pairs])}
+            now = timezone.now()
+            to_create, to_update = [], []
+            deltas = Counter()
+            for scan, prediction in pairs:
+                content, impression = Report.ai_draft_text(prediction.as_result())
+                report = reports.get(scan.pk)
+                if report is None:
+                    # Moved between rollup buckets once we know the insert went through
+                    to_create.append(Report(
+                        scan=scan, content=content, impression=impression, is_final=False, version=version
+                    ))
+                    continue
+                state = rollups.report_state(report.is_final)
+                rollups.move(deltas, rollups.bucket(previous[scan.pk], state), rollups.bucket(scan.rollup_fields(), state))
+                scan._rollup_fields = scan.rollup_fields()
+                if not report.is_final:
+                    report.content = content
+                    report.impression = impression
+                    report.updated_at = now
+                    report.version = version
+                    to_update.append(report)
+
+            # A radiologist may have created the report in the meantime; theirs wins
+            Report.objects.bulk_create(to_create, ignore_conflicts=True)
+            if to_create:
+                inserted, others = set(), {}
+                for scan_id, report_version, is_final in Report.objects.filter(
+                    scan__in=[report.scan_id for report in to_create]
+                ).values_list('scan_id', 'version', 'is_final'):
+                    if report_version == version:
+                        inserted.add(scan_id)
+                    else:
+                        others[scan_id] = rollups.report_state(is_final)
+                for report in to_create:
+                    scan = report.scan
+                    if scan.pk in inserted:
+                        old_state, new_state = rollups.NO_REPORT, rollups.DRAFT
+                    else:
+                        # The other report's post_save already moved the scan out of NO_REPORT
+                        old_state = new_state = others.get(scan.pk, rollups.NO_REPORT)
+                    rollups.move(
+                        deltas, rollups.bucket(previous[scan.pk], old_state), rollups.bucket(scan.rollup_fields(), new_state)
+                    )
+                    scan._rollup_fields = scan.rollup_fields()
+            Report.objects.bulk_update(to_update, ['content', 'impression', 'updated_at', 'version'])
+            rollups.apply(deltas)
+
+
+class ScanPrediction(models.Model):
+    """
+    Every model's prediction for a scan, one row per (scan, model_name, model_version).
+    The Scan ai_* columns are a denormalized copy of the active one (Scan.ai_prediction),
+    so switching models is a bulk update instead of re-running inference.
+    """
+    scan = models.ForeignKey(Scan, on_delete=models.CASCADE, related_name='predictions')
+    model_name = models.CharField(max_length=100)
+    # Reported by the service as `model_version`, if it does
+    model_version = models.CharField(max_length=50, blank=True)
+    predicted_class = models.CharField(max_length=50)
+    confidence = models.FloatField()
+    benign_prob = models.FloatField()
+    malignant_prob = models.FloatField()
+    scored_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scan', 'model_name', 'model_version'], name='radiology_prediction_key'),
+        ]
+        indexes = [
+            # activate_model walks one model's predictions in scan order
+            models.Index(fields=['model_name', 'scan'], name='radiology_prediction_model_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name}{' ' + self.model_version if self.model_version else ''} prediction for Scan {self.scan_id}"
+
+    def as_result(self):
+        """The AI service's result dict"""
+        return {
+            'predicted_class': self.predicted_class,
+            'confidence': self.confidence,
+            'benign_probability': self.benign_prob,
+            'malignant_probability': self.malignant_prob,
+        }
+
+    @classmethod
+    def record(cls, pairs, model_name):
+        """Upsert one prediction per (scan, result dict); returns them in order, saved"""
+        now = timezone.now()
+        predictions = [
+            cls(
+                scan=scan, model_name=model_name, model_version=str(result.get('model_version') or ''),
+                predicted_class=result['predicted_class'], confidence=result['confidence'],
+                benign_prob=result['benign_probability'], malignant_prob=result['malignant_probability'],
+                scored_at=now,
+            )
+            for scan, result in pairs
+        ]
+        cls.objects.bulk_create(
+            predictions, update_conflicts=True, unique_fields=['scan', 'model_name', 'model_version'],
+            update_fields=['predicted_class', 'confidence', 'benign_prob', 'malignant_prob', 'scored_at'],
+        )
+        if any(prediction.pk is None for prediction in predictions):
+            # Backends that don't return ids from an upsert
+            ids = {
+                (scan_id, model_version): pk for pk, scan_id, model_version in cls.objects.filter(
+                    scan__in=[prediction.scan_id for prediction in predictions], model_name=model_name
+                ).values_list('pk', 'scan_id', 'model_version')
+            }
+            for prediction in predictions:
+                prediction.pk = ids[(prediction.scan_id, prediction.model_version)]
+        return predictions
+
+    @classmethod
+    def activate_model(cls, model_name, model_version=None, scans=None, chunk_size=1000):
+        """
+        Make `model_name` (its newest prediction, or `model_version`) the active
+        prediction of every scan in `scans` that has one, `chunk_size` scans per
+        bulk update. No AI calls; returns the number of scans switched.
+        """
+        predictions = cls.objects.filter(model_name=model_name)
+        if model_version is not None:
+            predictions = predictions.filter(model_version=model_version)
+        if scans is not None:
+            predictions = predictions.filter(scan__in=scans)
+
+        switched, last_id = 0, 0
+        while True:
+            ids = list(
+                predictions.filter(scan_id__gt=last_id).order_by('scan_id')
+                .values_list('scan_id', flat=True).distinct()[:chunk_size]
+            )
+            if not ids:
+                return switched
+            newest = {}
+            for prediction in predictions.filter(scan_id__in=ids).order_by('scan_id', 'scored_at', 'id'):
+                newest[prediction.scan_id] = prediction
+            chunk = Scan.objects.only('id', 'created_at', 'scan_type', 'ai_predicted_class', 'ai_prediction').in_bulk(ids)
+            pairs = [
+                (chunk[scan_id], prediction) for scan_id, prediction in newest.items()
+                if chunk[scan_id].ai_prediction_id != prediction.pk
+            ]
+            Scan.activate_predictions(pairs)
+            switched += len(pairs)
+            last_id = ids[-1]
+
+
+class InferenceJob(models.Model):
+    """
+    DB-backed queue of AI predictions. Rows are claimed by the
+    `run_ai_worker` management command using SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Base delay between retries, doubled on every failed attempt
+    RETRY_DELAY = timedelta(seconds=30)
+
+    scan = models.ForeignKey(Scan, on_delete=models.CASCADE, related_name='inference_jobs')
+    model_name = models.CharField(max_length=100)
+    use_cache = models.BooleanField(default=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only pending jobs are ever polled, keep the claim index small
+            models.Index(
+                fields=['run_after', 'id'],
+                condition=Q(status='PENDING'),
+                name='radiology_job_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"InferenceJob {self.pk} for Scan {self.scan_id} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, scan, model_name=None, use_cache=True):
+        if model_name is None:
+            model_name = CONFIG['default_model']
+
+        # Re-use an already queued job instead of stacking duplicates
+        job = cls.objects.filter(scan=scan, model_name=model_name, use_cache=use_cache, status=cls.PENDING).first()
+        if job is None:
+            job = cls.objects.create(scan=scan, model_name=model_name, use_cache=use_cache)
+
+        scan.version = new_version()
+        Scan.objects.filter(pk=scan.pk).update(ai_status=Scan.AI_PENDING, version=scan.version)
+        scan.ai_status = Scan.AI_PENDING
+
+        if getattr(settings, 'AI_INFERENCE_INLINE', False):
+            # No worker deployment (e.g. local dev): run the job in-process,
+            # but only once the scan row has been committed.
+            transaction.on_commit(job.run_now)
+        return job
+
+    @classmethod
+    def claim(cls, limit=1):
+        """Atomically claim up to `limit` due jobs; concurrent workers skip each other's rows"""
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                cls.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('scan')
+                .filter(status=cls.PENDING, run_after__lte=now)
+                .order_by('run_after', 'id')[:limit]
+            )
+            if not jobs:
+                return []
+
+            ids = [job.pk for job in jobs]
+            cls.objects.filter(pk__in=ids).update(
+                status=cls.RUNNING, started_at=now, attempts=F('attempts') + 1
+            )
+            Scan.objects.filter(inference_jobs__in=ids).update(ai_status=Scan.AI_PROCESSING, version=new_version())
+
+        for job in jobs:
+            job.status = cls.RUNNING
+            job.started_at = now
+            job.attempts += 1
+        return jobs
+
+    @classmethod
+    def requeue_stale(cls, older_than):
+        """Put RUNNING jobs abandoned by a crashed worker back on the queue"""
+        cutoff = timezone.now() - older_than
+        return cls.objects.filter(status=cls.RUNNING, started_at__lt=cutoff).update(
+            status=cls.PENDING, run_after=timezone.now()
+        )
+
+    def start(self):
+        """Claim this particular job for the current process; False if a worker picked it up first"""
+        claimed = InferenceJob.objects.filter(pk=self.pk, status=InferenceJob.PENDING).update(
+            status=InferenceJob.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            self.refresh_from_db()
+        return bool(claimed)
+
+    def run_now(self):
+        """Claim and run this particular job in the current process"""
+        if not self.start():
+            return
+        try:
+            self.run()
         except Exception as e:
-            print(f"Failed to run AI prediction: {e}")
+            self.mark_failed(e)
+
+    def run(self):
+        if not ai_service.is_available():
+            if self.use_cache and self.scan.apply_cached_ai_result(self.model_name):
+                self.mark_done()
+            else:
+                # Don't burn attempts while the AI backend is down
+                self.defer(ai_service.retry_after())
+        elif self.scan.run_ai_prediction(model_name=self.model_name, use_cache=self.use_cache):
+            self.mark_done()
+        else:
+            self.give_up_attempt()
+
+    def finish(self, result):
+        """Store the result of a prediction made outside run() (e.g. by an async view)"""
+        if result:
+            self.scan.apply_ai_result(result, self.model_name)
+            self.mark_done()
+        else:
+            self.give_up_attempt()
+
+    def give_up_attempt(self):
+        """No result: wait for the breaker if the service is down, otherwise count a failure"""
+        if not ai_service.is_available():
+            self.defer(ai_service.retry_after())
+        else:
+            self.mark_failed('AI prediction did not return a result')
+
+    @classmethod
+    def run_batch(cls, jobs):
+        """Run claimed jobs through AIService.predict_batch and write the results in bulk"""
+        groups = {}
+        for job in jobs:
+            groups.setdefault((job.model_name, job.use_cache), []).append(job)
+
+        for (model_name, use_cache), group in groups.items():
+            items, runnable = [], []
+            for job in group:
+                scan = job.scan
+                image_path = scan.image.path if scan.image else None
+                if not image_path or not os.path.exists(image_path):
+                    job.mark_failed(f"Image not found at {image_path}")
+                    continue
+                if not scan.image_sha256:
+                    scan.image_sha256 = prediction_cache.hash_image(image_path)
+                    Scan.objects.filter(pk=scan.pk).update(image_sha256=scan.image_sha256)
+                items.append((job.pk, image_path, scan.image_sha256))
+                runnable.append(job)
+
+            if not runnable:
+                continue
+
+            try:
+                results = ai_service.predict_batch(items, model_name=model_name, use_cache=use_cache)
+                done = [job for job in runnable if results.get(job.pk)]
+                Scan.bulk_apply_ai_results(((job.scan, results[job.pk]) for job in done), model_name)
+            except Exception as e:
+                for job in runnable:
+                    job.mark_failed(e)
+                continue
+
+            now = timezone.now()
+            cls.objects.filter(pk__in=[job.pk for job in done]).update(status=cls.DONE, finished_at=now, last_error='')
+            for job in done:
+                job.status, job.finished_at, job.last_error = cls.DONE, now, ''
+
+            for job in runnable:
+                if job.status == cls.DONE:
+                    continue
+                if not ai_service.is_available():
+                    job.defer(ai_service.retry_after())
+                else:
+                    job.mark_failed('AI prediction did not return a result')
+
+    def defer(self, delay):
+        """Return the job to the queue without counting the attempt; the scan stays AI pending"""
+        self.status = InferenceJob.PENDING
+        self.attempts = max(0, self.attempts - 1)
+        self.run_after = timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['status', 'attempts', 'run_after'])
+        Scan.objects.filter(pk=self.scan_id).update(ai_status=Scan.AI_PENDING, version=new_version())
+
+    def mark_done(self):
+        self.status = InferenceJob.DONE
+        self.finished_at = timezone.now()
+        self.last_error = ''
+        self.save(update_fields=['status', 'finished_at', 'last_error'])
+
+    def mark_failed(self, error):
+        self.last_error = str(error)
+        if self.attempts < self.max_attempts:
+            # Back off and let a later poll pick it up again
+            self.status = InferenceJob.PENDING
+            self.run_after = timezone.now() + self.RETRY_DELAY * (2 ** (self.attempts - 1))
+            scan_status = Scan.AI_PENDING
+        else:
+            self.status = InferenceJob.FAILED
+            self.finished_at = timezone.now()
+            scan_status = Scan.AI_FAILED
+
+        self.save(update_fields=['status', 'run_after', 'finished_at', 'last_error'])
+        Scan.objects.filter(pk=self.scan_id).update(ai_status=scan_status, version=new_version())
+
+
+class CachedPrediction(models.Model):
+    """AI result for a given image content and model, see prediction_cache.py"""
+    image_sha256 = models.CharField(max_length=64)
+    model_name = models.CharField(max_length=100)
+    result = models.JSONField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image_sha256', 'model_name'], name='radiology_cached_prediction_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} prediction for {self.image_sha256[:12]}"
+
+
+class AIBackfill(models.Model):
+    """
+    Re-scoring of a filtered set of scans against `model_name`, run by
+    `manage.py backfill_ai` (see backfill.py). Scans are processed in id order and
+    `last_scan_id` is the checkpoint, so an interrupted run resumes where it stopped.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    CANCELLED = 'CANCELLED'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    model_name = models.CharField(max_length=100)
+    # Filters; empty means any
+    created_from = models.DateField(null=True, blank=True)
+    created_to = models.DateField(null=True, blank=True)
+    scan_type = models.CharField(max_length=20, choices=Scan.SCAN_TYPES, blank=True)
+    from_model = models.CharField(max_length=100, blank=True, help_text="Only scans last scored by this model")
+    force = models.BooleanField(
+        default=False, help_text="Also re-score scans model_name already scored, bypassing the prediction cache"
+    )
+    activate = models.BooleanField(
+        default=True, help_text="Make the new predictions active; otherwise only record them (see ScanPrediction.activate_model)"
+    )
+
+    concurrency = models.PositiveSmallIntegerField(default=4)
+    max_rate = models.FloatField(default=0, help_text="Scans per second, 0 for no limit")
+    batch_size = models.PositiveIntegerField(default=64)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    last_scan_id = models.BigIntegerField(default=0)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Heartbeat: bumped after every batch, a stale RUNNING row is resumable
+    updated_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"AIBackfill {self.pk} to {self.model_name} ({self.status})"
+
+    def scans(self):
+        """Scans this backfill re-scores, including ones already processed"""
+        scans = Scan.objects.exclude(image='')
+        if self.created_from:
+            scans = scans.filter(created_at__gte=_day_start(self.created_from))
+        if self.created_to:
+            scans = scans.filter(created_at__lt=_day_start(self.created_to + timedelta(days=1)))
+        if self.scan_type:
+            scans = scans.filter(scan_type=self.scan_type)
+        if self.from_model:
+            scans = scans.filter(ai_model_name=self.from_model)
+        if not self.force:
+            scans = scans.exclude(Exists(ScanPrediction.objects.filter(scan=OuterRef('pk'), model_name=self.model_name)))
+        return scans
+
+    @property
+    def rate(self):
+        """Scans per second since the run started"""
+        if not self.started_at or not self.processed:
+            return None
+        end = self.finished_at or self.updated_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return self.processed / elapsed if elapsed > 0 else None
+
+    @property
+    def eta_seconds(self):
+        if self.status == self.DONE:
+            return 0
+        rate = self.rate
+        if not rate:
+            return None
+        return max(0, self.total - self.processed) / rate
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+class ScanRollup(models.Model):
+    """Scan counts per day and dimension, maintained incrementally (see rollups.py)"""
+    REPORT_STATES = [
+        (rollups.NO_REPORT, 'No report'),
+        (rollups.DRAFT, 'Draft'),
+        (rollups.FINAL, 'Final'),
+    ]
+
+    day = models.DateField()
+    scan_type = models.CharField(max_length=20, choices=Scan.SCAN_TYPES)
+    ai_predicted_class = models.CharField(max_length=50, blank=True)
+    report_state = models.CharField(max_length=10, choices=REPORT_STATES)
+    scans = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'scan_type', 'ai_predicted_class', 'report_state'], name='radiology_scan_rollup_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.scan_type}/{self.ai_predicted_class or '-'}/{self.report_state}: {self.scans}"
 
 
 class Report(models.Model):
@@ -103,6 +831,39 @@ class Report(models.Model):
     is_final = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=new_version, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='radiology_report_created_idx'),
+        ]
 
     def __str__(self):
         return f"Report for Scan {self.scan.pk} by {self.radiologist}"
+
+    def save(self, *args, **kwargs):
+        self.version = new_version()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'is_final' not in instance.get_deferred_fields():
+            instance._rollup_final = instance.is_final
+        return instance
+
+    @staticmethod
+    def ai_draft_text(result):
+        """(content, impression) of the draft report written for an AI result"""
+        report_content = (
+            f"Automated AI Analysis:\n"
+            f"- Predicted Diagnosis: {result['predicted_class']}\n"
+            f"- Confidence Level: {result['confidence']}%\n"
+            f"- Malignancy Probability: {result['malignant_probability']}%\n"
+            f"- Benign Probability: {result['benign_probability']}%\n\n"
+            f"This is a preliminary automated finding. Please review."
+        )
+        impression_summary = f"AI Prediction: {result['predicted_class']} ({result['confidence']}%)"
+        return report_content, impression_summary
@@ -0,0 +1,137 @@
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (ordering field, id).
+
+    The cursor stores the sort key of the last row seen, so any page is a single
+    index range scan: `WHERE (created_at, id) < (:c, :id) ORDER BY created_at DESC, id DESC LIMIT n`.
+    The id tie-breaker keeps the order stable when timestamps collide. The sort
+    field follows the view's OrderingFilter (`?ordering=created_at` / `-created_at`).
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering_param = 'ordering'
+    default_ordering = '-created_at'
+
+    # Fields usable as keyset, with the parser for their cursor value
+    cursor_fields = {
+        'created_at': parse_datetime,
+        'search_rank': float,
+    }
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'RADIOLOGY_PAGE_SIZE', 50)
+        try:
+            requested = int(request.query_params.get(self.page_size_query_param, page_size))
+        except ValueError:
+            return page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        """
+        (field, descending) from the ordering param, limited to the view's ordering_fields.
+        Searches without an explicit ordering are ranked best match first.
+        """
+        allowed = set(getattr(view, 'ordering_fields', None) or []) & set(self.cursor_fields)
+        requested = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if requested.lstrip('-') in allowed:
+            term = requested
+        elif 'search_rank' in queryset.query.annotations:
+            term = '-search_rank'
+        else:
+            term = getattr(view, 'ordering', None) or self.default_ordering
+        return term.lstrip('-'), term.startswith('-')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['r'])
+
+        # Walking backwards (previous page) flips both the comparison and the sort
+        descending = self.descending != self.reverse
+        if cursor:
+            op = 'lt' if descending else 'gt'
+            value = cursor['v']
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'id__{op}': cursor['id']})
+            )
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        self.has_next = (not self.reverse and has_more) or (self.reverse and bool(cursor))
+        self.has_previous = (self.reverse and has_more) or (not self.reverse and bool(cursor))
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self._link(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link(self.rows[0], reverse=True)
+
+    def _link(self, row, reverse):
+        value = getattr(row, self.field)
+        payload = {
+            'v': value.isoformat() if hasattr(value, 'isoformat') else value,
+            'id': row.pk,
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value = self.cursor_fields[self.field](payload['v'])
+            if value is None:
+                raise ValueError
+            return {'v': value, 'id': int(payload['id']), 'r': bool(payload.get('r'))}
+        except (TypeError, ValueError, KeyError, json.JSONDecodeError, binascii.Error):
+            raise NotFound('Invalid cursor')
@@ -0,0 +1,117 @@
+"""
+Cache of serialized Scan/Report payloads in Django's cache framework.
+
+Output differs by role (patients don't get report `content`) and embeds absolute
+URLs, so entries are keyed by object, its `version`, the requester's role and the
+host. Every write that changes a payload stores a new `version` on the row (see
+models.new_version), so stale entries are never read again and simply age out of
+the cache; that also holds across processes with the per-process locmem default.
+"""
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from rest_framework import serializers
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def enabled():
+    return getattr(settings, 'RADIOLOGY_PAYLOAD_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[settings.RADIOLOGY_PAYLOAD_CACHE_ALIAS]
+
+
+def variant(request):
+    """What a payload depends on besides the object: role and origin (for absolute URLs)"""
+    origin = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()[:8]
+    return f'{request.user.role}:{origin}'
+
+
+def make_key(kind, obj, request):
+    return f'radiology:{kind}:{obj.pk}:{obj.version}:{variant(request)}'
+
+
+def get_many(keys):
+    found = get_cache().get_many(keys) if keys else {}
+    with _lock:
+        _counters['hits'] += len(found)
+        _counters['misses'] += len(keys) - len(found)
+    return found
+
+
+def set_many(entries):
+    if entries:
+        get_cache().set_many(entries, timeout=settings.RADIOLOGY_PAYLOAD_CACHE_TTL)
+
+
+def stats():
+    """Hit/miss counters of this process"""
+    with _lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    with _lock:
+        _counters['hits'] = _counters['misses'] = 0
+
+
+class CachedListSerializer(serializers.ListSerializer):
+    """A page costs one get_many, plus one set_many for the misses"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        keys = [self.child.payload_key(item) for item in items]
+        if not items or None in keys:
+            return super().to_representation(items)
+        found = get_many(keys)
+        missing = {}
+        for key, item in zip(keys, items):
+            if key not in found:
+                missing[key] = self.child.uncached_representation(item)
+        set_many(missing)
+        return [found[key] if key in found else missing[key] for key in keys]
+
+
+class CachedPayloadMixin:
+    """
+    Serves `to_representation` from the payload cache for serializers with a
+    `payload_kind` (and `Meta.list_serializer_class = CachedListSerializer`).
+    Only top-level objects and list items are cached; nested serializers are
+    part of their parent's payload.
+    """
+    payload_kind = None
+
+    def payload_key(self, instance):
+        request = self.context.get('request')
+        if not (self.payload_kind and enabled() and request and getattr(request.user, 'role', None)):
+            return None
+        if self.parent is not None and not isinstance(self.parent, CachedListSerializer):
+            return None
+        if getattr(instance, 'pk', None) is None:
+            return None
+        return make_key(self.payload_kind, instance, request)
+
+    def to_representation(self, instance):
+        key = self.payload_key(instance)
+        if key is None:
+            return super().to_representation(instance)
+        found = get_many([key])
+        if key in found:
+            return found[key]
+        data = super().to_representation(instance)
+        set_many({key: data})
+        return data
+
+    def uncached_representation(self, instance):
+        return super().to_representation(instance)
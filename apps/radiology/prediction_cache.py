@@ -0,0 +1,133 @@
+"""
+Persistent cache of AI predictions keyed by SHA-256 of the image bytes and model_name.
+
+Entries live in the CachedPrediction table so every web process and worker shares
+them. They expire after AI_PREDICTION_CACHE_TTL seconds and the least recently
+used ones are evicted once the table grows past AI_PREDICTION_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def hash_image(image):
+    """SHA-256 of a file path or a Django File/FieldFile, read in chunks"""
+    digest = hashlib.sha256()
+    if isinstance(image, (str, bytes)) or hasattr(image, '__fspath__'):
+        with open(image, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+    else:
+        for chunk in image.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'AI_PREDICTION_CACHE_TTL', 30 * 24 * 3600))
+
+
+def _count(key):
+    with _lock:
+        _counters[key] += 1
+
+
+def lookup(image_hash, model_name):
+    """Return the cached result dict, or None"""
+    from .models import CachedPrediction
+
+    if not image_hash or not getattr(settings, 'AI_PREDICTION_CACHE_ENABLED', True):
+        return None
+
+    now = timezone.now()
+    entry = (
+        CachedPrediction.objects
+        .filter(image_sha256=image_hash, model_name=model_name, created_at__gte=now - _ttl())
+        .only('id', 'result')
+        .first()
+    )
+    if entry is None:
+        _count('misses')
+        return None
+
+    _count('hits')
+    CachedPrediction.objects.filter(pk=entry.pk).update(last_used_at=now, hit_count=F('hit_count') + 1)
+    return entry.result
+
+
+def lookup_many(image_hashes, model_name):
+    """Return {image_hash: result} for the hashes found in the cache"""
+    from .models import CachedPrediction
+
+    image_hashes = {h for h in image_hashes if h}
+    if not image_hashes or not getattr(settings, 'AI_PREDICTION_CACHE_ENABLED', True):
+        return {}
+
+    now = timezone.now()
+    found = dict(
+        CachedPrediction.objects
+        .filter(image_sha256__in=image_hashes, model_name=model_name, created_at__gte=now - _ttl())
+        .values_list('image_sha256', 'result')
+    )
+    with _lock:
+        _counters['hits'] += len(found)
+        _counters['misses'] += len(image_hashes) - len(found)
+    if found:
+        CachedPrediction.objects.filter(image_sha256__in=found, model_name=model_name).update(
+            last_used_at=now, hit_count=F('hit_count') + 1
+        )
+    return found
+
+
+def store(image_hash, model_name, result):
+    from .models import CachedPrediction
+
+    if not image_hash or not getattr(settings, 'AI_PREDICTION_CACHE_ENABLED', True):
+        return
+    try:
+        with transaction.atomic():
+            CachedPrediction.objects.update_or_create(
+                image_sha256=image_hash,
+                model_name=model_name,
+                defaults={'result': result, 'created_at': timezone.now(), 'last_used_at': timezone.now()},
+            )
+    except IntegrityError:
+        # Another process stored the same prediction concurrently
+        pass
+
+
+def prune():
+    """Drop expired entries, then the least recently used ones above the size limit"""
+    from .models import CachedPrediction
+
+    deleted, _ = CachedPrediction.objects.filter(created_at__lt=timezone.now() - _ttl()).delete()
+
+    max_entries = getattr(settings, 'AI_PREDICTION_CACHE_MAX_ENTRIES', 100000)
+    cutoff = (
+        CachedPrediction.objects.order_by('-last_used_at')
+        .values_list('last_used_at', flat=True)[max_entries:max_entries + 1]
+        .first()
+    )
+    if cutoff is not None:
+        evicted, _ = CachedPrediction.objects.filter(last_used_at__lte=cutoff).delete()
+        deleted += evicted
+    return deleted
+
+
+def stats():
+    """Hit/miss counters of this process"""
+    with _lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
@@ -0,0 +1,169 @@
+"""
+Optional pre-inference preprocessing (AI_PREPROCESS_ENABLED).
+
+Scan uploads are often tens of megabytes while the models only look at a small
+fixed-size input. Before an image is sent to the AI service it is decoded,
+converted to the model's color mode, downsampled so its short side matches the
+model input resolution, and re-encoded as PNG.
+
+Two artifacts are cached in a `preprocessed/` directory next to the scan image:
+
+- `<name>.base.npy`: the decoded image as an 8-bit array, downsampled to
+  AI_PREPROCESS_BASE_SIZE. Model switches resize from it instead of decoding the
+  original again.
+- `<name>.<mode>-<size>.png`: the payload for a given model input, re-used by reruns.
+"""
+import io
+import os
+import threading
+import time
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+_lock = threading.Lock()
+_counters = {
+    'images': 0,
+    'cache_hits': 0,
+    'bytes_in': 0,
+    'bytes_out': 0,
+    'seconds': 0.0,
+}
+
+
+def model_input(model_name):
+    """(mode, size) the model expects"""
+    from .ai_service import CONFIG
+
+    inputs = CONFIG['model_inputs']
+    spec = inputs.get(model_name) or inputs[CONFIG['default_model']]
+    return spec['mode'], spec['size']
+
+
+def cache_dir(image_path):
+    return os.path.join(os.path.dirname(image_path), 'preprocessed')
+
+
+def is_preprocessed(path):
+    return os.path.basename(os.path.dirname(path)) == 'preprocessed'
+
+
+def cached_files(image_path):
+    """Every cached artifact of an image, e.g. to delete them with the scan"""
+    directory = cache_dir(image_path)
+    prefix = os.path.basename(image_path) + '.'
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith(prefix)]
+
+
+def _is_fresh(path, source_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def to_uint8(img):
+    """Decode to an 8-bit L or RGB array; 16-bit/float grayscale (common for mammograms) is window-scaled"""
+    if img.mode in ('I;16', 'I;16B', 'I;16L', 'I', 'F'):
+        arr = np.asarray(img, dtype=np.float32)
+        low, high = float(arr.min()), float(arr.max())
+        scale = 255.0 / (high - low) if high > low else 0.0
+        return ((arr - low) * scale).astype(np.uint8)
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _load_base(image_path):
+    """Decoded image as an array, from the .npy cache when possible"""
+    base_path = os.path.join(cache_dir(image_path), os.path.basename(image_path) + '.base.npy')
+    if _is_fresh(base_path, image_path):
+        return np.load(base_path)
+
+    base_size = getattr(settings, 'AI_PREPROCESS_BASE_SIZE', 1024)
+    with Image.open(image_path) as img:
+        # Lets JPEG decode at a reduced scale instead of full resolution
+        img.draft('RGB', (base_size, base_size))
+        arr = to_uint8(img)
+
+    base = Image.fromarray(arr)
+    if min(base.size) > base_size:
+        ratio = base_size / min(base.size)
+        base = base.resize((round(base.width * ratio), round(base.height * ratio)), Image.Resampling.LANCZOS)
+    arr = np.asarray(base)
+
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+    tmp_path = base_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp_path, base_path)
+    return arr
+
+
+def prepare(image_path, model_name=None):
+    """Path of the compact model input for `image_path`, building and caching it if needed"""
+    mode, size = model_input(model_name)
+    out_path = os.path.join(cache_dir(image_path), f"{os.path.basename(image_path)}.{mode}-{size}.png")
+    bytes_in = os.path.getsize(image_path)
+
+    if _is_fresh(out_path, image_path):
+        _record(bytes_in, os.path.getsize(out_path), 0.0, hit=True)
+        return out_path
+
+    start = time.perf_counter()
+    img = Image.fromarray(_load_base(image_path)).convert(mode)
+    if min(img.size) > size:
+        # Short side to the model resolution; the service does its own crop
+        ratio = size / min(img.size)
+        img = img.resize((max(size, round(img.width * ratio)), max(size, round(img.height * ratio))), Image.Resampling.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, 'PNG', optimize=True)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buf.getvalue())
+    os.replace(tmp_path, out_path)
+
+    _record(bytes_in, buf.tell(), time.perf_counter() - start, hit=False)
+    return out_path
+
+
+def _record(bytes_in, bytes_out, seconds, hit):
+    with _lock:
+        _counters['images'] += 1
+        _counters['cache_hits'] += int(hit)
+        _counters['bytes_in'] += bytes_in
+        _counters['bytes_out'] += bytes_out
+        _counters['seconds'] += seconds
+
+
+_latency = {'original': [0, 0.0], 'preprocessed': [0, 0.0]}
+
+
+def record_call(preprocessed, seconds):
+    """End-to-end AI call latency, split by whether the payload was preprocessed"""
+    with _lock:
+        entry = _latency['preprocessed' if preprocessed else 'original']
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def stats():
+    """Counters of this process"""
+    with _lock:
+        c = dict(_counters)
+        latency = {key: (count, total) for key, (count, total) in _latency.items()}
+    built = c['images'] - c['cache_hits']
+    return {
+        'images': c['images'],
+        'cache_hits': c['cache_hits'],
+        'bytes_in': c['bytes_in'],
+        'bytes_out': c['bytes_out'],
+        'bytes_saved': c['bytes_in'] - c['bytes_out'],
+        'size_ratio': round(c['bytes_out'] / c['bytes_in'], 4) if c['bytes_in'] else None,
+        'avg_preprocess_ms': round(c['seconds'] / built * 1000, 2) if built else None,
+        'avg_call_ms': {
+            key: round(total / count * 1000, 2) if count else None
+            for key, (count, total) in latency.items()
+        },
+    }
@@ -0,0 +1,135 @@
+"""
+Scan counts per (day, scan_type, ai_predicted_class, report_state), kept in the
+ScanRollup table so dashboards never aggregate over the scan table.
+
+Every write path moves a scan between buckets with a +1/-1 delta: scan create and
+delete, scan edits that change a dimension (signals), AI write-back
+(Scan.bulk_apply_ai_results) and report create/finalise/delete (signals).
+`python manage.py rebuild_scan_rollups` recomputes the table and `--check` diffs
+it against live aggregates.
+"""
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+NO_REPORT = 'NONE'
+DRAFT = 'DRAFT'
+FINAL = 'FINAL'
+
+DIMENSIONS = ('day', 'scan_type', 'ai_predicted_class', 'report_state')
+
+
+def report_state(is_final):
+    """Bucket name for a scan's report: `is_final` is None when there is no report"""
+    if is_final is None:
+        return NO_REPORT
+    return FINAL if is_final else DRAFT
+
+
+def bucket(fields, state):
+    """`fields` is (created_at, scan_type, ai_predicted_class), see Scan.rollup_fields()"""
+    created_at, scan_type, predicted_class = fields
+    return (timezone.localdate(created_at), scan_type, predicted_class or '', state)
+
+
+def move(deltas, old, new):
+    """Record a scan moving from bucket `old` to `new` (either may be None) in a Counter"""
+    if old == new:
+        return deltas
+    if old is not None:
+        deltas[old] -= 1
+    if new is not None:
+        deltas[new] += 1
+    return deltas
+
+
+def apply(deltas):
+    """Add a Counter of bucket -> delta to the rollup table"""
+    from .models import ScanRollup
+
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        row = dict(zip(DIMENSIONS, key))
+        if ScanRollup.objects.filter(**row).update(scans=F('scans') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ScanRollup.objects.create(scans=delta, **row)
+        except IntegrityError:
+            # Created concurrently by another writer
+            ScanRollup.objects.filter(**row).update(scans=F('scans') + delta)
+
+
+def stats(start=None, end=None, group_by=DIMENSIONS):
+    """Summed counts from the rollup table only"""
+    from .models import ScanRollup
+
+    rows = ScanRollup.objects.all()
+    if start:
+        rows = rows.filter(day__gte=start)
+    if end:
+        rows = rows.filter(day__lte=end)
+    total = rows.aggregate(total=Sum('scans'))['total'] or 0
+    if group_by:
+        rows = rows.values(*group_by).annotate(count=Sum('scans')).filter(count__gt=0).order_by(*group_by)
+        return {'total': total, 'rows': list(rows)}
+    return {'total': total, 'rows': []}
+
+
+def live_counts(chunk_size=5000):
+    """Bucket counts aggregated from the scan table, `chunk_size` scan ids at a time"""
+    from .models import Scan
+
+    counts = Counter()
+    state = Case(
+        When(report__isnull=True, then=Value(NO_REPORT)),
+        When(report__is_final=True, then=Value(FINAL)),
+        default=Value(DRAFT),
+        output_field=CharField(),
+    )
+    last_id = 0
+    max_id = Scan.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    while last_id < max_id:
+        rows = (
+            Scan.objects.filter(id__gt=last_id, id__lte=last_id + chunk_size)
+            .values(day=TruncDate('created_at'), type=F('scan_type'), predicted=F('ai_predicted_class'), state=state)
+            .annotate(scans=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            counts[(row['day'], row['type'], row['predicted'] or '', row['state'])] += row['scans']
+        last_id += chunk_size
+    return counts
+
+
+def table_counts():
+    from .models import ScanRollup
+
+    return Counter({
+        tuple(row[:4]): row[4]
+        for row in ScanRollup.objects.values_list(*DIMENSIONS, 'scans')
+        if row[4]
+    })
+
+
+def rebuild(chunk_size=5000):
+    """Replace the rollup table with freshly aggregated counts; returns the number of buckets"""
+    from .models import ScanRollup
+
+    counts = live_counts(chunk_size)
+    with transaction.atomic():
+        ScanRollup.objects.all().delete()
+        ScanRollup.objects.bulk_create(
+            [ScanRollup(scans=n, **dict(zip(DIMENSIONS, key))) for key, n in counts.items()],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def diff(chunk_size=5000):
+    """{bucket: (rollup count, live count)} for every bucket that disagrees"""
+    live, table = live_counts(chunk_size), table_counts()
+    return {key: (table[key], live[key]) for key in live.keys() | table.keys() if table[key] != live[key]}
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+from rest_framework import filters
+
+# Scan fields that feed the search vector; saving any of them refreshes it
+VECTOR_FIELDS = {'title', 'description', 'patient'}
+
+
+def enabled():
+    """Full-text search needs PostgreSQL; other databases keep SearchFilter's ILIKE"""
+    return connection.vendor == 'postgresql'
+
+
+def scan_vector(patient_model=None):
+    """
+    tsvector expression for a scan row: title (A), patient name (B), description (C).
+    The name goes through the 'simple' config so it isn't stemmed.
+    """
+    if patient_model is None:
+        from apps.users.models import Patient as patient_model
+    config = settings.SCAN_SEARCH_CONFIG
+    name = Subquery(patient_model.objects.filter(pk=OuterRef('patient_id')).values('user__full_name')[:1])
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector(name, weight='B', config='simple')
+        + SearchVector('description', weight='C', config=config)
+    )
+
+
+def refresh(queryset):
+    """Recompute search_vector for the given scans in one UPDATE"""
+    if not enabled():
+        return 0
+    return queryset.update(search_vector=scan_vector())
+
+
+def patients_named(terms):
+    """
+    Patients whose name contains every term. icontains compiles to
+    UPPER(full_name::text) LIKE, which users_full_name_trgm_idx indexes.
+    """
+    from apps.users.models import Patient, User
+
+    names = User.objects.all()
+    for term in terms:
+        names = names.filter(full_name__icontains=term)
+    return Patient.objects.filter(user__in=names)
+
+
+class ScanSearchFilter(filters.SearchFilter):
+    """
+    `?search=` over the GIN-indexed search_vector, OR'd with the scans of patients
+    whose name contains the terms, for partial names. Matches are annotated with
+    `search_rank`, which the keyset paginator orders by unless `?ordering=` is given.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not enabled():
+            return super().filter_queryset(request, queryset, view)
+
+        text = ' '.join(terms)
+        query = SearchQuery(text, search_type='websearch', config=settings.SCAN_SEARCH_CONFIG)
+        # Resolved up front: an OR with an IN (subquery) arm can't be a BitmapOr of the two
+        # indexes and scans the whole table, a list of ids is a patient index lookup
+        patient_ids = list(patients_named(terms).values_list('pk', flat=True))
+
+        return queryset.filter(Q(search_vector=query) | Q(patient_id__in=patient_ids)).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+            + TrigramWordSimilarity(text, 'patient__user__full_name')
+        )
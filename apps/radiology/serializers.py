@@ -1,14 +1,18 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Scan, Report
+from .models import Scan, Report, InferenceJob, AIBackfill, ScanPrediction
+from .payload_cache import CachedPayloadMixin, CachedListSerializer
 from apps.users.serializers import UserSerializer # Assuming this exists, or we use a simple user representation
 
-class ReportSerializer(serializers.ModelSerializer):
+class ReportSerializer(CachedPayloadMixin, serializers.ModelSerializer):
+    payload_kind = 'report'
     radiologist_name = serializers.CharField(source='radiologist.user.full_name', read_only=True)
 
     class Meta:
         model = Report
         fields = ['id', 'scan', 'radiologist', 'radiologist_name', 'content', 'impression', 'is_final', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at', 'radiologist']
+        list_serializer_class = CachedListSerializer
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -31,21 +35,44 @@ class ReportSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ScanSerializer(serializers.ModelSerializer):
+class ScanSerializer(CachedPayloadMixin, serializers.ModelSerializer):
+    payload_kind = 'scan'
     report = ReportSerializer(read_only=True)
     patient_name = serializers.CharField(source='patient.user.full_name', read_only=True)
+    # Downsized variants, generated on first request (see derivatives.py)
+    thumbnail = serializers.SerializerMethodField()
+    preview = serializers.SerializerMethodField()
+    tiles = serializers.SerializerMethodField()
     
     class Meta:
         model = Scan
         fields = [
-            'id', 'patient', 'patient_name', 'image', 'scan_type', 'title', 'description', 'created_at',
-            'ai_generated', 'ai_predicted_class', 'ai_confidence', 'ai_benign_prob', 'ai_malignant_prob',
-            'report'
+            'id', 'patient', 'patient_name', 'image', 'thumbnail', 'preview', 'tiles', 'scan_type', 'title', 'description', 'created_at',
+            'ai_status', 'ai_generated', 'ai_predicted_class', 'ai_confidence', 'ai_benign_prob', 'ai_malignant_prob',
+            'ai_model_name', 'report'
         ]
         read_only_fields = [
             'id', 'created_at', 'patient', 
-            'ai_generated', 'ai_predicted_class', 'ai_confidence', 'ai_benign_prob', 'ai_malignant_prob'
+            'ai_status', 'ai_generated', 'ai_predicted_class', 'ai_confidence', 'ai_benign_prob', 'ai_malignant_prob',
+            'ai_model_name'
         ]
+        list_serializer_class = CachedListSerializer
+
+    def get_thumbnail(self, scan):
+        return self._scan_url(scan, 'scan-derivative', variant='thumbnail')
+
+    def get_preview(self, scan):
+        return self._scan_url(scan, 'scan-derivative', variant='preview')
+
+    def get_tiles(self, scan):
+        return self._scan_url(scan, 'scan-tiles')
+
+    def _scan_url(self, scan, name, **kwargs):
+        if not scan.image:
+            return None
+        url = reverse(name, kwargs={'pk': scan.pk, **kwargs})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
     def create(self, validated_data):
         # Assign current user's patient profile if available
@@ -53,3 +80,81 @@ class ScanSerializer(serializers.ModelSerializer):
         if request and hasattr(request.user, 'patient'):
             validated_data['patient'] = request.user.patient
         return super().create(validated_data)
+
+
+class InferenceJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InferenceJob
+        fields = ['id', 'scan', 'model_name', 'status', 'attempts', 'last_error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class WorklistSerializer(ScanSerializer):
+    # Claims change with plain UPDATEs that don't bump the version, so these aren't cached
+    payload_kind = None
+
+    class Meta(ScanSerializer.Meta):
+        fields = ScanSerializer.Meta.fields + ['claimed_by', 'claimed_until']
+        read_only_fields = fields
+
+
+class AIBackfillSerializer(serializers.ModelSerializer):
+    # Explicit default: DRF reads a boolean missing from form data as False
+    activate = serializers.BooleanField(default=True)
+    progress = serializers.SerializerMethodField()
+    rate_per_s = serializers.SerializerMethodField()
+    eta_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AIBackfill
+        fields = [
+            'id', 'model_name', 'created_from', 'created_to', 'scan_type', 'from_model', 'force', 'activate',
+            'concurrency', 'max_rate', 'batch_size',
+            'status', 'total', 'processed', 'succeeded', 'failed', 'progress', 'rate_per_s', 'eta_seconds',
+            'created_at', 'started_at', 'updated_at', 'finished_at',
+        ]
+        read_only_fields = [
+            'status', 'total', 'processed', 'succeeded', 'failed',
+            'created_at', 'started_at', 'updated_at', 'finished_at',
+        ]
+
+    def get_progress(self, backfill):
+        """Fraction of the matching scans processed so far"""
+        if backfill.status == AIBackfill.DONE:
+            return 1.0
+        return round(backfill.processed / backfill.total, 4) if backfill.total else None
+
+    def get_rate_per_s(self, backfill):
+        rate = backfill.rate
+        return round(rate, 2) if rate else None
+
+    def get_eta_seconds(self, backfill):
+        eta = backfill.eta_seconds
+        return None if eta is None else round(eta)
+
+    def validate(self, attrs):
+        if not 1 <= attrs.get('concurrency', 4) <= 64:
+            raise serializers.ValidationError({'concurrency': 'Must be between 1 and 64'})
+        if not 1 <= attrs.get('batch_size', 64) <= 1000:
+            raise serializers.ValidationError({'batch_size': 'Must be between 1 and 1000'})
+        return attrs
+
+
+class ScanPredictionSerializer(serializers.ModelSerializer):
+    is_active = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ScanPrediction
+        fields = [
+            'id', 'model_name', 'model_version', 'predicted_class', 'confidence',
+            'benign_prob', 'malignant_prob', 'scored_at', 'is_active',
+        ]
+        read_only_fields = fields
+
+    def get_is_active(self, prediction):
+        return prediction.scan.ai_prediction_id == prediction.pk
+
+
+class ActivateModelSerializer(serializers.Serializer):
+    model_name = serializers.CharField(max_length=100)
+    model_version = serializers.CharField(max_length=50, required=False, allow_blank=True)
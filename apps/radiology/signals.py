@@ -0,0 +1,121 @@
+import os
+from collections import Counter
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from apps.users.models import User
+from .models import Scan, Report, new_version
+from . import derivatives, preprocessing, rollups, search
+
+
+@receiver(post_delete, sender=Scan)
+def delete_scan_artifacts(sender, instance, **kwargs):
+    """Remove generated derivatives and preprocessed payloads once the delete commits"""
+    scan_id = instance.pk
+    image_path = instance.image.path if instance.image else None
+
+    def cleanup():
+        derivatives.delete_for_scan(scan_id)
+        if image_path:
+            for path in preprocessing.cached_files(image_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    transaction.on_commit(cleanup)
+
+
+@receiver(post_save, sender=Scan)
+def refresh_scan_search_vector(sender, instance, created, update_fields=None, **kwargs):
+    """Keep search_vector current when a scan's searchable fields are saved"""
+    if created or update_fields is None or search.VECTOR_FIELDS & set(update_fields):
+        search.refresh(Scan.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=User)
+def refresh_patient_search_vectors(sender, instance, created, update_fields=None, **kwargs):
+    """A patient's name is part of each of their scans' vectors"""
+    if created or instance.role != User.PATIENT:
+        return
+    if update_fields is None or 'full_name' in update_fields:
+        search.refresh(Scan.objects.filter(patient__user=instance))
+
+
+@receiver(post_save, sender=User)
+def bump_payload_versions(sender, instance, created, update_fields=None, **kwargs):
+    """Names are embedded in scan/report payloads, so a rename invalidates the cached ones"""
+    if created or not (update_fields is None or 'full_name' in update_fields):
+        return
+    version = new_version()
+    if instance.role == User.PATIENT:
+        Scan.objects.filter(patient__user=instance).update(version=version)
+    elif instance.role == User.RADIOLOGIST:
+        Report.objects.filter(radiologist__user=instance).update(version=version)
+        Scan.objects.filter(report__radiologist__user=instance).update(version=version)
+
+
+@receiver(post_save, sender=Report)
+def sync_scan_reported(sender, instance, **kwargs):
+    """
+    Mirror is_final onto the scan for the worklist index (a final report also ends
+    the claim) and give the scan a new version, since its payload nests the report.
+    """
+    if instance.is_final:
+        Scan.objects.filter(pk=instance.scan_id).update(
+            is_reported=True, claimed_by=None, claimed_until=None, version=new_version()
+        )
+    else:
+        Scan.objects.filter(pk=instance.scan_id).update(is_reported=False, version=new_version())
+
+
+@receiver(post_delete, sender=Report)
+def clear_scan_reported(sender, instance, **kwargs):
+    Scan.objects.filter(pk=instance.scan_id).update(is_reported=False, version=new_version())
+
+
+@receiver(post_save, sender=Scan)
+def update_scan_rollups(sender, instance, created, update_fields=None, **kwargs):
+    """New scans land in the no-report bucket; edits move the scan if a dimension changed"""
+    previous = getattr(instance, '_rollup_fields', None)
+    current = instance.rollup_fields()
+    if created:
+        rollups.apply(rollups.move(Counter(), None, rollups.bucket(current, rollups.NO_REPORT)))
+    elif previous and (update_fields is None or {'created_at', 'scan_type', 'ai_predicted_class'} & set(update_fields)):
+        if rollups.bucket(previous, None) != rollups.bucket(current, None):
+            state = rollups.report_state(Report.objects.filter(scan=instance).values_list('is_final', flat=True).first())
+            rollups.apply(rollups.move(Counter(), rollups.bucket(previous, state), rollups.bucket(current, state)))
+    else:
+        return
+    instance._rollup_fields = current
+
+
+@receiver(post_delete, sender=Scan)
+def remove_scan_from_rollups(sender, instance, **kwargs):
+    # The cascade deletes the report first, which already moved the scan to the no-report bucket
+    rollups.apply(rollups.move(Counter(), rollups.bucket(instance.rollup_fields(), rollups.NO_REPORT), None))
+
+
+@receiver(post_save, sender=Report)
+def update_report_rollups(sender, instance, created, **kwargs):
+    if created:
+        old = rollups.NO_REPORT
+    elif hasattr(instance, '_rollup_final'):
+        old = rollups.report_state(instance._rollup_final)
+    else:
+        return
+    new = rollups.report_state(instance.is_final)
+    instance._rollup_final = instance.is_final
+    if old != new:
+        _move_report_scan(instance.scan_id, old, new)
+
+
+@receiver(post_delete, sender=Report)
+def remove_report_from_rollups(sender, instance, **kwargs):
+    _move_report_scan(instance.scan_id, rollups.report_state(instance.is_final), rollups.NO_REPORT)
+
+
+def _move_report_scan(scan_id, old, new):
+    fields = Scan.objects.filter(pk=scan_id).values_list('created_at', 'scan_type', 'ai_predicted_class').first()
+    if fields:
+        rollups.apply(rollups.move(Counter(), rollups.bucket(fields, old), rollups.bucket(fields, new)))
@@ -1,3 +1,1212 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipIf, skipUnless
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import requests
+import urllib3
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from apps.users.models import User, Patient, Radiologist
+from .ai_service import CONFIG, AIService, CircuitBreaker, ai_service
+from .ai_standin import create_app, serve_in_thread
+from .models import Scan, Report, InferenceJob, AIBackfill, CachedPrediction, ScanPrediction
+from . import backfill as backfills, derivatives, payload_cache, prediction_cache, preprocessing, rollups, search, views
 
-# Create your tests here.
+
+def make_image(color=(120, 10, 10), name='scan.png'):
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buf, 'PNG')
+    return SimpleUploadedFile(name, buf.getvalue(), content_type='image/png')
+
+
+class InferenceJobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = serve_in_thread()
+        cls.media_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        overrides = override_settings(
+            AI_SERVICE_URL=self.server.url, MEDIA_ROOT=self.media_root, AI_PREDICTION_CACHE_ENABLED=False
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        user = User.objects.create_user('queue-patient@example.com', 'pw', full_name='Queue Patient', role=User.PATIENT)
+        self.patient = Patient.objects.get(user=user)
+
+    def scan(self, color=(1, 2, 3)):
+        return Scan.objects.create(patient=self.patient, image=make_image(color))
+
+    def test_upload_returns_202_with_the_queued_job(self):
+        client = APIClient()
+        client.force_authenticate(self.patient.user)
+        response = client.post('/api/radiology/scans/', {'image': make_image(), 'title': 'Queued'})
+        self.assertEqual(response.status_code, 202, response.content)
+        job = response.json()['ai_job']
+        self.assertEqual((job['status'], job['attempts']), (InferenceJob.PENDING, 0))
+        self.assertEqual(response.json()['ai_status'], Scan.AI_PENDING)
+        self.assertEqual(InferenceJob.objects.get().scan_id, response.json()['id'])
+
+    def test_enqueue_reuses_the_pending_job(self):
+        scan = self.scan()
+        job = InferenceJob.objects.get(scan=scan)
+        self.assertEqual(scan.queue_ai_prediction().pk, job.pk)
+        self.assertEqual(InferenceJob.objects.filter(scan=scan).count(), 1)
+        # A job that is already running doesn't absorb a new request
+        InferenceJob.claim()
+        self.assertNotEqual(scan.queue_ai_prediction().pk, job.pk)
+
+    def test_claim_hands_out_each_job_once(self):
+        scans = [self.scan((i, 0, 0)) for i in range(3)]
+        first = InferenceJob.claim(limit=2)
+        second = InferenceJob.claim(limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(InferenceJob.claim(), [])
+
+        self.assertEqual(set(InferenceJob.objects.values_list('status', 'attempts')), {(InferenceJob.RUNNING, 1)})
+        self.assertEqual(
+            set(Scan.objects.filter(pk__in=[s.pk for s in scans]).values_list('ai_status', flat=True)),
+            {Scan.AI_PROCESSING},
+        )
+
+    def test_failed_jobs_back_off_then_fail_after_max_attempts(self):
+        scan = self.scan()
+        delays = []
+        for attempt in range(1, 4):
+            InferenceJob.objects.update(run_after=timezone.now())
+            [job] = InferenceJob.claim()
+            self.assertEqual(job.attempts, attempt)
+            before = timezone.now()
+            job.mark_failed('boom')
+            if attempt < job.max_attempts:
+                self.assertEqual(job.status, InferenceJob.PENDING)
+                delays.append(round((job.run_after - before).total_seconds()))
+                # Not due until the backoff has passed
+                self.assertEqual(InferenceJob.claim(), [])
+
+        self.assertEqual(delays, [30, 60])
+        job.refresh_from_db()
+        scan.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (InferenceJob.FAILED, 'boom'))
+        self.assertEqual(scan.ai_status, Scan.AI_FAILED)
+
+    def test_stale_running_jobs_are_requeued(self):
+        abandoned, busy = self.scan((1, 0, 0)), self.scan((2, 0, 0))
+        InferenceJob.claim(limit=2)
+        InferenceJob.objects.filter(scan=abandoned).update(started_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(InferenceJob.requeue_stale(timedelta(minutes=5)), 1)
+        self.assertEqual(InferenceJob.objects.get(scan=abandoned).status, InferenceJob.PENDING)
+        self.assertEqual(InferenceJob.objects.get(scan=busy).status, InferenceJob.RUNNING)
+        self.assertEqual([job.scan_id for job in InferenceJob.claim()], [abandoned.pk])
+
+    # Closing connections between polls would close the test transaction's connection on PostgreSQL
+    @mock.patch('apps.radiology.management.commands.run_ai_worker.close_old_connections', new=lambda: None)
+    def test_worker_drains_the_queue(self):
+        scans = [self.scan((0, i, 0)) for i in range(2)]
+        # The shared client's breaker may still be open from tests against a dead service
+        ai_service.circuit.record_success()
+        call_command('run_ai_worker', '--once', stdout=io.StringIO())
+        self.assertEqual(set(InferenceJob.objects.values_list('status', flat=True)), {InferenceJob.DONE})
+        for scan in scans:
+            scan.refresh_from_db()
+            self.assertEqual(scan.ai_status, Scan.AI_COMPLETED)
+
+
+class AIClientTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root, AI_PREDICTION_CACHE_ENABLED=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        user = User.objects.create_user('client-patient@example.com', 'pw', full_name='Client Patient', role=User.PATIENT)
+        self.scan = Scan.objects.create(patient=Patient.objects.get(user=user), image=make_image())
+
+    def call(self, **standin):
+        """One predict() against a fresh stand-in; returns (result, requests the stand-in received)"""
+        server = serve_in_thread(**standin)
+        self.addCleanup(server.shutdown)
+        service = AIService()
+        service.read_timeout, service.max_retries, service.backoff = 0.2, 2, 0
+        with override_settings(AI_SERVICE_URL=server.url):
+            result = service.predict(self.scan.image.path, use_cache=False)
+        return result, server.app.config['stats']['requests']
+
+    def test_only_unsent_requests_are_retried(self):
+        self.assertEqual(self.call(error_rate=1), (None, 3))
+        # The slow model already has the image: no second copy
+        self.assertEqual(self.call(latency_ms=1000), (None, 1))
+
+    def test_dropped_connections_are_retried_only_before_sending(self):
+        service = AIService()
+        service.max_retries, service.backoff = 2, 0
+        refused = requests.exceptions.ConnectionError(
+            urllib3.exceptions.MaxRetryError(None, '/predict', urllib3.exceptions.NewConnectionError(None, 'refused'))
+        )
+        reset = requests.exceptions.ConnectionError(
+            urllib3.exceptions.ProtocolError('Connection aborted.', ConnectionResetError())
+        )
+        with override_settings(AI_SERVICE_URL='http://ai.test'):
+            for error, calls in ((refused, 3), (reset, 1)):
+                with self.subTest(error=error), mock.patch.object(service.session, 'post', side_effect=error) as post:
+                    self.assertIsNone(service.predict(self.scan.image.path, use_cache=False))
+                    self.assertEqual(post.call_count, calls)
+                    service.circuit.record_success()
+
+    def test_circuit_breaker_opens_probes_and_closes(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+        self.assertTrue(breaker.is_open())
+        self.assertGreater(breaker.retry_after(), 29)
+
+        breaker._opened_at -= 30  # reset_timeout has passed
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # A single probe at a time
+        self.assertFalse(breaker.allow_request())
+        # A failed probe opens it again right away
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        breaker._opened_at -= 30
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.retry_after()), (CircuitBreaker.CLOSED, 0.0))
+
+    @mock.patch('apps.radiology.management.commands.run_ai_worker.close_old_connections', new=lambda: None)
+    def test_open_circuit_defers_jobs_without_using_attempts(self):
+        for _ in range(ai_service.circuit.failure_threshold):
+            ai_service.circuit.record_failure()
+        self.addCleanup(ai_service.circuit.record_success)
+        self.assertFalse(ai_service.is_available())
+
+        out = io.StringIO()
+        call_command('run_ai_worker', '--once', stdout=out)
+        self.assertIn('AI service unavailable', out.getvalue())
+        self.assertEqual(InferenceJob.objects.get().status, InferenceJob.PENDING)
+
+        jobs = InferenceJob.claim()
+        InferenceJob.run_batch(jobs)
+        job = InferenceJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (InferenceJob.PENDING, 0))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=ai_service.retry_after() - 5))
+        self.scan.refresh_from_db()
+        self.assertEqual(self.scan.ai_status, Scan.AI_PENDING)
+
+
+@override_settings(AI_PREDICTION_CACHE_ENABLED=True)
+class PredictionCacheTests(TestCase):
+    RESULT = {'predicted_class': 'Malignant', 'confidence': 75.0, 'malignant_probability': 75.0, 'benign_probability': 25.0}
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('cached@example.com', 'pw', full_name='Cached Patient', role=User.PATIENT)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.image_hash = prediction_cache.hash_image(make_image())
+
+    def test_identical_upload_is_answered_from_the_cache(self):
+        prediction_cache.store(self.image_hash, 'resnet50', self.RESULT)
+        response = self.client.post('/api/radiology/scans/', {'image': make_image()})
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertIsNone(body['ai_job'])
+        self.assertEqual((body['ai_status'], body['ai_predicted_class']), (Scan.AI_COMPLETED, 'Malignant'))
+        self.assertFalse(InferenceJob.objects.exists())
+
+    def test_forced_rerun_skips_the_cache(self):
+        scan_id = self.client.post('/api/radiology/scans/', {'image': make_image()}).json()['id']
+        prediction_cache.store(self.image_hash, 'resnet50', self.RESULT)
+        InferenceJob.objects.all().delete()
+
+        response = self.client.post(f'/api/radiology/scans/{scan_id}/rerun_ai/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(response.json()['ai_job'])
+        self.assertFalse(InferenceJob.objects.exists())
+
+        response = self.client.post(f'/api/radiology/scans/{scan_id}/rerun_ai/', {'force': 'true'})
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertFalse(InferenceJob.objects.get().use_cache)
+
+    @override_settings(AI_PREDICTION_CACHE_TTL=60)
+    def test_entries_expire_after_the_ttl(self):
+        prediction_cache.store(self.image_hash, 'resnet50', self.RESULT)
+        self.assertEqual(prediction_cache.lookup(self.image_hash, 'resnet50'), self.RESULT)
+        self.assertIsNone(prediction_cache.lookup(self.image_hash, 'resnet101'))
+
+        CachedPrediction.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+        self.assertIsNone(prediction_cache.lookup(self.image_hash, 'resnet50'))
+        self.assertEqual(prediction_cache.prune(), 1)
+        self.assertFalse(CachedPrediction.objects.exists())
+
+    @override_settings(AI_PREDICTION_CACHE_MAX_ENTRIES=2)
+    def test_prune_evicts_the_least_recently_used(self):
+        for i in range(4):
+            prediction_cache.store(f'hash-{i}', 'resnet50', self.RESULT)
+            CachedPrediction.objects.filter(image_sha256=f'hash-{i}').update(
+                last_used_at=timezone.now() - timedelta(minutes=10 - i)
+            )
+        # A hit makes the oldest entry the most recently used
+        self.assertIsNotNone(prediction_cache.lookup('hash-0', 'resnet50'))
+
+        self.assertEqual(prediction_cache.prune(), 2)
+        self.assertEqual(set(CachedPrediction.objects.values_list('image_sha256', flat=True)), {'hash-0', 'hash-3'})
+
+
+@override_settings(AI_PREPROCESS_ENABLED=True)
+class PreprocessingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'scan.png')
+        Image.new('RGBA', (600, 400), (200, 30, 30, 255)).save(self.path)
+        patch = mock.patch.dict(CONFIG['model_inputs'], {'gray-64': {'size': 64, 'mode': 'L'}})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_images_are_converted_to_each_models_input(self):
+        for model_name, mode, size in (('resnet50', 'RGB', (336, 224)), ('gray-64', 'L', (96, 64))):
+            with self.subTest(model_name=model_name):
+                path = AIService().prepare_image(self.path, model_name)
+                self.assertTrue(preprocessing.is_preprocessed(path))
+                with Image.open(path) as img:
+                    self.assertEqual((img.mode, img.size), (mode, size))
+
+    def test_decoded_image_and_payloads_are_reused(self):
+        first = preprocessing.prepare(self.path, 'resnet50')
+        hits = preprocessing.stats()['cache_hits']
+        self.assertEqual(preprocessing.prepare(self.path, 'resnet50'), first)
+        self.assertEqual(preprocessing.stats()['cache_hits'], hits + 1)
+
+        # Another model starts from the cached .base.npy, not the original
+        with mock.patch.object(Image, 'open', side_effect=AssertionError('original decoded again')):
+            preprocessing.prepare(self.path, 'gray-64')
+        self.assertEqual(
+            sorted(os.path.basename(path) for path in preprocessing.cached_files(self.path)),
+            ['scan.png.L-64.png', 'scan.png.RGB-224.png', 'scan.png.base.npy'],
+        )
+
+    def test_undecodable_images_are_sent_as_they_are(self):
+        path = os.path.join(os.path.dirname(self.path), 'scan.dcm')
+        with open(path, 'wb') as f:
+            f.write(b'DICM' + bytes(512))
+        self.assertEqual(AIService().prepare_image(path, 'resnet50'), path)
+
+
+class StandInTestCase(TestCase):
+    """Runs the AI stand-in for the class; each test gets a patient to upload scans for"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = serve_in_thread()
+        cls.media_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        overrides = override_settings(
+            AI_SERVICE_URL=self.server.url, MEDIA_ROOT=self.media_root, AI_PREDICTION_CACHE_ENABLED=False
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        user = User.objects.create_user('patient@example.com', 'pw', full_name='Pat', role=User.PATIENT)
+        self.patient = Patient.objects.get(user=user)
+
+
+class BatchInferenceTests(StandInTestCase):
+    def test_predict_batch_groups_images_into_one_request(self):
+        service = AIService()
+        scans = [Scan.objects.create(patient=self.patient, image=make_image((i, 0, 0))) for i in range(5)]
+        stats = self.server.app.config['stats']
+        before = stats['requests']
+
+        results = service.predict_batch(
+            [(scan.pk, scan.image.path, scan.image_sha256) for scan in scans], use_cache=False
+        )
+
+        self.assertEqual(stats['requests'] - before, 1)
+        self.assertEqual(set(results), {scan.pk for scan in scans})
+        self.assertTrue(all(result['predicted_class'] for result in results.values()))
+
+    def test_batch_is_split_by_count_and_bytes(self):
+        service = AIService()
+        service.batch_max_size = 2
+        scans = [Scan.objects.create(patient=self.patient, image=make_image((0, i, 0))) for i in range(5)]
+        chunks = list(service._chunk([scan.image.path for scan in scans]))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+        service.batch_max_size = 10
+        service.batch_max_bytes = 1
+        chunks = list(service._chunk([scan.image.path for scan in scans]))
+        self.assertEqual(len(chunks), 5)
+
+    def test_worker_batch_writes_scans_and_draft_reports(self):
+        scans = [Scan.objects.create(patient=self.patient, image=make_image((0, 0, i))) for i in range(3)]
+        final = Report.objects.create(scan=scans[0], content='Signed off', is_final=True)
+
+        InferenceJob.run_batch(InferenceJob.claim(limit=10))
+
+        for scan in scans:
+            scan.refresh_from_db()
+            self.assertEqual(scan.ai_status, Scan.AI_COMPLETED)
+            self.assertIsNotNone(scan.ai_malignant_prob)
+        final.refresh_from_db()
+        self.assertEqual(final.content, 'Signed off')
+        self.assertEqual(Report.objects.filter(is_final=False).count(), 2)
+        self.assertFalse(InferenceJob.objects.exclude(status=InferenceJob.DONE).exists())
+
+
+class AsyncInferenceTests(StandInTestCase):
+    def test_async_upload_and_rerun_wait_for_the_prediction(self):
+        client = APIClient()
+        client.force_authenticate(self.patient.user)
+        response = client.post('/api/radiology/scans/async/', {'image': make_image((9, 9, 9)), 'title': 'Async'})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['ai_status'], Scan.AI_COMPLETED)
+        self.assertEqual(response.json()['ai_job']['status'], InferenceJob.DONE)
+        self.assertEqual(response.json()['report']['is_final'], False)
+
+        scan_id = response.json()['id']
+        response = client.post(f'/api/radiology/scans/{scan_id}/rerun_ai/async/', {'force': 'true'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(InferenceJob.objects.filter(scan_id=scan_id, status=InferenceJob.DONE).count(), 2)
+
+        # Service unreachable: the job stays queued for the worker
+        with override_settings(AI_SERVICE_URL='http://127.0.0.1:9'):
+            response = client.post(f'/api/radiology/scans/{scan_id}/rerun_ai/async/', {'force': 'true'})
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['ai_job']['status'], InferenceJob.PENDING)
+
+
+class AIBackfillTests(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scans = [Scan.objects.create(patient=self.patient, image=make_image((i, 3, 3))) for i in range(4)]
+        result = {'predicted_class': 'Benign', 'confidence': 90.0, 'malignant_probability': 10.0, 'benign_probability': 90.0}
+        Scan.bulk_apply_ai_results([(scan, result) for scan in self.scans], 'resnet50')
+        admin = User.objects.create_user('backfill-admin@example.com', 'pw', role=User.ADMIN, is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def create(self, **fields):
+        response = self.client.post('/api/radiology/ai/backfills/', {'model_name': 'resnet101', 'batch_size': 2, **fields})
+        self.assertEqual(response.status_code, 201, response.content)
+        return AIBackfill.objects.get(pk=response.json()['id'])
+
+    def model_names(self):
+        return list(Scan.objects.order_by('pk').values_list('ai_model_name', flat=True))
+
+    def test_backfill_rescores_to_the_target_model_and_resumes(self):
+        Report.objects.filter(scan=self.scans[0]).update(content='Signed off', is_final=True)
+        backfill = self.create(concurrency=2)
+        self.assertEqual(backfill.total, 4)
+        # Pretend a crash after the first scan was checkpointed
+        AIBackfill.objects.filter(pk=backfill.pk).update(last_scan_id=self.scans[0].pk, processed=1, succeeded=1)
+
+        self.assertTrue(backfills.run(backfill, log=lambda line: None))
+        backfill.refresh_from_db()
+        self.assertEqual((backfill.status, backfill.processed, backfill.failed), (AIBackfill.DONE, 4, 0))
+        self.assertEqual(self.model_names(), ['resnet50', 'resnet101', 'resnet101', 'resnet101'])
+        self.assertEqual(Report.objects.get(scan=self.scans[0]).content, 'Signed off')
+        self.assertEqual(self.client.get(f'/api/radiology/ai/backfills/{backfill.pk}/').json()['progress'], 1.0)
+
+    def test_cancel_stops_after_the_current_batch(self):
+        backfill = self.create()
+        cancel_url = f'/api/radiology/ai/backfills/{backfill.pk}/cancel/'
+
+        # Cancelled from the API once the first batch is written
+        self.assertTrue(backfills.run(backfill, log=lambda line: self.client.post(cancel_url)))
+        backfill.refresh_from_db()
+        self.assertEqual((backfill.status, backfill.processed, backfill.last_scan_id), (AIBackfill.CANCELLED, 2, self.scans[1].pk))
+        self.assertIsNotNone(backfill.finished_at)
+        self.assertEqual(self.model_names(), ['resnet101', 'resnet101', 'resnet50', 'resnet50'])
+
+        # Cancelled backfills are not picked up again
+        self.assertNotIn(backfill, backfills.resumable())
+        self.assertFalse(backfills.run(backfill, log=lambda line: None))
+
+    def test_stale_running_backfills_are_resumed(self):
+        backfill = self.create()
+        now = timezone.now()
+        # Another process is working on it: left alone
+        AIBackfill.objects.filter(pk=backfill.pk).update(
+            status=AIBackfill.RUNNING, started_at=now, updated_at=now, last_scan_id=self.scans[1].pk, processed=2
+        )
+        self.assertNotIn(backfill, backfills.resumable())
+        self.assertFalse(backfills.run(backfill, log=lambda line: None))
+
+        # Its heartbeat stopped: resumed from the checkpoint
+        AIBackfill.objects.filter(pk=backfill.pk).update(updated_at=now - backfills.STALE_AFTER - timedelta(seconds=1))
+        self.assertEqual(list(backfills.resumable()), [backfill])
+        self.assertTrue(backfills.run(backfill, log=lambda line: None))
+        backfill.refresh_from_db()
+        self.assertEqual((backfill.status, backfill.processed, backfill.started_at), (AIBackfill.DONE, 4, now))
+        self.assertEqual(self.model_names(), ['resnet50', 'resnet50', 'resnet101', 'resnet101'])
+
+
+class ScanPredictionTests(StandInTestCase):
+    def test_switching_the_active_model_uses_stored_predictions(self):
+        scans = [Scan.objects.create(patient=self.patient, image=make_image((i, 5, 5))) for i in range(3)]
+        benign = {'predicted_class': 'Benign', 'confidence': 90.0, 'malignant_probability': 10.0, 'benign_probability': 90.0}
+        malignant = {'predicted_class': 'Malignant', 'confidence': 80.0, 'malignant_probability': 80.0, 'benign_probability': 20.0}
+        Scan.bulk_apply_ai_results([(scan, benign) for scan in scans], 'resnet50')
+        report = Report.objects.get(scan=scans[0])
+        report.content, report.is_final = 'Signed off', True
+        report.save()
+        # Scored but not shown yet
+        Scan.bulk_apply_ai_results([(scan, malignant) for scan in scans[:2]], 'resnet101', activate=False)
+        self.assertEqual(ScanPrediction.objects.count(), 5)
+        self.assertEqual(set(Scan.objects.values_list('ai_predicted_class', flat=True)), {'Benign'})
+
+        # No AI service behind this URL: the switch must not call it
+        with override_settings(AI_SERVICE_URL='http://127.0.0.1:9'):
+            self.assertEqual(ScanPrediction.activate_model('resnet101', chunk_size=1), 2)
+        self.assertEqual(
+            list(Scan.objects.order_by('pk').values_list('ai_model_name', 'ai_predicted_class')),
+            [('resnet101', 'Malignant'), ('resnet101', 'Malignant'), ('resnet50', 'Benign')],
+        )
+        self.assertEqual(Report.objects.get(scan=scans[0]).content, 'Signed off')
+        self.assertIn('Malignant', Report.objects.get(scan=scans[1]).content)
+        self.assertEqual(rollups.diff(), {})
+
+        admin = User.objects.create_user('activate-admin@example.com', 'pw', role=User.ADMIN, is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.post('/api/radiology/ai/activate/', {'model_name': 'resnet50'})
+        self.assertEqual(response.json()['switched'], 2)
+        self.assertEqual(set(Scan.objects.values_list('ai_predicted_class', flat=True)), {'Benign'})
+        predictions = client.get(f'/api/radiology/scans/{scans[1].pk}/predictions/').json()
+        self.assertEqual([(p['model_name'], p['is_active']) for p in predictions], [('resnet101', False), ('resnet50', True)])
+
+
+class TransactionScopeTests(TransactionTestCase):
+    """
+    Reads run outside a transaction, writes inside one, and the AI call only after
+    the scan has committed. A TransactionTestCase, as TestCase wraps every test in atomic.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root, AI_PREDICTION_CACHE_ENABLED=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        user = User.objects.create_user('atomic@example.com', 'pw', full_name='Atomic', role=User.PATIENT)
+        self.patient = Patient.objects.get(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def spy(self, owner, name):
+        """Patch owner.name to record whether each call ran inside a transaction"""
+        original = getattr(owner, name)
+        calls = []
+
+        def wrapper(*args, **kwargs):
+            calls.append(connection.in_atomic_block)
+            return original(*args, **kwargs)
+
+        patcher = mock.patch.object(owner, name, wrapper)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls
+
+    def test_reads_run_outside_a_transaction(self):
+        scan = Scan.objects.create(patient=self.patient, title='Read')
+        calls = self.spy(views, 'visible_scans')
+        self.assertEqual(self.client.get('/api/radiology/scans/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/radiology/scans/{scan.pk}/').status_code, 200)
+        self.assertEqual(calls, [False, False])
+
+    def test_writes_run_in_one_transaction(self):
+        calls = self.spy(Scan, 'save')
+        response = self.client.post('/api/radiology/scans/', {'image': make_image(), 'title': 'Write'})
+        self.assertEqual(response.status_code, 202, response.content)
+        response = self.client.patch(f'/api/radiology/scans/{response.json()["id"]}/', {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(calls, [True, True])
+
+    @override_settings(AI_INFERENCE_INLINE=True)
+    def test_inline_ai_call_runs_after_the_scan_commits(self):
+        ai_service.circuit.record_success()
+        result = {'predicted_class': 'Benign', 'confidence': 90.0, 'malignant_probability': 10.0, 'benign_probability': 90.0}
+
+        def predict(image_path, **kwargs):
+            self.assertFalse(connection.in_atomic_block)
+            self.assertTrue(Scan.objects.filter(title='Inline').exists())
+            return result
+
+        with mock.patch.object(ai_service, 'predict', side_effect=predict) as predict_mock:
+            response = self.client.post('/api/radiology/scans/', {'image': make_image(), 'title': 'Inline'})
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(predict_mock.call_count, 1)
+        self.assertEqual(Scan.objects.get(title='Inline').ai_status, Scan.AI_COMPLETED)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every scan/report endpoint must run a fixed number of queries regardless of
+    how many rows it returns. Authentication is forced, so the counts exclude
+    the JWT user lookup.
+    """
+    SIZES = (10, 100, 1000)
+
+    # Queries per request, independent of the number of rows
+    BUDGETS = {
+        'scan-list': 1,
+        'scan-detail': 1,
+        'report-list': 1,
+        'report-detail': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient_user = User.objects.create_user(
+            'budget-patient@example.com', 'pw', full_name='Budget Patient', role=User.PATIENT
+        )
+        cls.patient = Patient.objects.get(user=cls.patient_user)
+        cls.radiologist_user = User.objects.create_user(
+            'budget-radiologist@example.com', 'pw', full_name='Budget Radiologist', role=User.RADIOLOGIST
+        )
+        cls.radiologist = Radiologist.objects.create(user=cls.radiologist_user, license_id='BUDGET-1')
+        cls.admin_user = User.objects.create_user(
+            'budget-admin@example.com', 'pw', full_name='Budget Admin', role=User.ADMIN, is_staff=True
+        )
+
+    def seed(self, count):
+        """`count` scans with AI results, every other one with a radiologist-signed report"""
+        Scan.objects.all().delete()
+        scans = Scan.objects.bulk_create([
+            Scan(
+                patient=self.patient, image=f'scans/budget/{i}.png', title=f'Scan {i}',
+                ai_status=Scan.AI_COMPLETED, ai_generated=True, ai_predicted_class='Benign',
+                ai_confidence=90.0, ai_benign_prob=90.0, ai_malignant_prob=10.0,
+            )
+            for i in range(count)
+        ])
+        Report.objects.bulk_create([
+            Report(scan=scan, radiologist=self.radiologist if i % 2 else None, content='Findings', impression='Summary')
+            for i, scan in enumerate(scans)
+        ])
+        return scans
+
+    def assertBudget(self, user, name, url, rows=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.assertNumQueries(self.BUDGETS[name]):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if rows is not None:
+            self.assertEqual(len(response.json()['results']), min(rows, settings.RADIOLOGY_PAGE_SIZE))
+
+    def test_list_endpoints_have_constant_query_count(self):
+        for size in self.SIZES:
+            self.seed(size)
+            for user in (self.patient_user, self.radiologist_user, self.admin_user):
+                with self.subTest(size=size, role=user.role):
+                    self.assertBudget(user, 'scan-list', '/api/radiology/scans/', rows=size)
+                    self.assertBudget(user, 'report-list', '/api/radiology/reports/', rows=size)
+
+    def test_detail_endpoints_have_constant_query_count(self):
+        scans = self.seed(self.SIZES[0])
+        scan = scans[1]
+        for user in (self.patient_user, self.radiologist_user, self.admin_user):
+            with self.subTest(role=user.role):
+                self.assertBudget(user, 'scan-detail', f'/api/radiology/scans/{scan.pk}/')
+                self.assertBudget(user, 'report-detail', f'/api/radiology/reports/{scan.report.pk}/')
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user(
+            'page-admin@example.com', 'pw', full_name='Page Admin', role=User.ADMIN, is_staff=True
+        )
+        user = User.objects.create_user('page-patient@example.com', 'pw', full_name='Page Patient', role=User.PATIENT)
+        patient = Patient.objects.get(user=user)
+        scans = Scan.objects.bulk_create([
+            Scan(patient=patient, image=f'scans/page/{i}.png', title=f'Scan {i}') for i in range(23)
+        ])
+        # Groups of three scans share a timestamp, so paging has to tie-break on id
+        base = timezone.now()
+        for i, scan in enumerate(scans):
+            scan.created_at = base - timedelta(minutes=i // 3)
+        Scan.objects.bulk_update(scans, ['created_at'])
+        cls.ids = [scan.pk for scan in scans]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin_user)
+
+    def walk(self, url, direction='next'):
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append([row['id'] for row in body['results']])
+            url = body[direction]
+        return pages
+
+    def test_pages_cover_every_scan_once_in_both_orderings(self):
+        for ordering in ('-created_at', 'created_at'):
+            with self.subTest(ordering=ordering):
+                pages = self.walk(f'/api/radiology/scans/?ordering={ordering}&page_size=5')
+                seen = [pk for page in pages for pk in page]
+                self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+                self.assertEqual(sorted(seen), sorted(self.ids))
+                expected = sorted(
+                    Scan.objects.values_list('created_at', 'id'), reverse=ordering.startswith('-')
+                )
+                self.assertEqual(seen, [pk for _, pk in expected])
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        url, forward = '/api/radiology/scans/?page_size=5', []
+        while url:
+            body = self.client.get(url).json()
+            forward.append([row['id'] for row in body['results']])
+            url, previous = body['next'], body['previous']
+        # From the last page, following `previous` yields the earlier pages in reverse
+        backward = self.walk(previous, direction='previous')
+        self.assertEqual(backward[::-1], forward[:-1])
+
+
+class ScanSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user(
+            'search-admin@example.com', 'pw', full_name='Search Admin', role=User.ADMIN, is_staff=True
+        )
+        cls.kent = User.objects.create_user('kent@example.com', 'pw', full_name='Ada Kent', role=User.PATIENT)
+        cls.kennedy = User.objects.create_user('kennedy@example.com', 'pw', full_name='Ada Kennedy', role=User.PATIENT)
+        moss = User.objects.create_user('moss@example.com', 'pw', full_name='Bea Moss', role=User.PATIENT)
+        cls.scans = {
+            'name': Scan.objects.create(patient=cls.kent.patient, image='scans/search/1.png', title='Knee'),
+            'title': Scan.objects.create(patient=moss.patient, image='scans/search/2.png', title='Kent view'),
+            'description': Scan.objects.create(
+                patient=moss.patient, image='scans/search/3.png', title='Hip', description='Referred by Kent clinic'
+            ),
+            'partial': Scan.objects.create(patient=cls.kennedy.patient, image='scans/search/4.png', title='Wrist'),
+            'unrelated': Scan.objects.create(patient=moss.patient, image='scans/search/5.png', title='Ankle'),
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin_user)
+
+    def search(self, text):
+        results = self.client.get('/api/radiology/scans/', {'search': text}).json()['results']
+        by_id = {scan.pk: key for key, scan in self.scans.items()}
+        return [by_id[row['id']] for row in results]
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_matches_are_ranked_by_field_weight(self):
+        # A whole-word name match also scores trigram similarity, on top of its B weight
+        self.assertEqual(self.search('kent'), ['name', 'title', 'description'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_partial_patient_names_match_through_the_trigram_path(self):
+        self.assertEqual(self.search('kenned'), ['partial'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_renaming_a_patient_refreshes_their_scan_vectors(self):
+        from django.contrib.postgres.search import SearchQuery
+
+        def indexed(word):
+            query = SearchQuery(word, config='simple')
+            return list(Scan.objects.filter(search_vector=query).values_list('pk', flat=True))
+
+        self.assertEqual(indexed('kennedy'), [self.scans['partial'].pk])
+        self.kennedy.full_name = 'Ada Zephyr'
+        self.kennedy.save(update_fields=['full_name'])
+        self.assertEqual(indexed('zephyr'), [self.scans['partial'].pk])
+        self.assertEqual(indexed('kennedy'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_search_uses_the_indexes(self):
+        request = Request(APIRequestFactory().get('/api/radiology/scans/', {'search': 'kenn'}))
+        with connection.cursor() as cursor:
+            # The tables are tiny, so make the planner prove it can avoid scanning them
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('users_full_name_upper_trgm_idx', search.patients_named(['kenn']).explain())
+        plan = search.ScanSearchFilter().filter_queryset(request, Scan.objects.all(), None).explain()
+        self.assertIn('radiology_scan_search_idx', plan)
+        self.assertNotIn('Seq Scan on radiology_scan', plan)
+
+    @skipIf(connection.vendor == 'postgresql', 'PostgreSQL uses full-text search')
+    def test_other_databases_fall_back_to_substring_search(self):
+        self.assertEqual(sorted(self.search('kent')), ['description', 'name', 'title'])
+        self.assertEqual(self.search('kenned'), ['partial'])
+
+
+class WorklistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        patient_user = User.objects.create_user('wl-patient@example.com', 'pw', full_name='WL Patient', role=User.PATIENT)
+        patient = Patient.objects.get(user=patient_user)
+        cls.radiologists = []
+        for i in range(2):
+            user = User.objects.create_user(f'wl-rad{i}@example.com', 'pw', full_name=f'WL Rad {i}', role=User.RADIOLOGIST)
+            cls.radiologists.append(Radiologist.objects.create(user=user, license_id=f'WL-{i}'))
+        # (malignant prob, minutes old); None is a scan the AI hasn't finished yet
+        cls.scans = {}
+        now = timezone.now()
+        for name, prob, age in [('low', 10.0, 50), ('high-new', 90.0, 5), ('high-old', 90.0, 40), ('pending', None, 60), ('final', 99.0, 30)]:
+            scan = Scan.objects.create(patient=patient, image=f'scans/wl/{name}.png', title=name, ai_malignant_prob=prob)
+            Scan.objects.filter(pk=scan.pk).update(created_at=now - timedelta(minutes=age))
+            cls.scans[name] = scan
+        Report.objects.create(scan=cls.scans['final'], content='Signed', is_final=True)
+
+    def client_for(self, radiologist):
+        client = APIClient()
+        client.force_authenticate(radiologist.user)
+        return client
+
+    def titles(self, response):
+        return [row['title'] for row in response.json()]
+
+    def test_orders_unreported_scans_by_malignancy_then_age(self):
+        response = self.client_for(self.radiologists[0]).get('/api/radiology/worklist/')
+        self.assertEqual(self.titles(response), ['high-old', 'high-new', 'low', 'pending'])
+
+    def test_claimed_scans_are_hidden_from_other_radiologists(self):
+        first, second = (self.client_for(r) for r in self.radiologists)
+        claimed = first.post('/api/radiology/worklist/next/', {'count': 2})
+        self.assertEqual(self.titles(claimed), ['high-old', 'high-new'])
+        self.assertEqual(self.titles(second.get('/api/radiology/worklist/')), ['low', 'pending'])
+        self.assertEqual(self.titles(second.post('/api/radiology/worklist/next/')), ['low'])
+
+        scan = self.scans['high-old']
+        self.assertEqual(second.post(f'/api/radiology/worklist/{scan.pk}/claim/').status_code, 409)
+        self.assertEqual(first.post(f'/api/radiology/worklist/{scan.pk}/release/').status_code, 204)
+        self.assertEqual(second.post(f'/api/radiology/worklist/{scan.pk}/claim/').status_code, 200)
+
+    def test_final_report_takes_scan_off_the_worklist(self):
+        client = self.client_for(self.radiologists[0])
+        scan = self.scans['high-old']
+        client.post(f'/api/radiology/worklist/{scan.pk}/claim/')
+        Report.objects.create(scan=scan, content='Signed', is_final=True)
+        scan.refresh_from_db()
+        self.assertTrue(scan.is_reported)
+        self.assertIsNone(scan.claimed_by)
+        self.assertNotIn('high-old', self.titles(client.get('/api/radiology/worklist/')))
+
+
+class ScanRollupTests(TestCase):
+    RESULT = {'predicted_class': 'Malignant', 'confidence': 80.0, 'malignant_probability': 80.0, 'benign_probability': 20.0}
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('rollup-patient@example.com', 'pw', full_name='Rollup Patient', role=User.PATIENT)
+        cls.patient = Patient.objects.get(user=user)
+        cls.admin_user = User.objects.create_user(
+            'rollup-admin@example.com', 'pw', full_name='Rollup Admin', role=User.ADMIN, is_staff=True
+        )
+
+    def assertInSync(self):
+        self.assertEqual(rollups.diff(chunk_size=2), {})
+
+    def test_every_write_path_keeps_rollups_in_sync(self):
+        scans = [Scan.objects.create(patient=self.patient, image=f'scans/rollup/{i}.png') for i in range(3)]
+        self.assertInSync()
+
+        Scan.bulk_apply_ai_results([(scans[0], self.RESULT), (scans[1], self.RESULT)])
+        self.assertInSync()
+
+        report = Report.objects.get(scan=scans[0])
+        report.is_final = True
+        report.save()
+        Report.objects.create(scan=scans[2], content='Signed', is_final=True)
+        self.assertInSync()
+
+        # Re-running AI on a finalised scan changes the class but keeps it in the final bucket
+        scan = Scan.objects.get(pk=scans[0].pk)
+        Scan.bulk_apply_ai_results([(scan, {**self.RESULT, 'predicted_class': 'Benign'})])
+        scan = Scan.objects.get(pk=scans[2].pk)
+        scan.scan_type = 'MRI'
+        scan.save()
+        self.assertInSync()
+
+        Report.objects.get(scan=scans[1]).delete()
+        Scan.objects.get(pk=scans[2].pk).delete()
+        self.assertInSync()
+
+    def test_report_created_during_ai_write_back_is_counted_once(self):
+        # Same class as the result, so the report's own rollup move reads the bucket it
+        # would from outside the write-back's transaction
+        scan = Scan.objects.create(patient=self.patient, image='scans/rollup/race.png', ai_predicted_class='Malignant')
+        bulk_create = Report.objects.bulk_create
+
+        def radiologist_first(reports, **kwargs):
+            # Lands between the write-back's report lookup and its insert
+            Report.objects.create(scan=scan, content='Signed', is_final=True)
+            return bulk_create(reports, **kwargs)
+
+        with mock.patch.object(Report.objects, 'bulk_create', radiologist_first):
+            Scan.bulk_apply_ai_results([(scan, self.RESULT)])
+        self.assertEqual(Report.objects.get(scan=scan).content, 'Signed')
+        self.assertInSync()
+
+    def test_stats_api_and_rebuild(self):
+        for i in range(4):
+            Scan.objects.create(patient=self.patient, image=f'scans/rollup/{i}.png', scan_type='MRI' if i % 2 else 'CT')
+        client = APIClient()
+        client.force_authenticate(self.admin_user)
+        response = client.get('/api/radiology/stats/scans/', {'group_by': 'scan_type'})
+        self.assertEqual(response.json(), {
+            'total': 4, 'rows': [{'scan_type': 'CT', 'count': 2}, {'scan_type': 'MRI', 'count': 2}],
+        })
+
+        rollups.apply(rollups.Counter({(timezone.localdate(), 'CT', '', rollups.NO_REPORT): 5}))
+        self.assertEqual(len(rollups.diff()), 1)
+        rollups.rebuild(chunk_size=3)
+        self.assertInSync()
+
+
+class PayloadCacheTests(TestCase):
+    RESULT = {'predicted_class': 'Benign', 'confidence': 70.0, 'malignant_probability': 30.0, 'benign_probability': 70.0}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient_user = User.objects.create_user(
+            'cache-patient@example.com', 'pw', full_name='Cache Patient', role=User.PATIENT
+        )
+        radiologist_user = User.objects.create_user(
+            'cache-radiologist@example.com', 'pw', full_name='Cache Radiologist', role=User.RADIOLOGIST
+        )
+        cls.radiologist = Radiologist.objects.create(user=radiologist_user, license_id='CACHE-1')
+        cls.scan = Scan.objects.create(patient=Patient.objects.get(user=cls.patient_user), image='scans/cache/1.png')
+
+    def setUp(self):
+        payload_cache.reset_stats()
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(url).json()
+
+    def test_payloads_are_cached_per_role(self):
+        Report.objects.create(scan=self.scan, radiologist=self.radiologist, content='Full findings', impression='Summary')
+        url = f'/api/radiology/scans/{self.scan.pk}/'
+        for _ in range(2):
+            patient_view = self.get(self.patient_user, url)
+            radiologist_view = self.get(self.radiologist.user, url)
+        self.assertNotIn('content', patient_view['report'])
+        self.assertEqual(radiologist_view['report']['content'], 'Full findings')
+        self.assertEqual(payload_cache.stats(), {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+    def test_report_save_and_ai_write_back_invalidate(self):
+        url = '/api/radiology/scans/'
+        user = self.radiologist.user
+        self.assertIsNone(self.get(user, url)['results'][0]['report'])
+
+        Scan.bulk_apply_ai_results([(Scan.objects.get(pk=self.scan.pk), self.RESULT)])
+        row = self.get(user, url)['results'][0]
+        self.assertEqual(row['ai_predicted_class'], 'Benign')
+        self.assertFalse(row['report']['is_final'])
+
+        report = Report.objects.get(scan=self.scan)
+        report.is_final = True
+        report.save()
+        self.assertTrue(self.get(user, url)['results'][0]['report']['is_final'])
+        self.assertTrue(self.get(user, f'/api/radiology/reports/{report.pk}/')['is_final'])
+        self.assertEqual(payload_cache.stats()['hits'], 0)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('etag-patient@example.com', 'pw', full_name='ETag Patient', role=User.PATIENT)
+        cls.patient = Patient.objects.get(user=cls.user)
+        cls.scan = Scan.objects.create(patient=cls.patient, image='scans/etag/1.png')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_detail_returns_304_until_the_scan_or_report_changes(self):
+        url = f'/api/radiology/scans/{self.scan.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(modified.status_code, 304)
+
+        Report.objects.create(scan=self.scan, content='Findings', impression='Summary')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_has_a_collection_etag(self):
+        url = '/api/radiology/scans/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Scan.objects.create(patient=self.patient, image='scans/etag/2.png')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class MediaViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Before super(): setUpTestData writes the image
+        cls.media_root = tempfile.mkdtemp()
+        cls.overrides = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.overrides.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.overrides.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('media-owner@example.com', 'pw', full_name='Owner', role=User.PATIENT)
+        cls.other = User.objects.create_user('media-other@example.com', 'pw', full_name='Other', role=User.PATIENT)
+        cls.scan = Scan(patient=Patient.objects.get(user=cls.owner))
+        cls.scan.image.save('media.png', make_image(), save=False)
+        cls.scan.save()
+        with open(cls.scan.image.path, 'rb') as f:
+            cls.content = f.read()
+        cls.url = f'/media/{cls.scan.image.name}'
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_owner_gets_full_file_and_ranges(self):
+        client = self.client_for(self.owner)
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        self.assertEqual(client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-').status_code, 416)
+        # Invalid rather than unsatisfiable: ignored
+        response = client.get(self.url, HTTP_RANGE='bytes=5-3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @override_settings(MEDIA_DELIVERY='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_proxy_delivery_hands_off_the_transfer(self):
+        response = self.client_for(self.owner).get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.scan.image.name}')
+        self.assertEqual(response.content, b'')
+
+    # One request each: DRF error responses mark the test transaction for rollback
+    def test_anonymous_users_are_refused(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_other_patients_get_not_found(self):
+        self.assertEqual(self.client_for(self.other).get(self.url).status_code, 404)
+
+
+class DerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.owner = User.objects.create_user('derivatives@example.com', 'pw', full_name='Owner', role=User.PATIENT)
+        buf = io.BytesIO()
+        Image.new('RGB', (600, 400), (90, 40, 40)).save(buf, 'PNG')
+        self.scan = Scan(patient=Patient.objects.get(user=self.owner))
+        self.scan.image.save('large.png', SimpleUploadedFile('large.png', buf.getvalue()), save=False)
+        self.scan.save()
+        self.url = f'/api/radiology/scans/{self.scan.pk}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def fetch_image(self, url):
+        # As an <img> tag would ask
+        response = self.client.get(url, HTTP_ACCEPT='image/jpeg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        return Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_variants_are_downsized_jpegs(self):
+        self.assertEqual(max(self.fetch_image(self.url + 'derivatives/thumbnail/').size), 256)
+        # Never upscaled past the original
+        self.assertEqual(self.fetch_image(self.url + 'derivatives/preview/').size, (600, 400))
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(derivatives.variant_path(self.scan, 'preview')))),
+            ['preview.jpg', 'thumbnail.jpg'],
+        )
+
+    def test_manifest_describes_the_pyramid_and_tiles_are_served(self):
+        manifest = self.client.get(self.url + 'tiles/', {'format': 'json'}).json()
+        self.assertEqual(manifest['tile_url'], f'http://testserver{self.url}tiles/{{level}}/{{col}}_{{row}}/')
+        self.assertEqual((manifest['width'], manifest['height'], manifest['max_level']), (600, 400, 10))
+
+        # Edge tile of the full-size level is cut to what's left of the image
+        tile_url = manifest['tile_url'].format(level=10, col=2, row=1)
+        self.assertEqual(self.fetch_image(tile_url).size, (600 - 512, 400 - 256))
+        self.assertEqual(self.fetch_image(manifest['tile_url'].format(level=0, col=0, row=0)).size, (1, 1))
+
+    def test_derivatives_are_removed_with_the_scan(self):
+        self.fetch_image(self.url + 'derivatives/thumbnail/')
+        self.client.get(self.url + 'tiles/')
+        root = derivatives.scan_root(self.scan.pk)
+        self.assertTrue(os.path.isdir(root))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scan.delete()
+        self.assertFalse(os.path.exists(root))
+
+    def test_oversized_images_are_not_found(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assertEqual(self.client.get(self.url + 'derivatives/preview/').status_code, 404)
+
+
+class ImportScansTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(lambda: os.path.exists(self.checkpoint) and os.remove(self.checkpoint))
+        self.checkpoint = self.source + '.import-checkpoint'
+        overrides = override_settings(MEDIA_ROOT=self.media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        user = User.objects.create_user('import@example.com', 'pw', full_name='Imported Patient', role=User.PATIENT)
+        self.patient = Patient.objects.get(user=user)
+        os.makedirs(os.path.join(self.source, 'import@example.com'))
+        for i in range(3):
+            with open(os.path.join(self.source, 'import@example.com', f'{i}.png'), 'wb') as f:
+                f.write(make_image((i, 50, 50)).read())
+        with open(os.path.join(self.source, 'import@example.com', 'notes.png'), 'w') as f:
+            f.write('not an image')
+
+    def import_scans(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        try:
+            call_command('import_scans', self.source, '--workers', '2', '--batch-size', '2', *args, stdout=out, stderr=err)
+        except CommandError:
+            pass
+        return out.getvalue(), err.getvalue()
+
+    def test_imports_valid_images_once_with_rollups_and_jobs(self):
+        out, err = self.import_scans()
+        self.assertIn('notes.png', err)
+        scans = Scan.objects.filter(patient=self.patient)
+        self.assertEqual(scans.count(), 3)
+        self.assertEqual(InferenceJob.objects.filter(scan__in=scans).count(), 3)
+        self.assertTrue(all(os.path.exists(scan.image.path) for scan in scans))
+        self.assertEqual(set(scans.values_list('ai_status', flat=True)), {Scan.AI_PENDING})
+        self.assertEqual(rollups.diff(), {})
+
+        # Failed files aren't checkpointed and are retried
+        out, err = self.import_scans()
+        self.assertIn('1 file(s) to import', out)
+
+        # A crash after commit but before the checkpoint write: rows are found by hash
+        os.remove(self.checkpoint)
+        out, err = self.import_scans('--skip-ai')
+        self.assertIn('3 duplicate(s)', out)
+        self.assertEqual(scans.count(), 3)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(StandInTestCase):
+    def test_requests_are_measured_and_served_to_the_scraper(self):
+        user = User.objects.create_user('metrics@example.com', 'pw', full_name='Metrics', role=User.PATIENT)
+        labels = {'method': 'GET', 'view': 'scan-list'}
+        before = REGISTRY.get_sample_value('http_request_db_queries_count', labels) or 0
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/api/radiology/scans/').status_code, 200)
+        self.assertEqual(REGISTRY.get_sample_value('http_request_db_queries_count', labels), before + 1)
+
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        scraper = APIClient()
+        scraper.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        response = scraper.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.content.decode(), r'http_request_duration_seconds_count\{[^}]*view="scan-list"\}')
+
+    def test_ai_calls_are_timed_by_phase(self):
+        scan = Scan.objects.create(patient=self.patient, image=make_image((7, 7, 7)))
+        phases = ('connect', 'upload', 'response', 'total')
+
+        def counts():
+            labels = {'model_name': 'resnet50', 'endpoint': 'predict'}
+            return {
+                phase: REGISTRY.get_sample_value('ai_service_call_duration_seconds_count', {**labels, 'phase': phase})
+                or 0
+                for phase in phases
+            }
+
+        before = counts()
+        # A new session, so the call opens its connection
+        self.assertIsNotNone(AIService().predict(scan.image.path, use_cache=False))
+        after = counts()
+        self.assertEqual({phase: after[phase] - before[phase] for phase in phases}, dict.fromkeys(phases, 1))
+
+
+class AIStandInTests(SimpleTestCase):
+    def statuses(self, app):
+        client = app.test_client()
+        image = make_image().read()
+        responses = [client.post('/predict', data={'file': (io.BytesIO(image), 'scan.png')}) for _ in range(20)]
+        return [response.status_code for response in responses], responses
+
+    def test_error_rate_and_payload_are_reproducible(self):
+        app = create_app(error_rate=0.5, payload_kb=1, seed=3)
+        statuses, responses = self.statuses(app)
+        self.assertEqual(set(statuses), {200, 503})
+        self.assertEqual(app.config['stats']['errors'], statuses.count(503))
+        ok = next(response for response in responses if response.status_code == 200)
+        self.assertEqual(len(ok.get_json()['padding']), 1024)
+        self.assertEqual(self.statuses(create_app(error_rate=0.5, seed=3))[0], statuses)
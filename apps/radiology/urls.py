@@ -1,11 +1,26 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ScanViewSet, ReportViewSet
+from .views import (
+    ScanViewSet, ReportViewSet, WorklistViewSet, AIBackfillViewSet, AIActivateModelView,
+    AICacheStatsView, AIPreprocessingStatsView, ScanStatsView, PayloadCacheStatsView,
+)
+from .async_views import AsyncScanView
 
 router = DefaultRouter()
 router.register(r'scans', ScanViewSet, basename='scan')
 router.register(r'reports', ReportViewSet, basename='report')
+router.register(r'worklist', WorklistViewSet, basename='worklist')
+router.register(r'ai/backfills', AIBackfillViewSet, basename='ai-backfill')
 
 urlpatterns = [
+    # Async (ASGI) upload and rerun that wait for the prediction; before the router so
+    # `async` isn't taken for a scan id
+    path('scans/async/', AsyncScanView.as_view(action='create'), name='scan-create-async'),
+    path('scans/<int:pk>/rerun_ai/async/', AsyncScanView.as_view(action='rerun_ai'), name='scan-rerun-ai-async'),
     path('', include(router.urls)),
+    path('ai/activate/', AIActivateModelView.as_view(), name='ai-activate'),
+    path('ai/cache-stats/', AICacheStatsView.as_view(), name='ai-cache-stats'),
+    path('ai/preprocessing-stats/', AIPreprocessingStatsView.as_view(), name='ai-preprocessing-stats'),
+    path('stats/scans/', ScanStatsView.as_view(), name='scan-stats'),
+    path('stats/payload-cache/', PayloadCacheStatsView.as_view(), name='payload-cache-stats'),
 ]
@@ -1,8 +1,28 @@
-from rest_framework import viewsets, permissions, filters, status
+import os
+import re
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.http import Http404
+from django.db.models import Count, Sum
+from PIL import Image
+from rest_framework import viewsets, mixins, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.response import Response
-from .models import Scan, Report
-from .serializers import ScanSerializer, ReportSerializer
+from rest_framework.views import APIView
+from .models import Scan, Report, InferenceJob, CachedPrediction, AIBackfill, ScanPrediction
+from .ai_service import ai_service
+from .conditional import ConditionalGetMixin
+from .pagination import KeysetPagination
+from .search import ScanSearchFilter
+from . import derivatives, media, payload_cache, preprocessing, rollups
+from .serializers import (
+    ScanSerializer, ReportSerializer, InferenceJobSerializer, WorklistSerializer, AIBackfillSerializer,
+    ScanPredictionSerializer, ActivateModelSerializer,
+)
 from apps.users.models import User
 
 class IsPatient(permissions.BasePermission):
@@ -13,21 +33,73 @@ class IsRadiologist(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == User.RADIOLOGIST
 
-class ScanViewSet(viewsets.ModelViewSet):
+
+def visible_scans(user, scans=None):
+    """Scans `user` may see: patients their own, radiologists and admins all of them"""
+    scans = Scan.objects.all() if scans is None else scans
+    if user.role == User.PATIENT:
+        return scans.filter(patient__user_id=user.pk)
+    elif user.role == User.RADIOLOGIST:
+        return scans.all() # Radiologists see all scans
+    elif user.role == User.ADMIN or user.is_staff:
+        return scans.all()
+    return scans.none()
+
+
+class AtomicWritesMixin:
+    """
+    Opts the viewset out of ATOMIC_REQUESTS and only wraps unsafe methods in a
+    transaction, so reads never hold a pooled connection inside BEGIN/COMMIT.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        return transaction.non_atomic_requests(view)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in permissions.SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class AnyContentNegotiation(BaseContentNegotiation):
+    """File responses don't go through a renderer, so any Accept header is fine"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class ScanViewSet(ConditionalGetMixin, AtomicWritesMixin, viewsets.ModelViewSet):
     serializer_class = ScanSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    validator_kind = 'scan'
+    filter_backends = [ScanSearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description', 'patient__user__full_name']
     ordering_fields = ['created_at']
+    ordering = '-created_at'
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == User.PATIENT:
-            return Scan.objects.filter(patient__user=user)
-        elif user.role == User.RADIOLOGIST:
-            return Scan.objects.all() # Radiologists see all scans
-        elif user.role == User.ADMIN or user.is_staff:
-            return Scan.objects.all()
-        return Scan.objects.none()
+        # ScanSerializer reads patient.user.full_name and nests the report with
+        # radiologist.user.full_name; all of it is to-one, so one JOINed query serves every row.
+        # search_vector is only used in WHERE/ranking, so don't ship it with every row.
+        scans = Scan.objects.select_related('patient__user', 'report__radiologist__user').defer('search_vector')
+        return visible_scans(self.request.user, scans)
+
+    def create(self, request, *args, **kwargs):
+        """Store the upload and return 202; the AI prediction runs in the inference worker"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        job = serializer.instance.inference_jobs.order_by('-id').first()
+        headers = self.get_success_headers(serializer.data)
+        # Identical images are answered from the prediction cache without queueing a job
+        response_status = status.HTTP_202_ACCEPTED if job else status.HTTP_201_CREATED
+        return Response(self._with_job(serializer.data, job), status=response_status, headers=headers)
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -40,30 +112,99 @@ class ScanViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def rerun_ai(self, request, pk=None):
-        """Manually trigger AI prediction for a scan"""
+        """
+        Queue a new AI prediction for a scan. A cached prediction for the same image
+        is applied immediately unless `force` is passed.
+        """
         scan = self.get_object()
         if not scan.image:
             return Response({'error': 'No image associated with this scan'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        scan.run_ai_prediction()
-        scan.refresh_from_db()
+
+        force = str(request.data.get('force', '')).lower() in ('1', 'true', 'yes')
+        if not force and scan.apply_cached_ai_result():
+            return Response(self._with_job(self.get_serializer(scan).data, None))
+
+        job = scan.queue_ai_prediction(use_cache=not force)
         serializer = self.get_serializer(scan)
-        return Response(serializer.data)
+        return Response(self._with_job(serializer.data, job), status=status.HTTP_202_ACCEPTED)
 
+    @action(detail=True, methods=['get'])
+    def predictions(self, request, pk=None):
+        """Every model's prediction for the scan, newest first; `is_active` marks the one shown"""
+        scan = self.get_object()
+        predictions = scan.predictions.select_related('scan').order_by('-scored_at', '-id')
+        return Response(ScanPredictionSerializer(predictions, many=True).data)
+
+    # Image loaders send Accept: image/*, which no DRF renderer offers
+    @action(
+        detail=True, methods=['get'], url_path=r'derivatives/(?P<variant>thumbnail|preview)',
+        content_negotiation_class=AnyContentNegotiation,
+    )
+    def derivative(self, request, pk=None, variant=None):
+        """Thumbnail or preview JPEG of the scan image"""
+        scan = self.get_object()
+        path = self._build_derivative(scan, derivatives.get_variant, variant)
+        return self._image_response(path)
+
+    @action(detail=True, methods=['get'], url_path='tiles')
+    def tiles(self, request, pk=None):
+        """Deep Zoom style pyramid manifest; tiles are served at tiles/<level>/<col>_<row>/"""
+        scan = self.get_object()
+        manifest = self._build_derivative(scan, derivatives.tile_manifest)
+        # From the path alone: a query string (?format=json) must not end up mid-template
+        manifest['tile_url'] = request.build_absolute_uri(request.path) + '{level}/{col}_{row}/'
+        return Response(manifest)
+
+    @action(
+        detail=True, methods=['get'], url_path=r'tiles/(?P<level>\d+)/(?P<col>\d+)_(?P<row>\d+)',
+        content_negotiation_class=AnyContentNegotiation,
+    )
+    def tile(self, request, pk=None, level=None, col=None, row=None):
+        scan = self.get_object()
+        path = self._build_derivative(scan, derivatives.tile_path, int(level), int(col), int(row))
+        if not os.path.exists(path):
+            raise Http404('No such tile')
+        return self._image_response(path)
+
+    def _build_derivative(self, scan, builder, *args):
+        if not scan.image:
+            raise Http404('No image associated with this scan')
+        try:
+            return builder(scan, *args)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # Missing file, a format Pillow can't decode, or one too large to decode safely
+            raise Http404(f'No derivative available: {e}')
 
-class ReportViewSet(viewsets.ModelViewSet):
+    def _image_response(self, path):
+        # Paths are keyed by the image hash, so a variant never changes once written
+        return media.serve(self.request, path, content_type='image/jpeg')
+
+    def _with_job(self, data, job):
+        data = dict(data)
+        data['ai_job'] = InferenceJobSerializer(job).data if job else None
+        return data
+
+
+class ReportViewSet(ConditionalGetMixin, AtomicWritesMixin, viewsets.ModelViewSet):
     serializer_class = ReportSerializer
+    validator_kind = 'report'
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['created_at']
+    ordering = '-created_at'
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
+        # ReportSerializer reads radiologist.user.full_name
+        reports = Report.objects.select_related('radiologist__user')
         if user.role == User.PATIENT:
             # Patients can only see reports for their scans
-            return Report.objects.filter(scan__patient__user=user)
+            return reports.filter(scan__patient__user_id=user.pk)
         elif user.role == User.RADIOLOGIST:
             # Radiologists can see all reports, or reports they authored
-            return Report.objects.all()
-        return Report.objects.all()
+            return reports.all()
+        return reports.all()
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -72,3 +213,191 @@ class ReportViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(radiologist=self.request.user.radiologist)
+
+
+class MediaView(APIView):
+    """
+    MEDIA_ROOT behind authentication. Scan images and their derivatives follow the
+    same visibility rules as ScanViewSet; anything else (e.g. preprocessed AI
+    payloads) is staff only. Forbidden files are reported as missing.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    content_negotiation_class = AnyContentNegotiation
+    derivative_re = re.compile(r'^derivatives/(\d+)/')
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Read-only: don't hold a transaction open around the access check
+        return transaction.non_atomic_requests(super().as_view(**initkwargs))
+
+    def get(self, request, path):
+        absolute = media.resolve(path)
+        relative = os.path.relpath(absolute, settings.MEDIA_ROOT).replace(os.sep, '/')
+        if not self.can_read(request.user, relative):
+            raise Http404('No such file')
+        return media.serve(request, absolute)
+
+    def can_read(self, user, relative):
+        if user.role == User.ADMIN or user.is_staff:
+            return True
+        derivative = self.derivative_re.match(relative)
+        if derivative:
+            return visible_scans(user).filter(pk=int(derivative.group(1))).exists()
+        return visible_scans(user).filter(image=relative).exists()
+
+
+class WorklistViewSet(AtomicWritesMixin, viewsets.GenericViewSet):
+    """
+    Triage queue for radiologists: scans without a final report, most likely
+    malignant first, then oldest. Scans claimed by another radiologist are hidden
+    until their claim is released or expires (WORKLIST_CLAIM_TTL).
+    """
+    serializer_class = WorklistSerializer
+    permission_classes = [IsRadiologist]
+    max_limit = 200
+
+    def get_queryset(self):
+        scans = Scan.worklist(self.request.user.radiologist)
+        return scans.select_related('patient__user', 'report__radiologist__user').defer('search_vector')
+
+    def list(self, request):
+        """GET ?limit=N (default RADIOLOGY_PAGE_SIZE); `?mine=true` lists only your claims"""
+        scans = self.get_queryset()
+        if str(request.query_params.get('mine', '')).lower() in ('1', 'true', 'yes'):
+            scans = scans.filter(claimed_by=request.user.radiologist, claimed_until__gte=timezone.now())
+        scans = scans[:self._limit(request.query_params.get('limit'))]
+        return Response(self.get_serializer(scans, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def next(self, request):
+        """Claim the next `count` unclaimed scans (default 1) and return them"""
+        ids = Scan.claim_next(request.user.radiologist, self._limit(request.data.get('count'), default=1))
+        scans = self.get_queryset().filter(pk__in=ids)
+        return Response(self.get_serializer(scans, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def claim(self, request, pk=None):
+        scan = get_object_or_404(Scan, pk=pk)
+        if not scan.claim(request.user.radiologist):
+            return Response({'error': 'Scan is already reported or claimed by another radiologist'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(self.get_queryset().get(pk=pk)).data)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        scan = get_object_or_404(Scan, pk=pk)
+        if not scan.release(request.user.radiologist):
+            return Response({'error': 'You do not hold a claim on this scan'}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _limit(self, value, default=None):
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            limit = default or settings.RADIOLOGY_PAGE_SIZE
+        return max(1, min(limit, self.max_limit))
+
+
+class AIBackfillViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Re-scoring of existing scans against a model (admins). Created backfills are
+    PENDING until `manage.py backfill_ai --pending` runs them; progress, rate and
+    ETA are updated after every batch.
+    """
+    serializer_class = AIBackfillSerializer
+    permission_classes = [permissions.IsAdminUser]
+    queryset = AIBackfill.objects.order_by('-id')
+
+    def perform_create(self, serializer):
+        backfill = serializer.save(created_by_id=self.request.user.pk)
+        backfill.total = backfill.scans().count()
+        backfill.save(update_fields=['total'])
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Stop after the current batch; scans re-scored so far keep their new results"""
+        backfill = self.get_object()
+        AIBackfill.objects.filter(
+            pk=backfill.pk, status__in=[AIBackfill.PENDING, AIBackfill.RUNNING]
+        ).update(status=AIBackfill.CANCELLED, finished_at=timezone.now())
+        backfill.refresh_from_db()
+        return Response(self.get_serializer(backfill).data)
+
+
+class AIActivateModelView(APIView):
+    """
+    Switch every scan scored by `model_name` (optionally a `model_version`) to that
+    prediction, from the stored history; no AI calls. Draft reports follow, final
+    ones don't. Scans the model never scored keep their current prediction.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # activate_model commits chunk by chunk rather than in one long request transaction
+        return transaction.non_atomic_requests(super().as_view(**initkwargs))
+
+    def post(self, request):
+        serializer = ActivateModelSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        model_name = serializer.validated_data['model_name']
+        model_version = serializer.validated_data.get('model_version')
+        if not ScanPrediction.objects.filter(model_name=model_name).exists():
+            return Response({'error': f'No predictions from {model_name}'}, status=status.HTTP_400_BAD_REQUEST)
+        switched = ScanPrediction.activate_model(model_name, model_version)
+        return Response({'model_name': model_name, 'model_version': model_version, 'switched': switched})
+
+
+class AICacheStatsView(APIView):
+    """Prediction cache hit/miss counters (this process) and table totals"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        data = ai_service.cache_stats()
+        data.update(CachedPrediction.objects.aggregate(entries=Count('id'), total_hits=Sum('hit_count')))
+        return Response(data)
+
+
+class AIPreprocessingStatsView(APIView):
+    """Bytes saved by preprocessing and average AI call latency with and without it (this process)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(preprocessing.stats())
+
+
+class PayloadCacheStatsView(APIView):
+    """Hit/miss counters of the scan/report payload cache (this process)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(payload_cache.stats())
+
+
+class ScanStatsView(APIView):
+    """
+    Scan counts from the rollup table, never the scan table.
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD limits the days (inclusive), ?group_by=day,scan_type,...
+    picks the dimensions (default all; pass an empty value for the total only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        dates = {}
+        for param in ('from', 'to'):
+            value = request.query_params.get(param)
+            dates[param] = parse_date(value) if value else None
+            if value and dates[param] is None:
+                return Response({'error': f'Invalid {param} date, expected YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        group_by = rollups.DIMENSIONS
+        if 'group_by' in request.query_params:
+            group_by = [name for name in request.query_params['group_by'].split(',') if name]
+            unknown = set(group_by) - set(rollups.DIMENSIONS)
+            if unknown:
+                return Response(
+                    {'error': f"Unknown group_by field(s): {', '.join(sorted(unknown))}",
+                     'allowed': rollups.DIMENSIONS},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        return Response(rollups.stats(dates['from'], dates['to'], group_by))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Patient, Radiologist
+from .models import User, Patient, Radiologist, OutboxEmail
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 
 class CustomUserCreationForm(UserCreationForm):
@@ -41,6 +41,12 @@ class PatientAdmin(admin.ModelAdmin):
     search_fields = ("user__email", "user__full_name", "previous_breast_disease", "family_breast_cancer")
     list_filter = ("symptoms", "lifestyle")
     
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "to", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject",)
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Patient, PatientAdmin)
 admin.site.register(Radiologist)
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
@@ -0,0 +1,156 @@
+"""
+JWT authentication that can trust the token's claims instead of loading the user.
+
+Tokens issued as ClaimsRefreshToken (login and refresh, see users.serializers)
+carry the user's role, staff and superuser flags and patient/radiologist profile
+ids, and so do the access tokens derived from them. With JWT_TRUST_CLAIMS on, a request
+with such a token gets a ClaimsUser built from them, so permissions and
+querysets run without touching the users table. What a token can't know
+(is the account still active, did the role change since login) is checked
+against a per-user row cached for JWT_CLAIMS_CACHE_TTL seconds and dropped
+whenever the user or a profile is saved or deleted. Tokens without the claims,
+or whose claims no longer match, take the regular database path.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .blacklist import FilteredBlacklistMixin
+from .models import User, Patient, Radiologist
+
+CLAIMS = ("role", "is_staff", "is_superuser", "patient_id", "radiologist_id")
+
+
+def add_claims(token, user_id):
+    """Put the fields permissions and querysets need into `token`"""
+    state = user_state(user_id)
+    for claim in CLAIMS:
+        token[claim] = state.get(claim)
+    return token
+
+
+def state_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def user_state(user_id):
+    """is_active plus the claim fields of a user, cached; {} for a deleted user"""
+    key = state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = User.objects.filter(pk=user_id).values(
+            "is_active", "role", "is_staff", "is_superuser",
+            patient_id=F("patient__id"), radiologist_id=F("radiologist__id")
+        ).first() or {}
+        cache.set(key, state, settings.JWT_CLAIMS_CACHE_TTL)
+    return state
+
+
+def forget_user(user_id):
+    cache.delete(state_key(user_id))
+
+
+class ClaimsRefreshToken(FilteredBlacklistMixin, RefreshToken):
+    """
+    Refresh token stamped with CLAIMS, which its access tokens copy. They are read
+    again on every refresh, so a role change reaches the next access token.
+    Blacklist checks go through the filter in blacklist.py.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return add_claims(super().for_user(user), user.pk)
+
+    def __init__(self, token=None, verify=True):
+        super().__init__(token, verify)
+        if token is not None and api_settings.USER_ID_CLAIM in self.payload:
+            add_claims(self, self.payload[api_settings.USER_ID_CLAIM])
+
+
+class ClaimsUser(TokenUser):
+    """
+    request.user from token claims. Role, staff/superuser flags and profiles come
+    from the token; any other attribute (full_name, email, ...) loads the User row once.
+    TokenUser answers the username, groups and permission checks with empty values,
+    so those are overridden to load the row as well.
+    """
+
+    @cached_property
+    def role(self):
+        return self.token["role"]
+
+    @cached_property
+    def patient(self):
+        # Unsaved stand-ins with the pk are enough for filters and foreign keys
+        if self.token.get("patient_id") is None:
+            raise User.patient.RelatedObjectDoesNotExist("User has no patient.")
+        return Patient(pk=self.token["patient_id"], user_id=self.id)
+
+    @cached_property
+    def radiologist(self):
+        if self.token.get("radiologist_id") is None:
+            raise User.radiologist.RelatedObjectDoesNotExist("User has no radiologist.")
+        return Radiologist(pk=self.token["radiologist_id"], user_id=self.id)
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.id)
+
+    @property
+    def username(self):
+        return self.user.get_username()
+
+    @property
+    def groups(self):
+        return self.user.groups
+
+    @property
+    def user_permissions(self):
+        return self.user.user_permissions
+
+    def get_group_permissions(self, obj=None):
+        return self.user.get_group_permissions(obj)
+
+    def get_all_permissions(self, obj=None):
+        return self.user.get_all_permissions(obj)
+
+    def has_perm(self, perm, obj=None):
+        return self.user.has_perm(perm, obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return self.user.has_perms(perm_list, obj)
+
+    def has_module_perms(self, module):
+        return self.user.has_module_perms(module)
+
+    def __str__(self):
+        return f"ClaimsUser {self.id} ({self.role})"
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.user, attr)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that returns a ClaimsUser when JWT_TRUST_CLAIMS is on"""
+
+    def get_user(self, validated_token):
+        if not settings.JWT_TRUST_CLAIMS or any(claim not in validated_token for claim in CLAIMS):
+            return super().get_user(validated_token)
+
+        state = user_state(validated_token[api_settings.USER_ID_CLAIM])
+        if not state:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not state["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if any(validated_token[claim] != state.get(claim) for claim in CLAIMS):
+            # Role or profile changed since the token was issued (or the cached state predates a claim)
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
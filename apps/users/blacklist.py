@@ -0,0 +1,256 @@
+"""
+Refresh-token blacklist checks that rarely reach the database.
+
+SimpleJWT looks every refresh/logout token up in BlacklistedToken, a table that
+grows by one row per refresh with ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION.
+Here a Bloom filter of the blacklisted jtis answers first: a jti that isn't in it
+was never blacklisted, and only the rare hits (reused tokens plus ~0.1% false
+positives) are confirmed with the usual query.
+
+The filter is built from the unexpired blacklisted tokens and shared through the
+cache, so processes load it instead of scanning the table. It is rebuilt by
+`manage.py purge_expired_tokens` and, failing that, by the first process to find
+it older than JWT_BLACKLIST_REBUILD_INTERVAL. Tokens blacklisted after a build
+are added on top. Every blacklist() publishes its jti under a shared sequence
+number, which other processes pick up from the cache on their next check
+immediately. Every JWT_BLACKLIST_SYNC_INTERVAL seconds, or when they fall too
+far behind, processes also read the newest rows by id, which covers evicted entries.
+
+A filter negative lets a token through, so the filter is only used with a cache
+every process shares. With a per-process cache (locmem, the default without
+CACHE_URL) a token revoked by one worker would pass the others' filters until
+their next sync, so every check goes to the table instead.
+"""
+import hashlib
+import math
+import struct
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+FILTER_KEY = "jwt-blacklist:filter"
+META_KEY = "jwt-blacklist:meta"
+SEQ_KEY = "jwt-blacklist:seq"
+RECENT_KEY = "jwt-blacklist:recent:{}"
+LOCK_KEY = "jwt-blacklist:rebuilding"
+
+# Cache backends that aren't shared between processes
+PER_PROCESS_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+# Published jtis a process reads from the cache in one go; further behind, it reads the table
+MAX_CATCH_UP = 1000
+# Ids re-read below the newest one seen, for transactions that committed out of order
+SYNC_OVERLAP_IDS = 1000
+
+_lock = threading.Lock()
+_state = {"filter": None, "built": None, "seq": 0, "max_id": 0, "synced": 0.0}
+_counters = {"checks": 0, "filter_negatives": 0, "db_checks": 0, "false_positives": 0, "syncs": 0, "rebuilds": 0}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings; `error_rate` holds up to `capacity` items"""
+
+    def __init__(self, capacity, error_rate=0.001, bits=None, hashes=None, data=None):
+        capacity = max(capacity, 1000)
+        self.bits = bits or math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = hashes or max(1, round(self.bits / capacity * math.log(2)))
+        self.data = bytearray(data) if data is not None else bytearray((self.bits + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing over one 128-bit digest
+        a, b = struct.unpack("<QQ", hashlib.blake2b(item.encode(), digest_size=16).digest())
+        return ((a + i * b) % self.bits for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def to_bytes(self):
+        return struct.pack("<QI", self.bits, self.hashes) + bytes(self.data)
+
+    @classmethod
+    def from_bytes(cls, raw):
+        bits, hashes = struct.unpack_from("<QI", raw)
+        return cls(1, bits=bits, hashes=hashes, data=raw[12:])
+
+
+def shared_cache():
+    return settings.CACHES["default"]["BACKEND"] not in PER_PROCESS_CACHES
+
+
+def enabled():
+    return getattr(settings, "JWT_BLACKLIST_FILTER_ENABLED", True) and shared_cache()
+
+
+def blacklisted_in_db(jti):
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def is_blacklisted(jti):
+    """True if the refresh token `jti` is blacklisted"""
+    bloom = current_filter() if enabled() else None
+    if bloom is not None and jti not in bloom:
+        _count(checks=1, filter_negatives=1)
+        return False
+    found = blacklisted_in_db(jti)
+    _count(checks=1, db_checks=1, false_positives=int(bloom is not None and not found))
+    return found
+
+
+def record(jti):
+    """A token was just blacklisted: add it here, and publish it once committed"""
+    with _lock:
+        if _state["filter"] is not None:
+            _state["filter"].add(jti)
+    transaction.on_commit(lambda: _publish(jti))
+
+
+def rebuild():
+    """Build the filter from the unexpired blacklisted tokens and share it; returns its size"""
+    # Anything published or inserted after these marks is caught up on later
+    seq = cache.get(SEQ_KEY, 0)
+    max_id = BlacklistedToken.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+    jtis = BlacklistedToken.objects.filter(
+        id__lte=max_id, token__expires_at__gt=aware_utcnow()
+    ).values_list("token__jti", flat=True)
+    bloom = BloomFilter(int(jtis.count() * 1.5), settings.JWT_BLACKLIST_FILTER_ERROR_RATE)
+    for jti in jtis.iterator(chunk_size=10000):
+        bloom.add(jti)
+
+    meta = {"built": time.time(), "seq": seq, "max_id": max_id}
+    cache.set_many({FILTER_KEY: bloom.to_bytes(), META_KEY: meta}, timeout=None)
+    with _lock:
+        _state.update(filter=bloom, built=meta["built"], seq=seq, max_id=max_id, synced=time.monotonic())
+    _count(rebuilds=1)
+    return bloom
+
+
+def current_filter():
+    """This process's filter, brought up to date; None if there is none to use yet"""
+    shared = cache.get_many([META_KEY, SEQ_KEY])
+    meta, seq = shared.get(META_KEY), shared.get(SEQ_KEY, 0)
+
+    if meta is None or time.time() - meta["built"] > settings.JWT_BLACKLIST_REBUILD_INTERVAL:
+        # Missing, evicted or due: one process rebuilds, the others go on with what they have
+        if cache.add(LOCK_KEY, True, timeout=300):
+            try:
+                return rebuild()
+            finally:
+                cache.delete(LOCK_KEY)
+        if meta is None:
+            return _state["filter"]
+
+    with _lock:
+        loaded = _state["built"] == meta["built"]
+    if not loaded:
+        raw = cache.get(FILTER_KEY)
+        if raw is None:
+            return None
+        with _lock:
+            _state.update(
+                filter=BloomFilter.from_bytes(raw), built=meta["built"], seq=meta["seq"],
+                max_id=meta["max_id"], synced=0.0,
+            )
+
+    with _lock:
+        behind = seq - _state["seq"]
+        due = time.monotonic() - _state["synced"] >= settings.JWT_BLACKLIST_SYNC_INTERVAL
+    if due or behind > MAX_CATCH_UP:
+        _sync_from_db(seq)
+    elif behind > 0:
+        _catch_up(seq)
+    return _state["filter"]
+
+
+def _catch_up(seq):
+    """Add the jtis other processes published since our last look"""
+    with _lock:
+        start = _state["seq"]
+    keys = [RECENT_KEY.format(n) for n in range(start + 1, seq + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        # Some expired or were evicted
+        _sync_from_db(seq)
+        return
+    with _lock:
+        for jti in found.values():
+            _state["filter"].add(jti)
+        _state["seq"] = max(_state["seq"], seq)
+
+
+def _sync_from_db(seq):
+    """Add the newest blacklisted tokens, by id, to the local filter"""
+    with _lock:
+        since = _state["max_id"] - SYNC_OVERLAP_IDS
+    rows = list(BlacklistedToken.objects.filter(id__gt=since).values_list("id", "token__jti"))
+    with _lock:
+        for _, jti in rows:
+            _state["filter"].add(jti)
+        _state.update(
+            seq=max(_state["seq"], seq), max_id=max([_state["max_id"]] + [pk for pk, _ in rows]),
+            synced=time.monotonic(),
+        )
+    _count(syncs=1)
+
+
+def _publish(jti):
+    cache.add(SEQ_KEY, 0, timeout=None)
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        # Evicted in between; the periodic sync covers it
+        return
+    cache.set(RECENT_KEY.format(seq), jti, timeout=settings.JWT_BLACKLIST_REBUILD_INTERVAL)
+
+
+def _count(**amounts):
+    with _lock:
+        for key, amount in amounts.items():
+            _counters[key] += amount
+
+
+def stats():
+    """Counters of this process and the size of its filter"""
+    with _lock:
+        c = dict(_counters)
+        bloom = _state["filter"]
+    return {
+        **c,
+        "db_check_rate": round(c["db_checks"] / c["checks"], 4) if c["checks"] else None,
+        "filter_bytes": len(bloom.data) if bloom is not None else None,
+    }
+
+
+def reset():
+    """Forget this process's filter and counters (tests and benchmarks)"""
+    with _lock:
+        _state.update(filter=None, built=None, seq=0, max_id=0, synced=0.0)
+        for key in _counters:
+            _counters[key] = 0
+
+
+class FilteredBlacklistMixin:
+    """For BlacklistMixin token classes: check the filter first, keep it current on blacklist()"""
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        record(self.payload[api_settings.JTI_CLAIM])
+        return result
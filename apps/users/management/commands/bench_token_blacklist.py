@@ -0,0 +1,93 @@
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+from backend.benchmarking import summarize, format_summary
+from apps.users import blacklist
+from apps.users.authentication import ClaimsRefreshToken
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh and logout throughput against the size of the token blacklist, with and without "
+        "the Bloom filter in front of it. Seeded tokens are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000", help="Blacklisted tokens to seed, comma-separated")
+        parser.add_argument("--requests", type=int, default=200, help="Refreshes and logouts per run")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["sizes"].split(","))
+        caches, file_cache = settings.CACHES, None
+        if not blacklist.shared_cache():
+            # The filter is off with per-process caches; a file cache stands in for Redis
+            file_cache = tempfile.mkdtemp(prefix="bench-blacklist-")
+            caches = {
+                "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": file_cache}
+            }
+            self.stdout.write("CACHE_URL not set: the filter runs use a file cache")
+        with transaction.atomic(), override_settings(CACHES=caches):
+            user = User.objects.create_user(
+                "bench-blacklist@example.com", "pw", full_name="Bench Blacklist", role=User.ADMIN, is_active=True
+            )
+            seeded = 0
+            for size in sizes:
+                self._seed(user, size - seeded)
+                seeded = size
+                for label, enabled in (("no filter", False), ("bloom filter", True)):
+                    blacklist.reset()
+                    cache.delete_many([blacklist.META_KEY, blacklist.FILTER_KEY])
+                    with override_settings(JWT_BLACKLIST_FILTER_ENABLED=enabled, JWT_BLACKLIST_SYNC_INTERVAL=3600):
+                        if enabled:
+                            start = time.perf_counter()
+                            bloom = blacklist.rebuild()
+                            self.stdout.write(
+                                f"{size} blacklisted: filter built in {time.perf_counter() - start:.2f}s, "
+                                f"{len(bloom.data) / 1024:.0f} KiB"
+                            )
+                        for name, url in (("refresh", "/api/auth/jwt/refresh/"), ("logout", "/api/auth/logout/")):
+                            queries, summary = self._run(user, url, options["requests"])
+                            self.stdout.write(
+                                format_summary(f"{size} {name} ({label})", summary) + f"  queries/request={queries}"
+                            )
+                    if enabled:
+                        self.stdout.write(f"  db check rate: {blacklist.stats()['db_check_rate']}")
+
+            transaction.set_rollback(True)
+        blacklist.reset()
+        if file_cache:
+            shutil.rmtree(file_cache, ignore_errors=True)
+
+    def _run(self, user, url, count):
+        tokens = [str(ClaimsRefreshToken.for_user(user)) for _ in range(count)]
+        client = APIClient()
+        latencies = []
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for token in tokens:
+                request_start = time.perf_counter()
+                response = client.post(url, {"refresh": token})
+                latencies.append(time.perf_counter() - request_start)
+                assert response.status_code == 200, response.content
+        return round(len(queries) / count, 2), summarize(latencies, time.perf_counter() - start)
+
+    def _seed(self, user, count):
+        expires = aware_utcnow() + timedelta(days=1)
+        for offset in range(0, count, 5000):
+            tokens = OutstandingToken.objects.bulk_create([
+                OutstandingToken(user=user, jti=uuid.uuid4().hex, token="", expires_at=expires)
+                for _ in range(min(5000, count - offset))
+            ])
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
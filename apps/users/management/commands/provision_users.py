@@ -0,0 +1,44 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.users import provisioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users with their patient/radiologist profiles from a CSV or JSON file. Columns: "
+        "email, full_name, role, gender, age, password, license_id, hospital and the patient history "
+        "fields. Invalid rows are listed and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help=".csv or .json file")
+        parser.add_argument("--activate", action="store_true", help="Mark the users active")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes hashing passwords")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Users inserted per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Only validate")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["source"], encoding="utf-8-sig") as f:
+                rows = provisioning.read_rows(f, options["source"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        result = provisioning.provision(
+            rows, activate=options["activate"], workers=options["workers"],
+            chunk_size=max(1, options["chunk_size"]), dry_run=options["dry_run"],
+        )
+        for error in result["errors"]:
+            messages = "; ".join(f"{field}: {' '.join(map(str, problems))}" for field, problems in error["errors"].items())
+            self.stderr.write(f"Row {error['row']} ({error['email']}): {messages}")
+
+        elapsed = time.monotonic() - started
+        verb = "Validated" if options["dry_run"] else "Created"
+        count = len(rows) - len(result["errors"]) if options["dry_run"] else len(result["created"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {count} of {len(rows)} user(s) in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f}/s)"
+        ))
+        if result["errors"]:
+            raise CommandError(f"{len(result['errors'])} row(s) failed, see above")
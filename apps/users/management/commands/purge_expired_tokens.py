@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+from apps.users import blacklist
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding/blacklisted refresh tokens in short batches, then rebuild the "
+        "blacklist filter. Meant for cron, e.g. every 15 minutes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Tokens deleted per transaction")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the expired tokens")
+        parser.add_argument("--no-rebuild", action="store_true", help="Leave the blacklist filter as it is")
+
+    def handle(self, *args, **options):
+        # Tokens expiring while this runs are left for the next run
+        now = aware_utcnow()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now)
+        if options["dry_run"]:
+            self.stdout.write(f"{expired.count()} expired token(s)")
+            return
+
+        deleted, started = 0, time.monotonic()
+        while True:
+            ids = list(expired.order_by("id").values_list("id", flat=True)[:max(1, options["batch_size"])])
+            if not ids:
+                break
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f"{deleted} deleted, {deleted / (time.monotonic() - started):.0f} tokens/s")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired token(s)"))
+        if not options["no_rebuild"] and blacklist.enabled():
+            bloom = blacklist.rebuild()
+            self.stdout.write(f"Rebuilt the blacklist filter ({len(bloom.data) / 1024:.0f} KiB)")
@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.users import outbox
+from apps.users.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = "Deliver emails from the outbox (run one or more of these next to the web workers)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Emails claimed per poll")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--stale-after", type=int, default=300, help="Requeue SENDING emails older than this many seconds")
+        parser.add_argument("--keep-days", type=int, default=7, help="Delete sent emails after this many days")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        self.stdout.write("Email sender started")
+        conn = None
+        last_prune = 0.0
+
+        while True:
+            close_old_connections()
+
+            if time.monotonic() - last_prune >= 3600:
+                pruned = OutboxEmail.prune(timedelta(days=options["keep_days"]))
+                if pruned:
+                    self.stdout.write(f"Deleted {pruned} sent email(s)")
+                last_prune = time.monotonic()
+
+            requeued = OutboxEmail.requeue_stale(stale_after)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale email(s)")
+
+            emails = OutboxEmail.claim(limit=options["batch_size"])
+            if emails:
+                # One connection for as long as there is mail to send
+                conn = conn or outbox.connection()
+                sent, failed, deferred = outbox.deliver(emails, conn)
+                self.stdout.write(f"Sent {sent}, failed {failed}, deferred {deferred}")
+                if not deferred:
+                    continue
+
+            # Idle or the server is down: don't hold the connection open
+            if conn is not None:
+                conn.close()
+                conn = None
+            if options["once"]:
+                break
+            time.sleep(options["poll_interval"])
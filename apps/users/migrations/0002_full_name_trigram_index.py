@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+FULL_NAME_TRGM_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=["full_name"], name="users_full_name_trgm_idx", opclasses=["gin_trgm_ops"]
+)
+
+
+def add_trigram_index(apps, schema_editor):
+    # gin_trgm_ops only exists on PostgreSQL; other databases keep plain scans
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("users", "User"), FULL_NAME_TRGM_INDEX)
+
+
+def remove_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(
+            apps.get_model("users", "User"), FULL_NAME_TRGM_INDEX
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name="user", index=FULL_NAME_TRGM_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_trigram_index, remove_trigram_index),
+            ],
+        ),
+    ]
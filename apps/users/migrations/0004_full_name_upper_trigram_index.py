@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 18:20
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+FULL_NAME_TRGM_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=["full_name"], name="users_full_name_trgm_idx", opclasses=["gin_trgm_ops"]
+)
+FULL_NAME_UPPER_TRGM_INDEX = django.contrib.postgres.indexes.GinIndex(
+    django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper("full_name"), name="gin_trgm_ops"),
+    name="users_full_name_upper_trgm_idx",
+)
+
+
+def index_upper_full_name(apps, schema_editor):
+    # gin_trgm_ops only exists on PostgreSQL; other databases keep plain scans
+    if schema_editor.connection.vendor == "postgresql":
+        User = apps.get_model("users", "User")
+        schema_editor.remove_index(User, FULL_NAME_TRGM_INDEX)
+        schema_editor.add_index(User, FULL_NAME_UPPER_TRGM_INDEX)
+
+
+def index_raw_full_name(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        User = apps.get_model("users", "User")
+        schema_editor.remove_index(User, FULL_NAME_UPPER_TRGM_INDEX)
+        schema_editor.add_index(User, FULL_NAME_TRGM_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_outbox_email"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(model_name="user", name="users_full_name_trgm_idx"),
+                migrations.AddIndex(model_name="user", index=FULL_NAME_UPPER_TRGM_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(index_upper_full_name, index_raw_full_name),
+            ],
+        ),
+    ]
@@ -1,5 +1,10 @@
+from datetime import timedelta
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Upper
+from django.utils import timezone
 from .managers import UserManager
 
 class User(AbstractUser):
@@ -40,6 +45,13 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Trigram index so partial name searches don't scan the table. On the
+            # expression icontains compiles to, UPPER(full_name) LIKE '%TERM%'
+            GinIndex(OpClass(Upper("full_name"), name="gin_trgm_ops"), name="users_full_name_upper_trgm_idx"),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.role})"
 
@@ -80,3 +92,114 @@ class Radiologist(models.Model):
 
     def __str__(self):
         return f"RAD-{self.user.id} {self.user.full_name}"
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent (see outbox.py). Rows are written in the sender's
+    transaction and delivered by the `send_emails` worker.
+    """
+    PENDING = "PENDING"
+    SENDING = "SENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    # Base delay between retries, doubled on every failed attempt
+    RETRY_DELAY = timedelta(seconds=30)
+
+    subject = models.TextField()
+    body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+    # [content, mimetype] pairs, e.g. the HTML version of a Djoser email
+    alternatives = models.JSONField(default=list)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Sent emails stay until send_emails prunes them (--keep-days); the poll only needs the unsent few
+            models.Index(
+                fields=["run_after", "id"],
+                condition=Q(status="PENDING"),
+                name="users_outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"OutboxEmail {self.pk} to {', '.join(self.to)} ({self.status})"
+
+    @classmethod
+    def claim(cls, limit=50):
+        """Atomically claim up to `limit` due emails; concurrent workers skip each other's rows"""
+        now = timezone.now()
+        with transaction.atomic():
+            emails = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(status=cls.PENDING, run_after__lte=now)
+                .order_by("run_after", "id")[:limit]
+            )
+            cls.objects.filter(pk__in=[email.pk for email in emails]).update(
+                status=cls.SENDING, started_at=now, attempts=F("attempts") + 1
+            )
+        for email in emails:
+            email.status = cls.SENDING
+            email.started_at = now
+            email.attempts += 1
+        return emails
+
+    @classmethod
+    def requeue_stale(cls, older_than):
+        """Put emails abandoned by a crashed worker back in the outbox"""
+        cutoff = timezone.now() - older_than
+        return cls.objects.filter(status=cls.SENDING, started_at__lt=cutoff).update(
+            status=cls.PENDING, run_after=timezone.now()
+        )
+
+    @classmethod
+    def mark_sent(cls, emails):
+        now = timezone.now()
+        cls.objects.filter(pk__in=[email.pk for email in emails]).update(status=cls.SENT, sent_at=now, last_error="")
+        for email in emails:
+            email.status, email.sent_at, email.last_error = cls.SENT, now, ""
+
+    def mark_failed(self, error, retry=True):
+        self.last_error = str(error)
+        if retry and self.attempts < self.max_attempts:
+            # Back off and let a later poll pick it up again
+            self.status = OutboxEmail.PENDING
+            self.run_after = timezone.now() + self.RETRY_DELAY * (2 ** (self.attempts - 1))
+        else:
+            self.status = OutboxEmail.FAILED
+        self.save(update_fields=["status", "run_after", "last_error"])
+
+    def defer(self, delay):
+        """Back in the outbox without counting the attempt (the mail server was unreachable)"""
+        self.status = OutboxEmail.PENDING
+        self.attempts = max(0, self.attempts - 1)
+        self.run_after = timezone.now() + delay
+        self.save(update_fields=["status", "attempts", "run_after"])
+
+    @classmethod
+    def prune(cls, older_than):
+        """Delete emails sent more than `older_than` ago; returns how many"""
+        deleted, _ = cls.objects.filter(status=cls.SENT, sent_at__lt=timezone.now() - older_than).delete()
+        return deleted
@@ -0,0 +1,123 @@
+"""
+Transactional email outbox.
+
+With EMAIL_BACKEND set to OutboxEmailBackend, sending an email (Djoser's
+activation, confirmation and password reset emails included) only inserts an
+OutboxEmail row. It is part of the request's transaction, so a rolled-back
+signup sends nothing, and the request never waits for the mail server. The
+`send_emails` worker claims due rows in batches and delivers them through
+EMAIL_DELIVERY_BACKEND over one connection that stays open while there is
+work. Failed emails are retried with exponential backoff; when the server
+can't be reached the batch is put back without counting the attempt.
+Delivery is at least once: a worker that dies between sending and marking
+rows sent leaves them to be requeued and sent again.
+"""
+import logging
+import smtplib
+import socket
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Connection-level failures: reconnect once, then leave the rest of the batch for later
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout, socket.gaierror,
+)
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Stores messages as OutboxEmail rows for `send_emails`"""
+
+    def send_messages(self, email_messages):
+        rows, direct = [], []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            if message.attachments:
+                # Attachments aren't stored; these few go out right away
+                direct.append(message)
+            else:
+                rows.append(to_row(message))
+        try:
+            OutboxEmail.objects.bulk_create(rows)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            rows = []
+        sent = len(rows)
+        if direct:
+            sent += get_connection(settings.EMAIL_DELIVERY_BACKEND, fail_silently=self.fail_silently).send_messages(
+                direct
+            ) or 0
+        return sent
+
+
+def to_row(message):
+    return OutboxEmail(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+        alternatives=[[content, mimetype] for content, mimetype in getattr(message, "alternatives", [])],
+    )
+
+
+def to_message(email, connection=None):
+    message = EmailMultiAlternatives(
+        subject=email.subject, body=email.body, from_email=email.from_email, to=email.to, cc=email.cc,
+        bcc=email.bcc, reply_to=email.reply_to, headers=email.headers, connection=connection,
+    )
+    for content, mimetype in email.alternatives:
+        message.attach_alternative(content, mimetype)
+    return message
+
+
+def connection():
+    """A connection to the real mail backend, for deliver() to reuse across batches"""
+    return get_connection(settings.EMAIL_DELIVERY_BACKEND)
+
+
+def deliver(emails, conn):
+    """
+    Send claimed OutboxEmails one by one over `conn` and record each outcome;
+    returns (sent, failed, deferred) counts.
+    """
+    sent, failed, deferred = [], 0, 0
+    reconnected = False
+    pending = list(emails)
+    while pending:
+        email = pending[0]
+        try:
+            conn.open()
+            conn.send_messages([to_message(email)])
+        except CONNECTION_ERRORS as e:
+            conn.close()
+            if not reconnected:
+                reconnected = True
+                continue
+            # Server unreachable: don't burn attempts, try again later
+            for email in pending:
+                email.defer(OutboxEmail.RETRY_DELAY)
+            deferred = len(pending)
+            logger.warning("Mail server unreachable, deferring %s email(s): %s", deferred, e)
+            break
+        except smtplib.SMTPRecipientsRefused as e:
+            # Retrying won't make the address valid
+            email.mark_failed(e, retry=False)
+            failed += 1
+        except Exception as e:
+            email.mark_failed(e)
+            failed += 1
+        else:
+            sent.append(email)
+        pending.pop(0)
+
+    OutboxEmail.mark_sent(sent)
+    return len(sent), failed, deferred
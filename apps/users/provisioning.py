@@ -0,0 +1,143 @@
+"""
+Bulk creation of users with their patient/radiologist profiles.
+
+Rows are validated one by one (BulkUserSerializer) and against each other and
+the database (duplicate emails and license ids), so every bad row is reported
+with its errors while the rest go through. Password hashing, the slow part,
+runs in a process pool. Users and profiles are then inserted with bulk_create,
+`chunk_size` users per transaction. bulk_create sends no post_save signals,
+which is fine for new users: the only profile the signals would create
+(Patient) is inserted here, and the search/payload signals ignore created users.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from .models import User, Patient, Radiologist
+from .serializers import BulkUserSerializer
+
+PATIENT_FIELDS = ("previous_breast_disease", "family_breast_cancer", "hormonal_therapy", "symptoms", "lifestyle")
+
+
+def read_rows(f, name):
+    """Rows from an uploaded or opened .csv/.json file; JSON may be a list or {"users": [...]}"""
+    content = f.read()
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    if name.endswith(".json"):
+        rows = json.loads(content)
+        rows = rows.get("users", []) if isinstance(rows, dict) else rows
+    elif name.endswith(".csv"):
+        # Empty cells mean "not given"
+        rows = [{key: value for key, value in row.items() if value not in ("", None)}
+                for row in csv.DictReader(io.StringIO(content))]
+    else:
+        raise ValueError("Expected a .csv or .json file")
+    if not isinstance(rows, list):
+        raise ValueError("Expected a list of users")
+    return rows
+
+
+def hash_passwords(passwords):
+    """make_password for each password; runs in the process pool"""
+    return [make_password(password) for password in passwords]
+
+
+def provision(rows, activate=False, workers=None, chunk_size=500, dry_run=False):
+    """
+    Create the valid rows' users and profiles. Returns
+    {"created": [{"row", "id", "email"}], "errors": [{"row", "email", "errors"}]},
+    rows numbered from 1 in input order. `activate` marks the users active
+    (otherwise they go through password reset/activation as usual).
+    """
+    valid, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        serializer = BulkUserSerializer(data=row if isinstance(row, dict) else {})
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            errors.append(_error(number, row, serializer.errors))
+
+    valid = _drop_conflicts(valid, errors)
+    if dry_run or not valid:
+        return {"created": [], "errors": sorted(errors, key=lambda e: e["row"])}
+
+    hashes = _hash_all([data.get("password") or None for _, data in valid], workers)
+    created = []
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            created += _insert(chunk, hashes[start:start + chunk_size], activate)
+        except IntegrityError as e:
+            # Lost a race with another signup; the rest of the batch goes on
+            errors += [_error(number, data, {"non_field_errors": [str(e)]}) for number, data in chunk]
+    return {"created": created, "errors": sorted(errors, key=lambda e: e["row"])}
+
+
+def _drop_conflicts(valid, errors):
+    """Rows whose email or license id is already taken, in the database or by an earlier row"""
+    emails = [data["email"] for _, data in valid]
+    licenses = [data["license_id"] for _, data in valid if data["role"] == User.RADIOLOGIST]
+    taken_emails, taken_licenses = set(), set()
+    for i in range(0, max(len(emails), len(licenses)), 1000):
+        taken_emails.update(User.objects.filter(email__in=emails[i:i + 1000]).values_list("email", flat=True))
+        taken_licenses.update(
+            Radiologist.objects.filter(license_id__in=licenses[i:i + 1000]).values_list("license_id", flat=True)
+        )
+
+    kept = []
+    for number, data in valid:
+        if data["email"] in taken_emails:
+            errors.append(_error(number, data, {"email": ["A user with this email already exists."]}))
+        elif data["role"] == User.RADIOLOGIST and data["license_id"] in taken_licenses:
+            errors.append(_error(number, data, {"license_id": ["A radiologist with this license id already exists."]}))
+        else:
+            taken_emails.add(data["email"])
+            if data["role"] == User.RADIOLOGIST:
+                taken_licenses.add(data["license_id"])
+            kept.append((number, data))
+    return kept
+
+
+def _hash_all(passwords, workers):
+    # No password: an unusable one, set through password reset later
+    to_hash = [password for password in passwords if password]
+    workers = max(1, workers or os.cpu_count() or 1)
+    if workers == 1 or len(to_hash) < 2 * workers:
+        hashed = hash_passwords(to_hash)
+    else:
+        size = -(-len(to_hash) // (workers * 4))
+        parts = [to_hash[i:i + size] for i in range(0, len(to_hash), size)]
+        with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+            hashed = [value for part in pool.map(hash_passwords, parts) for value in part]
+    hashed = iter(hashed)
+    return [next(hashed) if password else make_password(None) for password in passwords]
+
+
+def _insert(chunk, hashes, activate):
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                email=data["email"], full_name=data["full_name"], role=data["role"],
+                gender=data.get("gender", ""), age=data.get("age"), password=password, is_active=activate,
+            )
+            for (_, data), password in zip(chunk, hashes)
+        ])
+        Patient.objects.bulk_create([
+            Patient(user=user, **{field: data[field] for field in PATIENT_FIELDS if field in data})
+            for user, (_, data) in zip(users, chunk) if user.role == User.PATIENT
+        ])
+        Radiologist.objects.bulk_create([
+            Radiologist(user=user, license_id=data["license_id"], hospital=data.get("hospital", ""))
+            for user, (_, data) in zip(users, chunk) if user.role == User.RADIOLOGIST
+        ])
+    return [{"row": number, "id": user.pk, "email": user.email} for user, (number, _) in zip(users, chunk)]
+
+
+def _error(number, row, errors):
+    email = row.get("email") if isinstance(row, dict) else None
+    return {"row": number, "email": email, "errors": errors}
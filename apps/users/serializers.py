@@ -1,7 +1,13 @@
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import (
+    TokenBlacklistSerializer, TokenObtainPairSerializer, TokenRefreshSerializer,
+)
+from .authentication import ClaimsRefreshToken
 from .models import Radiologist, Patient
 
 User = get_user_model()
@@ -141,3 +147,63 @@ class ManualUserCreateSerializer(serializers.ModelSerializer):
 
         return user
 
+
+class BulkUserSerializer(serializers.Serializer):
+    """One row of a bulk import (see provisioning.py); validation only, no database access"""
+    email = serializers.EmailField(max_length=254)
+    full_name = serializers.CharField(max_length=256)
+    role = serializers.ChoiceField(choices=User.ROLE_CHOICES, default=User.PATIENT)
+    gender = serializers.ChoiceField(choices=User.GENDER_CHOICES, required=False, allow_blank=True)
+    age = serializers.IntegerField(required=False, allow_null=True, min_value=0, max_value=150)
+    # Optional: without one the user sets it through password reset
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
+    # Radiologist Fields
+    license_id = serializers.CharField(max_length=150, required=False, allow_blank=True)
+    hospital = serializers.CharField(max_length=300, required=False, allow_blank=True)
+
+    # Patient Fields
+    previous_breast_disease = serializers.CharField(max_length=300, required=False, allow_blank=True)
+    family_breast_cancer = serializers.CharField(max_length=300, required=False, allow_blank=True)
+    hormonal_therapy = serializers.CharField(max_length=300, required=False, allow_blank=True)
+    symptoms = serializers.ChoiceField(choices=Patient.sypmtoms_options, required=False)
+    lifestyle = serializers.ChoiceField(choices=Patient.lifestyle_options, required=False)
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+    def validate(self, attrs):
+        if attrs["role"] == User.RADIOLOGIST and not attrs.get("license_id"):
+            raise serializers.ValidationError({"license_id": "This field is required for Radiologists."})
+        if attrs.get("password"):
+            try:
+                validate_password(attrs["password"], User(email=attrs["email"], full_name=attrs["full_name"]))
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({"password": list(e.messages)})
+        return attrs
+
+
+class BulkUserUploadSerializer(serializers.Serializer):
+    """Body of POST /api/auth/users/bulk/: a users list or a .csv/.json file"""
+    users = serializers.ListField(child=serializers.DictField(), required=False)
+    file = serializers.FileField(required=False)
+    activate = serializers.BooleanField(default=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if ("users" in attrs) == ("file" in attrs):
+            raise serializers.ValidationError("Send either `users` or `file`.")
+        return attrs
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # Role and profile ids in the token, see authentication.ClaimsJWTAuthentication
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = ClaimsRefreshToken
@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Patient
+from .authentication import forget_user
+from .models import Patient, Radiologist
 
 User = get_user_model()
 
@@ -11,3 +12,18 @@ def create_user_profile(sender, instance, created, **kwargs):
         if instance.role == "PATIENT":
             Patient.objects.get_or_create(user=instance)
         # Radiologist profile is handled in the Serializer due to extra field requirements
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    # Cached is_active/role behind token claims (see authentication.py)
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Radiologist)
+@receiver(post_delete, sender=Radiologist)
+def forget_profile_owner_state(sender, instance, **kwargs):
+    forget_user(instance.user_id)
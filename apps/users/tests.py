@@ -1,3 +1,209 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+import shutil
+import smtplib
+import tempfile
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+from . import blacklist
+from .authentication import ClaimsJWTAuthentication, ClaimsRefreshToken, ClaimsUser, add_claims
+from .models import User, Patient, Radiologist, OutboxEmail
 
-# Create your tests here.
+
+@override_settings(JWT_TRUST_CLAIMS=True)
+class ClaimsAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            "claims-patient@example.com", "pw", full_name="Claims Patient", role=User.PATIENT, is_active=True
+        )
+        cls.patient = Patient.objects.get(user=cls.user)
+
+    def setUp(self):
+        # Cached user state outlives the rolled-back test transactions
+        cache.clear()
+
+    def login(self):
+        response = APIClient().post("/api/auth/jwt/create/", {"email": self.user.email, "password": "pw"})
+        self.assertEqual(response.status_code, 200, response.content)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        return client, AccessToken(response.json()["access"])
+
+    def test_trusted_claims_skip_the_user_lookup(self):
+        client, token = self.login()
+        self.assertEqual((token["role"], token["patient_id"]), (User.PATIENT, self.patient.pk))
+        client.get("/api/radiology/scans/")  # fills the cached user state
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get("/api/radiology/scans/").status_code, 200)
+
+    def test_deactivated_user_is_rejected_despite_a_valid_token(self):
+        client, _ = self.login()
+        self.assertEqual(client.get("/api/radiology/scans/").status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get("/api/radiology/scans/").status_code, 401)
+
+    def test_superusers_keep_their_permissions(self):
+        admin = User.objects.create_superuser("claims-admin@example.com", "pw", full_name="Claims Admin")
+        token = AccessToken.for_user(admin)
+        add_claims(token, admin.pk)
+        user = ClaimsJWTAuthentication().get_user(token)
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertTrue(user.is_superuser)
+        self.assertTrue(user.has_perm("radiology.delete_scan"))
+        self.assertTrue(user.has_perms(["radiology.add_scan", "users.change_user"]))
+        self.assertEqual(user.get_username(), "claims-admin@example.com")
+
+        # Regular users get only what they were granted
+        patient = ClaimsJWTAuthentication().get_user(add_claims(AccessToken.for_user(self.user), self.user.pk))
+        self.assertFalse(patient.is_superuser)
+        self.assertFalse(patient.has_perm("radiology.delete_scan"))
+
+
+@override_settings(JWT_BLACKLIST_FILTER_ENABLED=True)
+class BlacklistFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            "filter-user@example.com", "pw", full_name="Filter User", role=User.ADMIN, is_active=True
+        )
+
+    def setUp(self):
+        # The filter needs a cache shared between processes; a file cache is one
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        overrides = override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}
+            }
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        blacklist.reset()
+
+    def test_logged_out_token_cannot_refresh(self):
+        refresh = str(ClaimsRefreshToken.for_user(self.user))
+        client = APIClient()
+        self.assertEqual(client.post("/api/auth/logout/", {"refresh": refresh}).status_code, 200)
+        self.assertEqual(client.post("/api/auth/jwt/refresh/", {"refresh": refresh}).status_code, 401)
+        # Only the reused token went to the database
+        self.assertEqual(blacklist.stats()["db_checks"], 1)
+
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0)
+    def test_tokens_blacklisted_by_other_processes_are_picked_up(self):
+        token = ClaimsRefreshToken.for_user(self.user)
+        self.assertFalse(blacklist.is_blacklisted(token["jti"]))
+        # Plain SimpleJWT blacklisting, so nothing reaches this process's filter directly
+        RefreshToken(str(token)).blacklist()
+        self.assertTrue(blacklist.is_blacklisted(token["jti"]))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_per_process_caches_check_every_token_in_the_database(self):
+        self.assertFalse(blacklist.enabled())
+        token = ClaimsRefreshToken.for_user(self.user)
+        self.assertFalse(blacklist.is_blacklisted(token["jti"]))
+        self.assertEqual(blacklist.stats()["db_checks"], 1)
+
+    def test_purge_deletes_expired_tokens_in_batches(self):
+        expired = aware_utcnow() - timedelta(minutes=1)
+        OutstandingToken.objects.bulk_create(
+            [OutstandingToken(user=self.user, jti=f"expired-{i}", token="", expires_at=expired) for i in range(5)]
+        )
+        live = ClaimsRefreshToken.for_user(self.user)
+        call_command("purge_expired_tokens", batch_size=2, stdout=io.StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list("jti", flat=True)), [live["jti"]])
+
+
+class BulkProvisioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            "bulk-admin@example.com", "pw", full_name="Bulk Admin", role=User.ADMIN, is_staff=True, is_active=True
+        )
+
+    def test_valid_rows_are_created_and_bad_rows_reported(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        users = [
+            {"email": "bulk-patient@example.com", "full_name": "Bulk Patient", "password": "Sturdy-pass-91"},
+            {
+                "email": "bulk-rad@example.com",
+                "full_name": "Bulk Rad",
+                "role": User.RADIOLOGIST,
+                "license_id": "BULK-1",
+            },
+            {"email": "bulk-patient@example.com", "full_name": "Duplicate"},
+            {"email": "bulk-rad2@example.com", "full_name": "No License", "role": User.RADIOLOGIST},
+            {"email": "bulk-admin@example.com", "full_name": "Taken"},
+        ]
+        response = client.post("/api/auth/users/bulk/", {"users": users, "activate": True}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 3))
+        self.assertEqual(
+            [(e["row"], list(e["errors"])) for e in body["errors"]],
+            [(3, ["email"]), (4, ["license_id"]), (5, ["email"])],
+        )
+
+        patient = User.objects.get(email="bulk-patient@example.com")
+        self.assertTrue(patient.is_active and patient.check_password("Sturdy-pass-91"))
+        self.assertEqual(Patient.objects.filter(user=patient).count(), 1)
+        self.assertEqual(Radiologist.objects.get(license_id="BULK-1").user.email, "bulk-rad@example.com")
+        self.assertFalse(User.objects.get(email="bulk-rad@example.com").has_usable_password())
+
+
+class RejectingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPDataError(451, "Try again later")
+
+
+@override_settings(
+    EMAIL_BACKEND="apps.users.outbox.OutboxEmailBackend",
+    EMAIL_DELIVERY_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+)
+# Closing connections between polls would close the test transaction's connection on PostgreSQL
+@mock.patch("apps.users.management.commands.send_emails.close_old_connections", new=lambda: None)
+class EmailOutboxTests(TestCase):
+    def register(self):
+        response = APIClient().post(
+            "/api/auth/users/",
+            {
+                "email": "outbox@example.com",
+                "full_name": "Outbox User",
+                "password": "Sturdy-pass-91",
+                "re_password": "Sturdy-pass-91",
+                "role": User.PATIENT,
+                "gender": "FEMALE",
+            },
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_registration_email_is_queued_then_sent_by_the_worker(self):
+        self.register()
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.to, queued.status), (["outbox@example.com"], OutboxEmail.PENDING))
+
+        call_command("send_emails", once=True, stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["outbox@example.com"])
+        self.assertEqual([list(alternative) for alternative in mail.outbox[0].alternatives], queued.alternatives)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+    @override_settings(EMAIL_DELIVERY_BACKEND="apps.users.tests.RejectingEmailBackend")
+    def test_failed_email_is_retried_later(self):
+        self.register()
+        call_command("send_emails", once=True, stdout=io.StringIO())
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.run_after, email.started_at)
+        self.assertIn("Try again later", email.last_error)
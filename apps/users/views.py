@@ -1,9 +1,61 @@
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render
 from djoser.views import UserViewSet
-from rest_framework.permissions import AllowAny
+from rest_framework import status
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from . import provisioning
+from .serializers import BulkUserUploadSerializer
 
 class CustomUserViewSet(UserViewSet):
+    # Account endpoints read and write the user row itself, so never a ClaimsUser
+    authentication_classes = [JWTAuthentication]
+
     def get_permissions(self):
         if self.action == "create":
             return [AllowAny()]
         return super().get_permissions()
+
+
+class BulkUserProvisionView(APIView):
+    """
+    Create many users at once (admins): a JSON `users` list or a .csv/.json `file`.
+    Valid rows are created even if others fail; every failed row is listed with
+    its errors. Batches over USERS_BULK_MAX_ROWS go through `manage.py provision_users`.
+    """
+    permission_classes = [IsAdminUser]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Chunks commit on their own, not in one request-long transaction
+        return transaction.non_atomic_requests(super().as_view(**initkwargs))
+
+    def post(self, request):
+        serializer = BulkUserUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if "file" in data:
+            try:
+                rows = provisioning.read_rows(data["file"], data["file"].name)
+            except ValueError as e:
+                return Response({"file": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            rows = data["users"]
+        if len(rows) > settings.USERS_BULK_MAX_ROWS:
+            return Response(
+                {"error": f"At most {settings.USERS_BULK_MAX_ROWS} rows per request"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = provisioning.provision(
+            rows, activate=data["activate"], workers=settings.USERS_BULK_HASH_WORKERS, dry_run=data["dry_run"]
+        )
+        return Response({
+            "rows": len(rows),
+            "created": len(result["created"]),
+            "failed": len(result["errors"]),
+            "users": result["created"],
+            "errors": result["errors"],
+        }, status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK)
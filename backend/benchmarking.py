@@ -0,0 +1,44 @@
+"""
+Small helpers shared by the `bench_*` management commands.
+"""
+import math
+import statistics
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed, count=None):
+    """
+    Latency percentiles (ms) and throughput for a run.
+    `latencies` are per-operation durations in seconds, `elapsed` the wall time.
+    `count` overrides the number of units for throughput (e.g. images instead of requests).
+    """
+    count = len(latencies) if count is None else count
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        'count': count,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(count / elapsed, 2) if elapsed else None,
+        'mean_ms': round(statistics.fmean(ms), 2) if ms else None,
+        'p50_ms': _round(percentile(ms, 50)),
+        'p95_ms': _round(percentile(ms, 95)),
+        'p99_ms': _round(percentile(ms, 99)),
+    }
+
+
+def format_summary(name, summary):
+    return (
+        f"{name:<28} n={summary['count']:<6} {summary['throughput_per_s']}/s  "
+        f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms"
+    )
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
@@ -0,0 +1,150 @@
+"""
+Prometheus metrics: request latency and database work per view, and the AI
+service calls split into connect, upload and response time. Served on /metrics
+(see backend.views.MetricsView).
+
+Under gunicorn, point PROMETHEUS_MULTIPROC_DIR at an empty directory before it
+starts: every worker process then writes its samples there and a scrape adds
+them up, whichever worker answers (gunicorn.conf.py clears the directory on
+start and drops exited workers). Without it a scrape only sees the process that
+serves it, which is fine for runserver and single-process servers.
+"""
+import contextvars
+import os
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 250)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', "Time to answer a request, by view",
+    ['method', 'view', 'status'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', "Database queries run by a request",
+    ['method', 'view'], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_duration_seconds', "Time a request spent in database queries",
+    ['method', 'view'], buckets=LATENCY_BUCKETS,
+)
+AI_CALL_SECONDS = Histogram(
+    'ai_service_call_duration_seconds',
+    "AI service HTTP calls by phase: connect (new connections only), upload, response (until the headers) and total",
+    ['model_name', 'endpoint', 'phase'], buckets=LATENCY_BUCKETS,
+)
+AI_CALLS = Counter('ai_service_calls', "AI service responses by status code", ['model_name', 'endpoint', 'status'])
+AI_ERRORS = Counter(
+    'ai_service_errors', "Failed AI service calls: http (non-200), connection, timeout, circuit_open, unexpected",
+    ['model_name', 'endpoint', 'kind'],
+)
+AI_TIMEOUTS = Counter(
+    'ai_service_timeouts', "AI service timeouts by stage (connect, upload, response, pool)",
+    ['model_name', 'endpoint', 'stage'],
+)
+
+# [queries, seconds] of the request being handled; copied into sync_to_async threads
+_request_db = contextvars.ContextVar('request_db', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _request_db.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def _instrument(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(_instrument)
+
+
+class MetricsMiddleware:
+    """Latency, query count and query time of every request, labelled by URL name"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection)
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._observe(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def _observe(self, request, response, elapsed, stats):
+        # URL names, not paths, so ids don't multiply the series
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, view, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(request.method, view).observe(stats[0])
+        REQUEST_DB_SECONDS.labels(request.method, view).observe(stats[1])
+
+
+def observe_ai_call(model_name, endpoint, status_code, phases, total):
+    """A response from the AI service; `phases` maps connect/upload/response to seconds"""
+    for phase, seconds in phases.items():
+        if phase != 'connect' or seconds:
+            AI_CALL_SECONDS.labels(model_name, endpoint, phase).observe(seconds)
+    AI_CALL_SECONDS.labels(model_name, endpoint, 'total').observe(total)
+    AI_CALLS.labels(model_name, endpoint, status_code).inc()
+    if status_code != 200:
+        AI_ERRORS.labels(model_name, endpoint, 'http').inc()
+
+
+def count_ai_error(model_name, endpoint, kind, stage=None):
+    """A call that got no response (or wasn't made); timeouts also count by `stage`"""
+    AI_ERRORS.labels(model_name, endpoint, kind).inc()
+    if kind == 'timeout':
+        AI_TIMEOUTS.labels(model_name, endpoint, stage or 'unknown').inc()
+
+
+def render():
+    """Exposition text of all metrics, added up over processes in multiprocess mode"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
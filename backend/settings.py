@@ -48,6 +48,8 @@ AUTH_USER_MODEL = "users.User"
 
 # Middleware Settings
 MIDDLEWARE = [
+    # First, so the timings cover the other middleware too
+    "backend.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     # 'whitenoise.middleware.WhiteNoiseMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -61,6 +63,26 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "backend.urls"
 
+# Prometheus metrics on /metrics (see backend/metrics.py). The scraper sends
+# "Authorization: Bearer <METRICS_TOKEN>"; admins can read them with their JWT.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# The apps log through `logging.getLogger(__name__)`; LOG_LEVEL=DEBUG shows per-scan AI calls
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {"format": "{asctime} {levelname} {name}: {message}", "style": "{"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "default"},
+    },
+    "loggers": {
+        "apps": {"handlers": ["console"], "level": os.getenv("LOG_LEVEL", "INFO")},
+    },
+}
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -94,6 +116,26 @@ DATABASES["default"]["OPTIONS"] = {
     'prepared_threshold': None,
 }
 
+# Cache Settings
+# Per-process LRU (locmem) by default; point CACHE_URL at Redis to share it between workers.
+if os.getenv("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("CACHE_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "radisist",
+            "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "10000"))},
+        }
+    }
+
+# Radiology viewsets opt out of this (see AtomicWritesMixin) and only wrap
+# write methods, so reads and AI calls never hold a pooled connection in a transaction.
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
 
 # CRITICAL: For Supabase Transaction Mode compatibility
@@ -133,14 +175,55 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 # AI Service Configuration
 AI_SERVICE_URL = os.getenv('AI_SERVICE_URL', 'https://huggingface.co/spaces/example/radiology-ai')  # Update with actual URL
 
+# AI Service HTTP client: timeouts (seconds), retries and circuit breaker
+AI_SERVICE_CONNECT_TIMEOUT = float(os.getenv('AI_SERVICE_CONNECT_TIMEOUT', '3.05'))
+AI_SERVICE_READ_TIMEOUT = float(os.getenv('AI_SERVICE_READ_TIMEOUT', '30'))
+AI_SERVICE_MAX_RETRIES = int(os.getenv('AI_SERVICE_MAX_RETRIES', '2'))
+AI_SERVICE_RETRY_BACKOFF = float(os.getenv('AI_SERVICE_RETRY_BACKOFF', '0.5'))
+AI_SERVICE_POOL_SIZE = int(os.getenv('AI_SERVICE_POOL_SIZE', '10'))
+# Connections of the httpx.AsyncClient behind the async (ASGI) upload/rerun views
+AI_ASYNC_MAX_CONNECTIONS = int(os.getenv('AI_ASYNC_MAX_CONNECTIONS', '200'))
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '5'))
+AI_CIRCUIT_RESET_TIMEOUT = float(os.getenv('AI_CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Batched inference: files and bytes per /predict_batch request. A non-zero
+# micro-batch window coalesces concurrent single predictions into one batch.
+AI_BATCH_MAX_SIZE = int(os.getenv('AI_BATCH_MAX_SIZE', '16'))
+AI_BATCH_MAX_BYTES = int(os.getenv('AI_BATCH_MAX_BYTES', str(32 * 1024 * 1024)))
+AI_MICROBATCH_WINDOW_MS = int(os.getenv('AI_MICROBATCH_WINDOW_MS', '0'))
+
+# Downsample and re-encode images to the model input size before upload.
+# The decoded image is cached at AI_PREPROCESS_BASE_SIZE (short side) for model switches.
+AI_PREPROCESS_ENABLED = os.getenv('AI_PREPROCESS_ENABLED', 'False') == 'True'
+AI_PREPROCESS_BASE_SIZE = int(os.getenv('AI_PREPROCESS_BASE_SIZE', '1024'))
+
+# AI prediction cache (keyed by image SHA-256 + model_name)
+AI_PREDICTION_CACHE_ENABLED = os.getenv('AI_PREDICTION_CACHE_ENABLED', 'True') == 'True'
+AI_PREDICTION_CACHE_TTL = int(os.getenv('AI_PREDICTION_CACHE_TTL', str(30 * 24 * 3600)))
+AI_PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv('AI_PREDICTION_CACHE_MAX_ENTRIES', '100000'))
+
+# Run queued AI jobs in the web process right after the upload commits,
+# instead of in `manage.py run_ai_worker`. Meant for local development only.
+AI_INFERENCE_INLINE = os.getenv('AI_INFERENCE_INLINE', 'False') == 'True'
+
+# Build scan thumbnails/previews right after upload instead of on first request
+SCAN_DERIVATIVES_AT_INGEST = os.getenv('SCAN_DERIVATIVES_AT_INGEST', 'False') == 'True'
+
 MEDIA_URL = "media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Who sends media files after MediaView's access check: "python" (Django, with Range
+# support), "nginx" (X-Accel-Redirect to MEDIA_ACCEL_PREFIX, an internal location
+# aliased to MEDIA_ROOT) or "sendfile" (X-Sendfile for Apache/lighttpd)
+MEDIA_DELIVERY = os.getenv("MEDIA_DELIVERY", "python")
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-media/")
+
 # DRF Settings
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # SimpleJWT's JWTAuthentication, plus the claims mode below
+        "apps.users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         # Most views will require authentication by default
@@ -152,6 +235,20 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Text search configuration for scan titles/descriptions (PostgreSQL full-text search)
+SCAN_SEARCH_CONFIG = os.getenv('SCAN_SEARCH_CONFIG', 'english')
+
+# Seconds a radiologist's claim on a worklist scan lasts before others can take it
+WORKLIST_CLAIM_TTL = int(os.getenv('WORKLIST_CLAIM_TTL', '900'))
+
+# Serialized scan/report payloads cached per object version and role (see payload_cache.py)
+RADIOLOGY_PAYLOAD_CACHE_ENABLED = os.getenv('RADIOLOGY_PAYLOAD_CACHE_ENABLED', 'True') == 'True'
+RADIOLOGY_PAYLOAD_CACHE_ALIAS = os.getenv('RADIOLOGY_PAYLOAD_CACHE_ALIAS', 'default')
+RADIOLOGY_PAYLOAD_CACHE_TTL = int(os.getenv('RADIOLOGY_PAYLOAD_CACHE_TTL', '3600'))
+
+# Default page size of the cursor-paginated scan/report lists (?page_size= up to 200)
+RADIOLOGY_PAGE_SIZE = int(os.getenv('RADIOLOGY_PAGE_SIZE', '50'))
+
 SIMPLE_JWT = {
     # Set token expiration to 5 minutes (standard industry practice)
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
@@ -159,12 +256,34 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
     "UPDATE_LAST_LOGIN": False,
-    # "TOKEN_OBTAIN_SERIALIZER": "users.serializers.CustomTokenObtainPairSerializer",
+    # Role and profile ids as claims (see apps/users/authentication.py)
+    "TOKEN_OBTAIN_SERIALIZER": "apps.users.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "apps.users.serializers.ClaimsTokenRefreshSerializer",
+    "TOKEN_BLACKLIST_SERIALIZER": "apps.users.serializers.ClaimsTokenBlacklistSerializer",
     "AUTH_HEADER_TYPES": (
         "Bearer",
     ),  # Tokens are sent as "Authorization: Bearer <token>"
 }
 
+# Build request.user from the access token's claims instead of loading the user
+# row on every request. Deactivation and role changes apply within JWT_CLAIMS_CACHE_TTL
+# seconds (at once with a shared CACHE_URL).
+JWT_TRUST_CLAIMS = os.getenv("JWT_TRUST_CLAIMS", "False") == "True"
+JWT_CLAIMS_CACHE_TTL = int(os.getenv("JWT_CLAIMS_CACHE_TTL", "60"))
+
+# Bloom filter in front of the refresh-token blacklist table (see apps/users/blacklist.py).
+# Rebuilt at least every JWT_BLACKLIST_REBUILD_INTERVAL seconds (or by purge_expired_tokens).
+# Only used with a shared cache (CACHE_URL): with per-process caches every check queries the table.
+JWT_BLACKLIST_FILTER_ENABLED = os.getenv("JWT_BLACKLIST_FILTER_ENABLED", "True") == "True"
+JWT_BLACKLIST_FILTER_ERROR_RATE = float(os.getenv("JWT_BLACKLIST_FILTER_ERROR_RATE", "0.001"))
+JWT_BLACKLIST_REBUILD_INTERVAL = int(os.getenv("JWT_BLACKLIST_REBUILD_INTERVAL", "3600"))
+JWT_BLACKLIST_SYNC_INTERVAL = float(os.getenv("JWT_BLACKLIST_SYNC_INTERVAL", "5"))
+
+# Bulk user provisioning (POST /api/auth/users/bulk/, manage.py provision_users):
+# rows per API request and processes hashing passwords (0: one per CPU)
+USERS_BULK_MAX_ROWS = int(os.getenv("USERS_BULK_MAX_ROWS", "5000"))
+USERS_BULK_HASH_WORKERS = int(os.getenv("USERS_BULK_HASH_WORKERS", "0"))
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "USER_CREATE_PASSWORD_RETYPE": True,
@@ -202,9 +321,17 @@ DOMAIN = os.getenv("DOMAIN", "192.168.192.61:3000")
 SITE_NAME = os.getenv("SITE_NAME", "Radisist")
 
 # Email Settings
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# Emails are written to an outbox table in the request's transaction and delivered
+# through EMAIL_DELIVERY_BACKEND by `manage.py send_emails`. With EMAIL_OUTBOX_ENABLED=False
+# requests send them directly. For local runs without a mail server use
+# django.core.mail.backends.filebased.EmailBackend, which writes them to EMAIL_FILE_PATH.
+EMAIL_DELIVERY_BACKEND = os.getenv("EMAIL_DELIVERY_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_OUTBOX_ENABLED = os.getenv("EMAIL_OUTBOX_ENABLED", "True") == "True"
+EMAIL_BACKEND = "apps.users.outbox.OutboxEmailBackend" if EMAIL_OUTBOX_ENABLED else EMAIL_DELIVERY_BACKEND
+EMAIL_FILE_PATH = os.getenv("EMAIL_FILE_PATH", str(BASE_DIR / "sent_emails"))
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
+EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", "10"))
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
\ No newline at end of file
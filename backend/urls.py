@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenBlacklistView
 from rest_framework.routers import DefaultRouter
-from apps.users.views import CustomUserViewSet
+from apps.users.views import CustomUserViewSet, BulkUserProvisionView
+from apps.radiology.views import MediaView
+from .views import MetricsView
 
 router = DefaultRouter()
 router.register("users", CustomUserViewSet)
@@ -13,10 +14,14 @@ router.register("users", CustomUserViewSet)
 urlpatterns = [
     path("admin/", admin.site.urls),
     # path("api/auth/", include("djoser.urls")),
+    # Before the router, which would take "bulk" for a user id
+    path("api/auth/users/bulk/", BulkUserProvisionView.as_view(), name="user-bulk-create"),
     path("api/auth/", include(router.urls)),
     path("api/auth/", include("djoser.urls.jwt")),
     path("api/radiology/", include("apps.radiology.urls")),
     path("api/auth/logout/", TokenBlacklistView.as_view(), name="token_blacklist"),
+    # Prometheus scrapes /metrics without a trailing slash
+    path("metrics", MetricsView.as_view(), name="metrics"),
+    # Uploaded scans are served with the same access rules as the scan API (see MediaView)
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", MediaView.as_view(), name="media"),
 ]
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
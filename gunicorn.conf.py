@@ -0,0 +1,23 @@
+"""
+gunicorn reads this file from the working directory. With PROMETHEUS_MULTIPROC_DIR
+set, the worker processes share their metrics through files in that directory
+(see backend/metrics.py).
+"""
+import glob
+import os
+
+
+def on_starting(server):
+    # Files left by a previous run would be added to this one's numbers
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in glob.glob(os.path.join(path, "*.db")):
+            os.remove(name)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)